@@ -0,0 +1,81 @@
+"""Benchmark terrarium tile decoding: rasterio.open + pymartini vs read_png
+(fetched bytes decoded through a rasterio MemoryFile) + NumPy.
+
+Usage:
+    python benchmarks/decode.py [asset ...]
+
+e.g. `python benchmarks/decode.py s3://elevation-tiles-prod/terrarium/12/655/1582.png`.
+Without arguments, a synthetic 256x256 terrarium PNG is written to a temporary
+directory and used as input.
+"""
+
+import os
+import sys
+import timeit
+from tempfile import TemporaryDirectory
+
+import numpy as np
+import rasterio
+from pymartini import decode_ele
+
+from dem_tiler.encoding import decode_terrarium
+from dem_tiler.reader import read_png
+
+
+def rasterio_path(asset):
+    return decode_ele(rasterio.open(asset).read(), 'terrarium', backfill=False)
+
+
+def native_path(asset):
+    return decode_terrarium(read_png(asset))
+
+
+def write_synthetic_tile(path, tile_size=256):
+    """Write terrarium PNG of a noisy surface between 0 and 4000m"""
+    rng = np.random.default_rng(0)
+    elevation = np.cumsum(
+        rng.normal(size=(tile_size, tile_size)), axis=0) * 50 + 2000
+    value = np.clip(elevation, 0, 4000) + 32768
+
+    rgb = np.empty((3, tile_size, tile_size), dtype=np.uint8)
+    rgb[0] = value // 256
+    rgb[1] = np.floor(value % 256)
+    rgb[2] = np.floor((value * 256) % 256)
+
+    profile = dict(
+        driver='PNG',
+        count=3,
+        width=tile_size,
+        height=tile_size,
+        dtype='uint8')
+    with rasterio.open(path, 'w', **profile) as dst:
+        dst.write(rgb)
+
+
+def bench(assets, number=50):
+    for asset in assets:
+        # Both paths must agree up to the transpose done by decode_ele
+        np.testing.assert_array_equal(
+            rasterio_path(asset), native_path(asset)[0].T)
+
+        print(asset)
+        for name, func in [('rasterio', rasterio_path),
+                           ('native', native_path)]:
+            seconds = min(
+                timeit.repeat(lambda: func(asset), number=number, repeat=3))
+            print(f'  {name:>8}: {seconds / number * 1000:.2f} ms/tile')
+
+
+def main():
+    if len(sys.argv) > 1:
+        bench(sys.argv[1:], number=10)
+        return
+
+    with TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, 'tile.png')
+        write_synthetic_tile(path)
+        bench([path])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Benchmark Martini mesh generation with and without a cached Martini instance.
+
+Usage:
+    python benchmarks/martini.py
+"""
+
+import timeit
+
+import numpy as np
+from pymartini import Martini
+
+from dem_tiler.mesh import get_martini
+
+
+def synthetic_terrain(grid_size):
+    """Smooth random surface between roughly 0 and 4000m"""
+    rng = np.random.default_rng(0)
+    terrain = np.cumsum(np.cumsum(rng.normal(size=(grid_size, grid_size)), 0), 1)
+    return (terrain - terrain.min()).astype(np.float32)
+
+
+def uncached(terrain, max_error):
+    tile = Martini(len(terrain)).create_tile(terrain)
+    return tile.get_mesh(max_error)
+
+
+def cached(terrain, max_error):
+    tile = get_martini(len(terrain)).create_tile(terrain)
+    return tile.get_mesh(max_error)
+
+
+def main(number=20, max_error=10):
+    for scale in [1, 2]:
+        terrain = synthetic_terrain(256 * scale + 1)
+        get_martini(len(terrain))
+
+        print(f'scale {scale} ({len(terrain)}x{len(terrain)} grid)')
+        results = {}
+        for name, func in [('uncached', uncached), ('cached', cached)]:
+            seconds = min(
+                timeit.repeat(
+                    lambda: func(terrain, max_error), number=number, repeat=3))
+            results[name] = seconds / number * 1000
+            print(f'  {name:>8}: {results[name]:.2f} ms/tile')
+
+        print(f'   savings: {results["uncached"] - results["cached"]:.2f} ms/tile')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+"""dem_tiler.cache: in-process caches that persist across warm invocations."""
+
+import hashlib
+import os
+import tempfile
+import time
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Callable, Hashable, Optional
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen
+
+import numpy as np
+from boto3.session import Session as boto3_session
+from botocore.exceptions import ClientError
+
+from cogeo_mosaic.backends import MosaicBackend
+from dem_tiler.index import INDEX_SUFFIX, QuadkeyIndex
+
+session = boto3_session()
+s3_client = session.client("s3")
+
+MOSAIC_CACHE_SIZE = int(os.getenv("MOSAIC_CACHE_SIZE", 128 * 1024 * 1024))
+MOSAIC_CACHE_TTL = float(os.getenv("MOSAIC_CACHE_TTL", 300))
+INDEX_CACHE_DIR = os.getenv("INDEX_CACHE_DIR", "/tmp/dem-tiler/index")
+
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", 256 * 1024 * 1024))
+# Set to e.g. /tmp/dem-tiler/tiles to persist decoded tiles on disk
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR")
+TILE_CACHE_DISK_SIZE = int(
+    os.getenv("TILE_CACHE_DISK_SIZE", 256 * 1024 * 1024))
+
+
+class LRUCache:
+    """Thread-safe least-recently-used cache bounded by total size
+
+    Args:
+        - maxsize: maximum total size of cached values, as computed by `getsizeof`
+        - getsizeof: callable returning the size of a value. Defaults to counting
+          each value as 1, i.e. bounding the number of entries.
+    """
+
+    def __init__(self, maxsize: int, getsizeof: Callable[[Any], int] = None):
+        self.maxsize = maxsize
+        self.getsizeof = getsizeof or (lambda value: 1)
+        self.currsize = 0
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key: Hashable):
+        return key in self._data
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key: Hashable, value: Any):
+        size = self.getsizeof(value)
+        with self._lock:
+            if key in self._data:
+                self.currsize -= self._data.pop(key)[1]
+
+            # Values larger than the whole cache are never stored
+            if size > self.maxsize:
+                return
+
+            self._data[key] = (value, size)
+            self.currsize += size
+
+            while self.currsize > self.maxsize:
+                _, (_, evicted_size) = self._data.popitem(last=False)
+                self.currsize -= evicted_size
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._data:
+                return default
+
+            value, size = self._data.pop(key)
+            self.currsize -= size
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.currsize = 0
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": len(self._data),
+            "currsize": self.currsize,
+            "maxsize": self.maxsize}
+
+
+class ArrayCache:
+    """Cache of numpy arrays in memory, with an optional tier on local disk
+
+    Cached arrays are made read-only, since they're shared between requests.
+
+    Args:
+        - maxsize: maximum number of bytes held in memory
+        - cache_dir: directory in which to persist arrays. If None, only the
+          in-memory tier is used.
+        - max_disk_size: maximum number of bytes held in `cache_dir`
+    """
+
+    def __init__(
+            self,
+            maxsize: int,
+            cache_dir: str = None,
+            max_disk_size: int = 256 * 1024 * 1024):
+        self.memory = LRUCache(maxsize, getsizeof=lambda arr: arr.nbytes)
+        self.cache_dir = cache_dir
+        self.max_disk_size = max_disk_size
+        self.disk_hits = 0
+        self.disk_misses = 0
+        self._disk_size = None
+        self._disk_lock = Lock()
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f'{digest}.npy')
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        arr = self.memory.get(key)
+        if arr is not None or not self.cache_dir:
+            return arr
+
+        path = self._path(key)
+        try:
+            arr = np.load(path)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.disk_misses += 1
+            return None
+
+        self.disk_hits += 1
+        arr.flags.writeable = False
+        self.memory.set(key, arr)
+        return arr
+
+    def set(self, key: Hashable, arr: np.ndarray) -> np.ndarray:
+        """Cache array, returning the read-only cached array"""
+        arr.flags.writeable = False
+        self.memory.set(key, arr)
+
+        if self.cache_dir:
+            try:
+                self._write(self._path(key), arr)
+            except OSError:
+                pass
+
+        return arr
+
+    def _write(self, path: str, arr: np.ndarray):
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        # Write to a temporary file first so readers never see a partial array
+        fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            np.save(f, arr)
+
+        os.replace(tmp_path, path)
+
+        with self._disk_lock:
+            if self._disk_size is None:
+                self._disk_size = sum(
+                    entry.stat().st_size for entry in os.scandir(self.cache_dir))
+            else:
+                self._disk_size += os.path.getsize(path)
+
+            if self._disk_size > self.max_disk_size:
+                self._prune_disk()
+
+    def _prune_disk(self):
+        """Delete least recently used files until 80% of max_disk_size"""
+        entries = sorted(
+            os.scandir(self.cache_dir), key=lambda entry: entry.stat().st_mtime)
+        target = self.max_disk_size * 0.8
+
+        for entry in entries:
+            if self._disk_size <= target:
+                break
+
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+            except OSError:
+                continue
+
+            self._disk_size -= size
+
+    def clear(self):
+        self.memory.clear()
+
+    def stats(self) -> dict:
+        stats = self.memory.stats()
+        stats.update({
+            "disk_hits": self.disk_hits,
+            "disk_misses": self.disk_misses,
+            "disk_size": self._disk_size})
+        return stats
+
+
+tile_cache = ArrayCache(
+    TILE_CACHE_SIZE,
+    cache_dir=TILE_CACHE_DIR,
+    max_disk_size=TILE_CACHE_DISK_SIZE)
+
+
+def _mosaic_def_size(entry) -> int:
+    """Approximate in-memory size of a parsed MosaicJSON, in bytes
+
+    Counts quadkey and asset string lengths plus a fixed per-object overhead for
+    the dict entries, lists and str headers.
+    """
+    mosaic_def = entry[0]
+    size = 4096
+    for quadkey, assets in mosaic_def.tiles.items():
+        size += len(quadkey) + 120 + 8 * len(assets)
+        size += sum(len(asset) + 50 for asset in assets)
+
+    return size
+
+
+_mosaic_cache = LRUCache(MOSAIC_CACHE_SIZE, getsizeof=_mosaic_def_size)
+_index_cache = LRUCache(
+    MOSAIC_CACHE_SIZE,
+    getsizeof=lambda entry: entry[0].nbytes if entry[0] is not None else 1)
+# Metadata is small, bound the number of mosaics instead
+_metadata_cache = LRUCache(1024)
+
+
+def _get_validator(url: str) -> Optional[str]:
+    """Retrieve a cheap validator (ETag or Last-Modified) for a mosaic url
+
+    Returns None when the backend doesn't support revalidation, or when the
+    validator can't be retrieved.
+    """
+    parsed = urlparse(url)
+
+    if parsed.scheme == "s3":
+        try:
+            resp = s3_client.head_object(
+                Bucket=parsed.netloc, Key=parsed.path.strip("/"))
+        except ClientError:
+            return None
+
+        return resp.get("ETag") or str(resp.get("LastModified"))
+
+    if parsed.scheme in ["http", "https"]:
+        try:
+            with urlopen(Request(url, method="HEAD"), timeout=5) as resp:
+                return resp.headers.get("ETag") or resp.headers.get(
+                    "Last-Modified")
+        except OSError:
+            return None
+
+    if not parsed.scheme or parsed.scheme == "file":
+        try:
+            stat = os.stat(parsed.path if parsed.scheme else url)
+        except OSError:
+            return None
+
+        return f"{stat.st_mtime_ns}-{stat.st_size}"
+
+    return None
+
+
+def _cached_load(lru: LRUCache, url: str, load: Callable[[str], Any], ttl: float):
+    """Load a value derived from `url` through `lru`, revalidating after `ttl`"""
+    entry = lru.get(url)
+    now = time.monotonic()
+
+    if entry is not None:
+        value, validator, checked_at = entry
+        if now - checked_at < ttl:
+            return value
+
+        if validator is not None and validator == _get_validator(url):
+            entry[2] = now
+            return value
+
+    # Retrieve the validator before reading so that a concurrent update is
+    # picked up on the next revalidation rather than missed
+    validator = _get_validator(url)
+    value = load(url)
+
+    lru.set(url, [value, validator, now])
+    return value
+
+
+def _read_mosaic_def(url: str):
+    with MosaicBackend(url) as mosaic:
+        return mosaic.mosaic_def
+
+
+def get_mosaic_def(url: str, ttl: float = MOSAIC_CACHE_TTL):
+    """Load a MosaicJSON definition, reusing a cached copy when possible
+
+    Cached definitions younger than `ttl` seconds are returned as-is. Older
+    entries are revalidated against the source's ETag/Last-Modified, and only
+    re-downloaded when it changed (or when it can't be checked).
+
+    DynamoDB mosaics are not cached: the DynamoDB backend only reads the
+    quadkeys it needs for each request, and None is returned.
+
+    Args:
+        - url: url to MosaicJSON file
+        - ttl: number of seconds a cached definition is trusted without revalidation
+
+    Returns:
+        MosaicJSON object, or None if the backend doesn't support caching.
+    """
+    if urlparse(url).scheme.startswith("dynamodb"):
+        return None
+
+    return _cached_load(_mosaic_cache, url, _read_mosaic_def, ttl)
+
+
+def _read_mosaic_metadata(url: str) -> dict:
+    mosaic_def = get_mosaic_def(url)
+    if mosaic_def is None:
+        with MosaicBackend(url) as mosaic:
+            mosaic_def = mosaic.mosaic_def
+
+    return mosaic_def.dict(exclude={"tiles"}, exclude_none=True)
+
+
+def get_mosaic_metadata(url: str, ttl: float = MOSAIC_CACHE_TTL) -> dict:
+    """Load MosaicJSON metadata, i.e. the definition without its tiles
+
+    Cached separately from the definition, and revalidated the same way, so
+    that it's still served from memory when the definition was evicted or, for
+    DynamoDB mosaics, never cached.
+    """
+    return _cached_load(_metadata_cache, url, _read_mosaic_metadata, ttl)
+
+
+def _read_index_sidecar(url: str) -> Optional[QuadkeyIndex]:
+    """Read a prebuilt binary index stored next to the MosaicJSON, if any"""
+    sidecar = url + INDEX_SUFFIX
+    parsed = urlparse(sidecar)
+
+    try:
+        if parsed.scheme == "s3":
+            path = os.path.join(
+                INDEX_CACHE_DIR,
+                hashlib.sha1(sidecar.encode()).hexdigest() + INDEX_SUFFIX)
+            os.makedirs(INDEX_CACHE_DIR, exist_ok=True)
+            s3_client.download_file(
+                parsed.netloc, parsed.path.strip("/"), path)
+            return QuadkeyIndex.open(path)
+
+        if parsed.scheme in ["http", "https"]:
+            with urlopen(sidecar, timeout=5) as resp:
+                return QuadkeyIndex.from_buffer(resp.read())
+
+        if not parsed.scheme or parsed.scheme == "file":
+            return QuadkeyIndex.open(parsed.path if parsed.scheme else sidecar)
+
+    except (ClientError, OSError, ValueError):
+        return None
+
+    return None
+
+
+def _load_mosaic_index(url: str) -> Optional[QuadkeyIndex]:
+    index = _read_index_sidecar(url)
+    if index is not None:
+        return index
+
+    try:
+        return QuadkeyIndex.from_mosaic_def(get_mosaic_def(url))
+    except ValueError:
+        return None
+
+
+def get_mosaic_index(url: str, ttl: float = MOSAIC_CACHE_TTL):
+    """Load a QuadkeyIndex of a MosaicJSON, reusing a cached copy when possible
+
+    A prebuilt `{url}.qkidx` sidecar (see `QuadkeyIndex.write`) is used when it
+    exists, so that a cold start doesn't need to download and parse the
+    MosaicJSON. Otherwise the index is built from the (cached) mosaic
+    definition. The sidecar is expected to be rewritten whenever the mosaic
+    changes: entries are revalidated against the MosaicJSON itself.
+
+    Args:
+        - url: url to MosaicJSON file
+        - ttl: number of seconds a cached index is trusted without revalidation
+
+    Returns:
+        QuadkeyIndex, or None if the mosaic can't be indexed, e.g. for DynamoDB
+        backends or mosaics with quadkeys at mixed zoom levels.
+    """
+    if urlparse(url).scheme.startswith("dynamodb"):
+        return None
+
+    return _cached_load(_index_cache, url, _load_mosaic_index, ttl)
+
+
+def invalidate_mosaic_def(url: str):
+    """Drop a cached MosaicJSON definition, e.g. after it was overwritten"""
+    _mosaic_cache.pop(url)
+    _index_cache.pop(url)
+    _metadata_cache.pop(url)
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters and sizes of the in-process caches"""
+    return {
+        "mosaic": _mosaic_cache.stats(),
+        "index": _index_cache.stats(),
+        "metadata": _metadata_cache.stats(),
+        "tile": tile_cache.stats()}
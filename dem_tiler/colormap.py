@@ -0,0 +1,126 @@
+"""dem_tiler.colormap: color ramps of elevation through lookup tables."""
+
+from functools import lru_cache
+from typing import Tuple
+
+import numpy as np
+
+# Number of entries of a lookup table, indexed by a uint16
+LUT_SIZE = 65536
+
+# Named color ramps, as (elevation in meters, hex color) stops
+COLORMAPS = {
+    "hypsometric": (
+        (0, "5b8c4a"),
+        (500, "a9c06c"),
+        (1000, "e6d88c"),
+        (2000, "c49a5a"),
+        (3000, "8c6a4a"),
+        (4000, "d9d2cc"),
+        (5000, "ffffff")),
+    "bathymetry": (
+        (-8000, "08153a"),
+        (-4000, "1b3f86"),
+        (-1000, "3a7bc8"),
+        (0, "b6e0f5")),
+    "earth": (
+        (-8000, "08153a"),
+        (-4000, "1b3f86"),
+        (-1000, "3a7bc8"),
+        (-0.01, "b6e0f5"),
+        (0, "5b8c4a"),
+        (500, "a9c06c"),
+        (1000, "e6d88c"),
+        (2000, "c49a5a"),
+        (3000, "8c6a4a"),
+        (4000, "d9d2cc"),
+        (5000, "ffffff")),
+    "grayscale": (
+        (0, "000000"),
+        (4000, "ffffff")),
+}
+
+Stops = Tuple[Tuple[float, Tuple[int, int, int, int]], ...]
+
+
+def parse_color(value: str) -> Tuple[int, int, int, int]:
+    """RGBA of a `rrggbb` or `rrggbbaa` hex color, with an optional `#`"""
+    value = value.strip().lstrip("#")
+    if len(value) == 6:
+        value += "ff"
+
+    if len(value) != 8:
+        raise ValueError(f"Invalid color {value}")
+
+    return tuple(int(value[i:i + 2], 16) for i in range(0, 8, 2))
+
+
+def parse_colormap(value: str, colormap_range: str = None) -> Stops:
+    """Parse the colormap parameter
+
+    Accepts the name of one of `COLORMAPS`, or elevation:color stops, e.g.
+    `0:5b8c4a,1000:e6d88c,4000:ffffff`. If `colormap_range` is set, as
+    `min,max`, stops are rescaled linearly to that range.
+
+    Raises ValueError on invalid input.
+    """
+    if value in COLORMAPS:
+        stops = COLORMAPS[value]
+    else:
+        stops = [stop.split(":") for stop in value.split(",")]
+        if len(stops) < 2 or any(len(stop) != 2 for stop in stops):
+            raise ValueError("colormap must have at least two stops")
+
+    stops = sorted((float(elevation), parse_color(color))
+                   for elevation, color in stops)
+
+    if colormap_range:
+        lo, hi = [float(v) for v in colormap_range.split(",")]
+        start, stop = stops[0][0], stops[-1][0]
+        scale = (hi - lo) / (stop - start) if stop > start else 0
+        stops = [(lo + (elevation - start) * scale, color)
+                 for elevation, color in stops]
+
+    return tuple(stops)
+
+
+@lru_cache(maxsize=32)
+def get_lut(stops: Stops) -> np.ndarray:
+    """Lookup table of a colormap
+
+    Entries are evenly spaced from the first to the last stop, with colors
+    interpolated linearly between stops.
+
+    Returns:
+        uint8 array of shape (4, LUT_SIZE)
+    """
+    elevations = np.array([elevation for elevation, _ in stops])
+    colors = np.array([color for _, color in stops], dtype=np.float64)
+    values = np.linspace(elevations[0], elevations[-1], LUT_SIZE)
+
+    lut = np.empty((4, LUT_SIZE), dtype=np.uint8)
+    for band in range(4):
+        lut[band] = np.round(np.interp(values, elevations, colors[:, band]))
+
+    return lut
+
+
+def apply_colormap(elevation: np.ndarray, stops: Stops) -> np.ndarray:
+    """Map elevation to RGBA through the lookup table of a colormap
+
+    Elevations outside of the colormap take the color of the nearest end.
+
+    Args:
+        - elevation: 2D array
+        - stops: colormap, as returned by `parse_colormap`
+
+    Returns:
+        uint8 array of shape (4, H, W)
+    """
+    lo, hi = stops[0][0], stops[-1][0]
+    scale = (LUT_SIZE - 1) / (hi - lo) if hi > lo else 0
+
+    index = np.clip(
+        (elevation - lo) * scale + 0.5, 0, LUT_SIZE - 1).astype(np.uint16)
+    return np.take(get_lut(stops), index, axis=1)
+
@@ -0,0 +1,69 @@
+"""dem_tiler.encoding: vectorized terrain RGB encoders and decoders."""
+
+import numpy as np
+
+
+def decode_terrarium(rgb, out=None, channels_last=False):
+    """Decode terrarium-encoded RGB to float32 elevation
+
+    Ref: https://github.com/tilezen/joerd/blob/master/docs/formats.md#terrarium
+
+    The computation is done in float32 in place in `out`, without float64
+    temporaries. float32 represents every terrarium value exactly.
+
+    Args:
+        - rgb: uint8 array of shape (3, H, W), or (H, W, 3) if channels_last
+        - out: optional preallocated float32 array of shape (1, H, W)
+        - channels_last: whether rgb is of shape (H, W, 3)
+
+    Returns:
+        float32 array of shape (1, H, W)
+    """
+    if channels_last:
+        red, green, blue = rgb[..., 0], rgb[..., 1], rgb[..., 2]
+    else:
+        red, green, blue = rgb[0], rgb[1], rgb[2]
+
+    if out is None:
+        out = np.empty((1, ) + red.shape, dtype=np.float32)
+
+    elevation = out[0]
+    np.multiply(red, np.float32(256), out=elevation, dtype=np.float32)
+    elevation += green
+    elevation += blue * np.float32(1 / 256)
+    elevation -= np.float32(32768)
+    return out
+
+
+def encode_mapbox(elevation, out=None):
+    """Encode elevation to Mapbox Terrain-RGB
+
+    Ref: https://docs.mapbox.com/help/troubleshooting/access-elevation-data/#mapbox-terrain-rgb
+
+    `height = -10000 + ((R * 256 * 256 + G * 256 + B) * 0.1)`
+
+    Elevation is converted once to a uint32 count of decimeters above -10000m,
+    and each channel is then written into `out` with shifts and masks.
+
+    Args:
+        - elevation: float array of shape (H, W)
+        - out: optional preallocated uint8 array of shape (3, H, W)
+
+    Returns:
+        uint8 array of shape (3, H, W)
+    """
+    if out is None:
+        out = np.empty((3, ) + elevation.shape, dtype=np.uint8)
+
+    value = np.add(elevation, np.float32(10000), dtype=np.float32)
+    value *= np.float32(10)
+    np.rint(value, out=value)
+    np.clip(value, 0, 2**24 - 1, out=value)
+    value = value.astype(np.uint32)
+
+    np.bitwise_and(value, 0xff, out=out[2], casting='unsafe')
+    value >>= 8
+    np.bitwise_and(value, 0xff, out=out[1], casting='unsafe')
+    value >>= 8
+    np.copyto(out[0], value, casting='unsafe')
+    return out
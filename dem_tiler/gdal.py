@@ -1,8 +1,4 @@
-import json
-import os
-from pathlib import Path
-from subprocess import run
-
+import numpy as np
 from osgeo import gdal, gdal_array, ogr, osr
 
 
@@ -48,7 +44,22 @@ def arr_to_gdal_image(
     return image
 
 
-def create_contour(gdal_image, interval=10, offset=0, ele_name='ele'):
+def _linestrings(geom):
+    """Yield coordinate arrays of shape (N, 2) of a (Multi)LineString"""
+    if geom.GetGeometryCount():
+        for i in range(geom.GetGeometryCount()):
+            yield from _linestrings(geom.GetGeometryRef(i))
+        return
+
+    geom.FlattenTo2D()
+    # Little-endian WKB LineString: byte order (1), type (4), count (4), points
+    wkb = geom.ExportToWkb(ogr.wkbNDR)
+    yield np.frombuffer(wkb, dtype='<f8', offset=9).reshape(-1, 2)
+
+
+def create_contour(
+        gdal_image, interval=10, offset=0, ele_name='ele',
+        simplify_tolerance=0):
     """
     Ref:
     https://github.com/OSGeo/gdal/blob/3554675bbce8dc00030bac33c99d92764d0f3844/autotest/alg/contour.py#L88-L97
@@ -58,9 +69,14 @@ def create_contour(gdal_image, interval=10, offset=0, ele_name='ele'):
         - interval: Elevation interval between contours
         - offset: Offset from zero relative to which to interpret intervals.
         - ele_name: Name of property to contain elevation. Defaults to `ele`
+        - simplify_tolerance: Douglas-Peucker tolerance in the units of the
+          image's geotransform. Defaults to 0, i.e. no simplification.
 
     Returns:
-        Iterator of GeoJSON LineString Features representing contour isobands
+        Iterator of (id, elevation, coords) tuples for each contour line, with
+        coords a numpy array of shape (N, 2) in the image's geotransform units.
+        Coordinates are read straight from the OGR geometries, without a
+        GeoJSON round trip.
     """
     ogr_ds = ogr.GetDriverByName('Memory').CreateDataSource('memory_filename')
     ogr_lyr = ogr_ds.CreateLayer('contour')
@@ -72,24 +88,41 @@ def create_contour(gdal_image, interval=10, offset=0, ele_name='ele'):
     gdal.ContourGenerate(
         gdal_image.GetRasterBand(1), interval, offset, [], 0, 0, ogr_lyr, 0, 1)
 
-    for i in range(ogr_lyr.GetFeatureCount()):
-        yield json.loads(ogr_lyr.GetFeature(i).ExportToJson())
+    for feature in ogr_lyr:
+        geom = feature.GetGeometryRef()
+        if simplify_tolerance:
+            # Simplify in C, when GDAL is built with GEOS
+            simplified = geom.Simplify(simplify_tolerance)
+            if simplified is not None and not simplified.IsEmpty():
+                geom = simplified
+
+        for coords in _linestrings(geom):
+            yield feature.GetField('ID'), feature.GetField(ele_name), coords
+
 
+def is_multiple(value, interval, offset=0):
+    """Whether value is offset plus an integer multiple of interval"""
+    steps = (value - offset) / interval
+    return abs(steps - round(steps)) < 1e-6
 
-def run_tippecanoe(features, x, y, z, tippecanoe_path=None, tmpdir='.'):
-    if tippecanoe_path is None:
-        if os.getenv('LAMBDA_TASK_ROOT'):
-            tippecanoe_path = '/opt/tippecanoe'
-        else:
-            tippecanoe_path = 'tippecanoe'
 
-    tmp_path = Path(tmpdir).resolve()
-    fc = {'type': 'FeatureCollection', 'features': features}
+def contour_level(elevation, intervals, offset=0):
+    """Index of the coarsest interval that a contour elevation falls on
 
-    cmd = f'{tippecanoe_path} -l contour --no-tile-compression -R "{z}/{x}/{y}" -f -e {str(tmp_path)}'
-    run(cmd, input=json.dumps(fc).encode('utf-8'), check=True, shell=True)
+    Contours of every interval are a subset of those of the finest one, so a
+    single contour pass at the finest interval serves all levels.
+
+    Args:
+        - elevation: contour elevation
+        - intervals: increasing contour intervals, each a multiple of the first
+        - offset: Offset from zero relative to which to interpret intervals.
+
+    Returns:
+        0 for contours only on the finest interval, 1 for the next one, etc.
+    """
+    level = 0
+    for i, interval in enumerate(intervals):
+        if is_multiple(elevation, interval, offset):
+            level = i
 
-    # Load and return mvt
-    mvt_path = tmp_path / str(z) / str(x) / f'{y}.pbf'
-    with open(mvt_path, 'rb') as f:
-        return f.read()
+    return level
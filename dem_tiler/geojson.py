@@ -0,0 +1,162 @@
+"""dem_tiler.geojson: incremental GeoJSON encoding of mosaic quadkeys."""
+
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import mercantile
+import numpy as np
+
+from dem_tiler.cache import get_mosaic_index
+from dem_tiler.index import key_to_tiles, merge_quadkeys, tile_bounds
+from dem_tiler.reader import open_mosaic
+
+
+def _dumps(obj) -> str:
+    return json.dumps(obj, separators=(",", ":"))
+
+
+def bbox_tiles(bbox: Sequence[float], zoom: int) -> List[mercantile.Tile]:
+    """Tiles at zoom covering a (west, south, east, north) bbox"""
+    return list(mercantile.tiles(*bbox, zooms=zoom))
+
+
+def mosaic_quadkeys(
+        mosaic_url: str, bbox: Sequence[float] = None,
+        zoom: int = None) -> Iterator[Tuple[str, List[str]]]:
+    """Iterate over the (quadkey, assets) pairs of a mosaic
+
+    Args:
+        - mosaic_url: url to MosaicJSON file
+        - bbox: optional (west, south, east, north) filter. Only quadkeys
+          under the tiles covering bbox are returned.
+        - zoom: zoom of the tiles covering bbox, capped at the mosaic's quadkey
+          zoom, which is the default. Lower zooms select whole parent tiles.
+    """
+    index = get_mosaic_index(mosaic_url)
+    if index is not None:
+        if bbox is None:
+            yield from index.items()
+            return
+
+        zoom = index.quadkey_zoom if zoom is None else min(
+            zoom, index.quadkey_zoom)
+        tiles = bbox_tiles(bbox, zoom)
+        if not tiles:
+            return
+
+        # Each covering tile is a contiguous range of quadkey positions
+        x, y, _ = np.array(tiles).T
+        lo, hi = index.search(x, y, zoom)
+        order = np.argsort(lo, kind='stable')
+        yield from index.items(
+            i for start, stop in zip(lo[order].tolist(), hi[order].tolist())
+            for i in range(start, stop))
+        return
+
+    with open_mosaic(mosaic_url) as mosaic:
+        items = mosaic.mosaic_def.tiles.items()
+
+        if bbox is None:
+            yield from items
+            return
+
+        # Quadkeys have a fixed length; match them by prefix
+        quadkey_zoom = (
+            mosaic.mosaic_def.quadkey_zoom or mosaic.mosaic_def.minzoom)
+        zoom = quadkey_zoom if zoom is None else min(zoom, quadkey_zoom)
+        prefixes = tuple(
+            mercantile.quadkey(tile) for tile in bbox_tiles(bbox, zoom))
+        for quadkey, files in items:
+            if quadkey.startswith(prefixes):
+                yield quadkey, files
+
+
+def mosaic_coverage(mosaic_url: str) -> Tuple[np.ndarray, ...]:
+    """Footprint of a mosaic as a minimal set of tiles
+
+    Quadkeys are merged into their parent tile wherever all four children are
+    in the mosaic. The result is kept on the cached quadkey index, so it's
+    only computed once per mosaic. Mosaics that can't be indexed are merged on
+    each call.
+
+    Returns:
+        (x, y, z) int64 arrays of coverage tiles
+    """
+    index = get_mosaic_index(mosaic_url)
+    if index is not None:
+        keys, zooms = index.coverage()
+    else:
+        with open_mosaic(mosaic_url) as mosaic:
+            quadkeys = list(mosaic.mosaic_def.tiles)
+
+        keys, zooms = merge_quadkeys(
+            [int(quadkey, 4) if quadkey else 0 for quadkey in quadkeys],
+            [len(quadkey) for quadkey in quadkeys])
+
+    x = np.empty(len(keys), dtype=np.int64)
+    y = np.empty(len(keys), dtype=np.int64)
+    for z in np.unique(zooms).tolist():
+        mask = zooms == z
+        x[mask], y[mask] = key_to_tiles(keys[mask], z)
+
+    return x, y, zooms.astype(np.int64)
+
+
+def coverage_bounds(mosaic_url: str) -> Optional[List[float]]:
+    """(west, south, east, north) of a mosaic's coverage tiles
+
+    Returns:
+        bounds, or None for an empty mosaic
+    """
+    x, y, z = mosaic_coverage(mosaic_url)
+    if not len(x):
+        return None
+
+    west, south, east, north = tile_bounds(x, y, z)
+    return [
+        float(west.min()),
+        float(south.min()),
+        float(east.max()),
+        float(north.max())]
+
+
+def coverage_features(mosaic_url: str,
+                      bbox: Sequence[float] = None) -> Iterator[Dict]:
+    """GeoJSON Feature of each coverage tile of a mosaic
+
+    Args:
+        - mosaic_url: url to MosaicJSON file
+        - bbox: optional (west, south, east, north) filter
+    """
+    x, y, z = mosaic_coverage(mosaic_url)
+    if bbox is not None and len(x):
+        west, south, east, north = tile_bounds(x, y, z)
+        keep = ((west < bbox[2]) & (east > bbox[0]) & (south < bbox[3]) &
+                (north > bbox[1]))
+        x, y, z = x[keep], y[keep], z[keep]
+
+    for tile in zip(x.tolist(), y.tolist(), z.tolist()):
+        yield mercantile.feature(mercantile.Tile(*tile))
+
+
+def quadkey_features(
+        quadkeys: Iterable[Tuple[str, List[str]]]) -> Iterator[Dict]:
+    """GeoJSON Feature of each (quadkey, assets) pair"""
+    for quadkey, files in quadkeys:
+        yield mercantile.feature(
+            mercantile.quadkey_to_tile(quadkey), props=dict(files=files))
+
+
+def feature_collection(features: Iterable[Dict]) -> Iterator[str]:
+    """Encode features as a GeoJSON FeatureCollection, one chunk at a time"""
+    yield '{"type":"FeatureCollection","features":['
+    for i, feature in enumerate(features):
+        yield ("," if i else "") + _dumps(feature)
+
+    yield ']}'
+
+
+def feature_sequence(features: Iterable[Dict]) -> Iterator[str]:
+    """Encode features as newline-delimited GeoJSON, one chunk at a time"""
+    for feature in features:
+        yield _dumps(feature) + "\n"
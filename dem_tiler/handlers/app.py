@@ -4,18 +4,17 @@ import json
 import os
 import urllib.parse
 from io import BytesIO
-from tempfile import TemporaryDirectory
-from typing import Any, Tuple, Union
+from itertools import islice
+from typing import Any, List, Tuple, Union
 
 import mercantile
-import quantized_mesh_encoder
+import numpy as np
 import rasterio
 from boto3.session import Session as boto3_session
 from lambda_proxy.proxy import API
-from pymartini import Martini, rescale_positions as martini_rescale_positions
+from pymartini import rescale_positions as martini_rescale_positions
 from pydelatin import Delatin
 from pydelatin.util import rescale_positions as delatin_rescale_positions
-from rasterio import transform
 from rasterio.session import AWSSession
 from rio_tiler.profiles import img_profiles
 from rio_tiler.reader import multi_point
@@ -23,8 +22,55 @@ from rio_tiler.utils import geotiff_options, render
 
 from cogeo_mosaic.backends import MosaicBackend
 from cogeo_mosaic.mosaic import MosaicJSON
-from dem_tiler.gdal import arr_to_gdal_image, create_contour, run_tippecanoe
-from dem_tiler.reader import find_assets, load_assets
+from dem_tiler.cache import (
+    cache_stats,
+    get_mosaic_metadata,
+    invalidate_mosaic_def,
+)
+from dem_tiler.colormap import apply_colormap, parse_colormap
+from dem_tiler.gdal import (
+    arr_to_gdal_image,
+    contour_level,
+    create_contour,
+    is_multiple,
+)
+from dem_tiler.geojson import (
+    coverage_bounds,
+    coverage_features,
+    feature_collection,
+    feature_sequence,
+    mosaic_quadkeys,
+    quadkey_features,
+)
+from dem_tiler.mesh import (
+    add_skirts,
+    encode_mesh,
+    force_martini_edges,
+    get_martini,
+    insert_delatin_edges,
+    mesh_extensions,
+    parse_extensions,
+    parse_max_error,
+    resolve_max_error,
+)
+from dem_tiler.mvt import EXTENT as MVT_EXTENT
+from dem_tiler.mvt import encode_layer, encode_tile, quantize_linestring
+from dem_tiler.points import (
+    TooManyPointsError,
+    interpolate_line,
+    sample_points,
+    tile_pyramid_asset,
+)
+from dem_tiler.reader import (
+    ENCODERS,
+    TERRAIN_TILE_SIZES,
+    find_assets,
+    load_assets,
+    open_mosaic,
+    tile_availability,
+)
+from dem_tiler.shading import ground_resolution, hillshade, slope
+from dem_tiler.utils import GEOTIFF_MAXZOOM, TERRARIUM_MAXZOOM
 
 session = boto3_session()
 s3_client = session.client("s3")
@@ -32,6 +78,12 @@ aws_session = AWSSession(session=session)
 
 app = API(name="dem-tiler")
 
+# Max number of points sampled by a single /points or /profile request
+MAX_POINTS = 10000
+
+# Max number of features of a single /geojson response, see its `limit`
+MAX_FEATURES = 10000
+
 params = dict(payload_compression_method="gzip", binary_b64encode=True)
 if os.environ.get("CORS"):
     params["cors"] = True
@@ -43,6 +95,8 @@ def _add(body: str, url: str) -> Tuple:
     with MosaicBackend(url, mosaic_def=mosaic_definition) as mosaic:
         mosaic.write()
 
+    invalidate_mosaic_def(url)
+
     return (
         "OK",
         "application/json",
@@ -57,22 +111,75 @@ def _add(body: str, url: str) -> Tuple:
 
 
 @app.get("/geojson", tag=["metadata"], **params)
-def _geojson(url: str = None) -> Tuple:
-    """Handle /geojson requests."""
+def _geojson(
+        url: str = None,
+        bbox: str = None,
+        zoom: int = None,
+        output_format: str = "geojson",
+        simplify: str = "False",
+        offset: int = 0,
+        limit: int = MAX_FEATURES,
+) -> Tuple:
+    """Handle /geojson requests.
+
+    Features are paged with `offset` and `limit`, so that a response holds at
+    most MAX_FEATURES of them.
+    """
     if not url:
         return ("NOK", "text/plain", "Missing URL parameter")
 
-    with MosaicBackend(url) as mosaic:
-        geojson = {
-            "type":
-                "FeatureCollection",
-            "features": [
-                mercantile.feature(
-                    mercantile.quadkey_to_tile(qk), props=dict(files=files))
-                for qk, files in mosaic.mosaic_def.tiles.items()], }
+    if bbox:
+        try:
+            bbox = [float(v) for v in bbox.split(",")]
+        except ValueError:
+            bbox = []
 
-    return (
-        "OK", "application/json", json.dumps(geojson, separators=(",", ":")))
+        if len(bbox) != 4:
+            return ("NOK", "text/plain", "bbox must be west,south,east,north")
+
+    if zoom is not None:
+        try:
+            zoom = int(zoom)
+        except ValueError:
+            zoom = -1
+
+        if zoom < 0:
+            return ("NOK", "text/plain", "zoom must be a non-negative integer")
+
+    try:
+        offset, limit = int(offset), int(limit)
+    except ValueError:
+        offset, limit = -1, -1
+
+    if offset < 0 or not 0 < limit <= MAX_FEATURES:
+        return (
+            "NOK", "text/plain",
+            f"offset must be >= 0 and limit between 1 and {MAX_FEATURES}")
+
+    # Coerce simplify to bool
+    if not isinstance(simplify, bool):
+        simplify = simplify in ['True', 'true']
+
+    # zoom only selects the tiles covering bbox
+    if zoom is not None and (simplify or not bbox):
+        return (
+            "NOK", "text/plain",
+            "zoom requires bbox, and doesn't apply with simplify")
+
+    if simplify:
+        features = coverage_features(url, bbox=bbox)
+    else:
+        features = quadkey_features(
+            mosaic_quadkeys(url, bbox=bbox, zoom=zoom))
+
+    # Skipped features are generated but not encoded
+    features = islice(features, offset, offset + limit)
+
+    if output_format == "ndjson":
+        return (
+            "OK", "application/x-ndjson", "".join(feature_sequence(features)))
+
+    return ("OK", "application/json", "".join(feature_collection(features)))
 
 
 params["tag"] = ["tiles"]
@@ -103,20 +210,37 @@ def _tilejson(
     if qs:
         tile_url += f"?{qs}"
 
-    with MosaicBackend(url) as mosaic:
-        meta = mosaic.metadata
-        response = {
-            "bounds": meta["bounds"],
-            "center": meta["center"],
-            "maxzoom": meta["maxzoom"],
-            "minzoom": meta["minzoom"],
-            "name": url,
-            "tilejson": "2.1.0",
-            "tiles": [tile_url], }
+    meta = get_mosaic_metadata(url)
+
+    # Coverage tiles are snapped to quadkeys, so only use them to tighten the
+    # mosaic's own bounds
+    bounds = meta["bounds"]
+    coverage = coverage_bounds(url)
+    if coverage:
+        bounds = [
+            max(bounds[0], coverage[0]),
+            max(bounds[1], coverage[1]),
+            min(bounds[2], coverage[2]),
+            min(bounds[3], coverage[3])]
+
+    response = {
+        "bounds": bounds,
+        "center": meta["center"],
+        "maxzoom": meta["maxzoom"],
+        "minzoom": meta["minzoom"],
+        "name": url,
+        "tilejson": "2.1.0",
+        "tiles": [tile_url], }
     return (
         "OK", "application/json", json.dumps(response, separators=(",", ":")))
 
 
+def _unsupported_tile_size(url: str, tile_size: int) -> bool:
+    """Whether AWS Terrain Tiles can't be read at tile_size"""
+    return (
+        url in TERRAIN_TILE_SIZES and tile_size not in TERRAIN_TILE_SIZES[url])
+
+
 @app.get("/contour/<int:z>/<int:x>/<int:y>", **params)
 def _contour(
         z: int = None,
@@ -129,13 +253,59 @@ def _contour(
         offset: int = 0,
         pixel_selection: str = "first",
         resampling_method: str = "nearest",
+        buffer: int = 0,
+        intervals: str = None,
+        major_every: int = None,
 ) -> Tuple:
     """Handle MVT requests."""
     if not url:
         return ("NOK", "text/plain", "Missing URL parameter")
 
+    # Contour levels, e.g. minor/major. All are derived from one contour pass
+    # at the finest interval.
+    try:
+        if intervals:
+            levels = [float(i) for i in intervals.split(",")]
+        else:
+            levels = [float(interval)]
+    except ValueError:
+        levels = [float("nan")]
+
+    if not np.isfinite(levels).all():
+        return ("NOK", "text/plain", "intervals must be numbers")
+
+    if major_every:
+        try:
+            major_every = int(major_every)
+        except ValueError:
+            major_every = 0
+
+        if major_every <= 0:
+            return (
+                "NOK", "text/plain", "major_every must be a positive integer")
+
+        levels.append(min(levels) * major_every)
+
+    levels = sorted(set(levels))
+    if levels[0] <= 0:
+        return ("NOK", "text/plain", "intervals must be positive")
+
+    if not all(is_multiple(level, levels[0]) for level in levels):
+        return (
+            "NOK", "text/plain",
+            "intervals must be multiples of the smallest interval")
+
+    # Pixels read around the tile, so that contours run continuously across
+    # tile edges instead of stopping half a pixel short of them
+    buffer = int(buffer)
+    if not 0 <= buffer <= 256:
+        return ("NOK", "text/plain", "buffer must be between 0 and 256")
+
     tile_size = int(scale) * 256
-    assets = find_assets(x, y, z, url, tile_size)
+    if _unsupported_tile_size(url, tile_size):
+        return ("NOK", "text/plain", f"{url} tiles can't be {tile_size}px")
+
+    assets = find_assets(x, y, z, url, tile_size, buffer=buffer)
 
     if assets is None:
         return ("NOK", "text/plain", "no assets found")
@@ -148,27 +318,39 @@ def _contour(
         tile_size,
         input_format=url,
         pixel_selection=pixel_selection,
-        resampling_method=resampling_method)
+        resampling_method=resampling_method,
+        buffer=buffer)
 
     if tile is None:
         return ("EMPTY", "text/plain", "empty tiles")
 
     # Convert meters to feet
     if unit == 'feet':
-        tile *= 3.28084
+        tile = tile * 3.28084
 
-    bounds = mercantile.bounds(x, y, z)
-    gdal_transform = transform.from_bounds(*bounds, tile_size,
-                                           tile_size).to_gdal()
+    # Contour in pixel coordinates (origin at the tile's top left, y down),
+    # which map linearly to vector tile coordinates. Lines are then clipped to
+    # the tile plus the vector tile buffer.
+    gdal_image = arr_to_gdal_image(tile.T, (-buffer, 1, 0, -buffer, 0, 1))
+    mvt_scale = MVT_EXTENT / tile_size
 
-    gdal_image = arr_to_gdal_image(tile.T, gdal_transform)
+    offset = float(offset)
+    lines = create_contour(
+        gdal_image, levels[0], offset, simplify_tolerance=1 / mvt_scale)
 
-    features = list(create_contour(gdal_image, interval, offset))
+    def _properties(ele):
+        if len(levels) == 1:
+            return {"ele": ele}
 
-    with TemporaryDirectory() as tmpdir:
-        return (
-            "OK", "application/x-protobuf",
-            run_tippecanoe(features, x, y, z, tmpdir=tmpdir))
+        return {"ele": ele, "level": contour_level(ele, levels, offset)}
+
+    features = (
+        (feature_id, quantize_linestring(coords, mvt_scale), _properties(ele))
+        for feature_id, ele, coords in lines)
+
+    return (
+        "OK", "application/x-protobuf",
+        encode_tile([encode_layer("contour", features)]))
 
 
 # z, x, y = 14, 3090, 6430
@@ -192,12 +374,31 @@ def _img(
         encoding: str = 'terrarium',
         pixel_selection: str = "first",
         resampling_method: str = "nearest",
+        colormap: str = None,
+        colormap_range: str = None,
 ) -> Tuple:
     """Handle tile requests."""
     if not url:
         return ("NOK", "text/plain", "Missing URL parameter")
 
+    if colormap:
+        # Tint elevation instead of encoding it
+        try:
+            colormap = parse_colormap(colormap, colormap_range)
+        except ValueError:
+            return (
+                "NOK", "text/plain",
+                "colormap must be a colormap name or elevation:color stops")
+
+        encoding = None
+
+    elif encoding not in ENCODERS:
+        return ("NOK", "text/plain", f"Invalid encoding {encoding}")
+
     tile_size = int(tile_size)
+    if _unsupported_tile_size(url, tile_size):
+        return ("NOK", "text/plain", f"{url} tiles can't be {tile_size}px")
+
     assets = find_assets(x, y, z, url, tile_size)
 
     if assets is None:
@@ -217,6 +418,11 @@ def _img(
     if rgb is None:
         return ("EMPTY", "text/plain", "empty tiles")
 
+    mask = None
+    if colormap:
+        rgb = apply_colormap(rgb.T, colormap)
+        rgb, mask = rgb[:3], rgb[3]
+
     driver = ext
     options = img_profiles.get(driver, {})
 
@@ -228,10 +434,140 @@ def _img(
     return (
         "OK",
         f"image/{ext}",
-        render(rgb, img_format=driver, **options),
+        render(rgb, mask=mask, img_format=driver, **options),
     )
 
 
+def _render_terrain(
+        kind: str,
+        z: int,
+        x: int,
+        y: int,
+        scale: int,
+        ext: str,
+        url: str,
+        pixel_selection: str,
+        resampling_method: str,
+        **kwargs: Any,
+) -> Tuple:
+    """Render hillshade or slope from elevation with a 1px buffer"""
+    if not url:
+        return ("NOK", "text/plain", "Missing URL parameter")
+
+    tile_size = 256 * int(scale)
+    if _unsupported_tile_size(url, tile_size):
+        return ("NOK", "text/plain", f"{url} tiles can't be {tile_size}px")
+
+    assets = find_assets(x, y, z, url, tile_size, buffer=1)
+
+    if assets is None:
+        return ("NOK", "text/plain", "no assets found")
+
+    tile = load_assets(
+        x,
+        y,
+        z,
+        assets,
+        tile_size,
+        input_format=url,
+        pixel_selection=pixel_selection,
+        resampling_method=resampling_method,
+        buffer=1)
+
+    if tile is None:
+        return ("EMPTY", "text/plain", "empty tiles")
+
+    # Transpose back to rows from north to south
+    resolution = ground_resolution(x, y, z, tile_size)
+    if kind == "hillshade":
+        data = hillshade(tile.T, resolution, **kwargs)
+    else:
+        data = slope(tile.T, resolution, **kwargs)
+
+    driver = ext
+    options = img_profiles.get(driver, {})
+
+    if ext == "tif":
+        ext = "tiff"
+        driver = "GTiff"
+        options = geotiff_options(x, y, z, tile_size)
+    elif kind == "slope":
+        # Whole degrees for 8-bit formats
+        data = np.round(data).astype(np.uint8)
+
+    return (
+        "OK",
+        f"image/{ext}",
+        render(data[None], img_format=driver, **options),
+    )
+
+
+@app.get("/hillshade/<int:z>/<int:x>/<int:y>.<ext>", **params)
+@app.get("/hillshade/<int:z>/<int:x>/<int:y>@<int:scale>x.<ext>", **params)
+@app.get("/hillshade/<int:z>/<int:x>/<int:y>", **params)
+def _hillshade(
+        z: int = None,
+        x: int = None,
+        y: int = None,
+        scale: int = 1,
+        ext: str = 'png',
+        url: str = None,
+        azimuth: float = 315,
+        altitude: float = 45,
+        z_factor: float = 1,
+        multidirectional: str = "False",
+        pixel_selection: str = "first",
+        resampling_method: str = "nearest",
+) -> Tuple:
+    """Handle hillshade requests."""
+    # Coerce multidirectional to bool
+    if not isinstance(multidirectional, bool):
+        multidirectional = multidirectional in ['True', 'true']
+
+    return _render_terrain(
+        "hillshade",
+        z,
+        x,
+        y,
+        scale,
+        ext,
+        url,
+        pixel_selection,
+        resampling_method,
+        azimuth=float(azimuth),
+        altitude=float(altitude),
+        z_factor=float(z_factor),
+        multidirectional=multidirectional)
+
+
+@app.get("/slope/<int:z>/<int:x>/<int:y>.<ext>", **params)
+@app.get("/slope/<int:z>/<int:x>/<int:y>@<int:scale>x.<ext>", **params)
+@app.get("/slope/<int:z>/<int:x>/<int:y>", **params)
+def _slope(
+        z: int = None,
+        x: int = None,
+        y: int = None,
+        scale: int = 1,
+        ext: str = 'png',
+        url: str = None,
+        z_factor: float = 1,
+        pixel_selection: str = "first",
+        resampling_method: str = "nearest",
+) -> Tuple:
+    """Handle slope requests."""
+    return _render_terrain(
+        "slope",
+        z,
+        x,
+        y,
+        scale,
+        ext,
+        url,
+        pixel_selection,
+        resampling_method,
+        z_factor=float(z_factor))
+
+
 @app.get(
     "/mesh/<int:z>/<int:x>/<int:y>.terrain",
     cache_control=os.getenv("CACHE_CONTROL", None),
@@ -246,24 +582,59 @@ def _mesh(
         y: int = None,
         scale: int = 1,
         url: str = None,
-        mesh_max_error: float = 10,
+        mesh_max_error: str = "10",
         pixel_selection: str = "first",
         resampling_method: str = "nearest",
         mesh_algorithm: str = "pydelatin",
         flip_y: str = "True",
+        extensions: str = None,
+        sea_level: float = 0,
+        scheme: str = "xyz",
+        stitch_edges: str = "False",
+        skirts: str = "False",
+        skirt_height: float = None,
 ) -> Tuple:
     """Handle tile requests."""
     if not url:
         return ("NOK", "text/plain", "Missing URL parameter")
 
-    # Coerce flip_y to bool
+    # Cesium requests tiles with a TMS y index
+    if scheme == "tms":
+        y = 2**z - 1 - y
+
+    # Meters, `auto` to scale with the ground pixel size, or a zoom table
+    try:
+        mesh_max_error = parse_max_error(mesh_max_error)
+    except ValueError:
+        return (
+            "NOK", "text/plain",
+            "mesh_max_error must be a number, auto, or zoom:error pairs")
+
+    # An explicit extensions parameter takes precedence over the negotiated
+    # extensions of the Accept header
+    if extensions is None:
+        extensions = app.event.get("headers", {}).get("accept", "")
+    extensions = parse_extensions(extensions)
+
+    # Coerce flip_y, stitch_edges and skirts to bool
     if not isinstance(flip_y, bool):
         flip_y = flip_y in ['True', 'true']
+    if not isinstance(stitch_edges, bool):
+        stitch_edges = stitch_edges in ['True', 'true']
+    if not isinstance(skirts, bool):
+        skirts = skirts in ['True', 'true']
 
     use_delatin = 'delatin' in mesh_algorithm.lower()
 
+    # Stitched edges need the first row and column of the east and south
+    # neighbors, so that adjacent tiles have the same edge heights
+    buffer = 1 if stitch_edges else 0
+
     tile_size = 256 * int(scale)
-    assets = find_assets(x, y, z, url, tile_size)
+    if _unsupported_tile_size(url, tile_size):
+        return ("NOK", "text/plain", f"{url} tiles can't be {tile_size}px")
+
+    assets = find_assets(x, y, z, url, tile_size, buffer=buffer)
 
     if assets is None:
         return ("NOK", "text/plain", "no assets found")
@@ -275,36 +646,101 @@ def _mesh(
         assets,
         tile_size,
         # Only need to backfill for martini, not delatin
-        backfill=not use_delatin,
+        backfill=not use_delatin and not stitch_edges,
         input_format=url,
         pixel_selection=pixel_selection,
-        resampling_method=resampling_method)
+        resampling_method=resampling_method,
+        buffer=buffer)
+
+    if tile is None:
+        return ("EMPTY", "text/plain", "empty tiles")
 
     # Need to transpose; must be before passing to Martini
     tile = tile.T
 
-    if tile is None:
-        return ("EMPTY", "text/plain", "empty tiles")
+    if stitch_edges:
+        # Drop the west and north buffer, keeping a grid of tile_size + 1
+        tile = tile[1:, 1:]
 
     bounds = mercantile.bounds(mercantile.Tile(x, y, z))
-    mesh_max_error = float(mesh_max_error)
+    mesh_max_error = resolve_max_error(mesh_max_error, x, y, z, tile_size)
 
     if use_delatin:
         tin = Delatin(tile, max_error=mesh_max_error)
         vertices, triangles = tin.vertices, tin.triangles.flatten()
+        if stitch_edges:
+            vertices, triangles = insert_delatin_edges(vertices, triangles, tile)
+
         rescaled = delatin_rescale_positions(vertices, bounds, flip_y=flip_y)
 
     else:
-        martini = Martini(tile_size + 1)
+        martini = get_martini(tile_size + 1)
         mar_tile = martini.create_tile(tile)
+        if stitch_edges:
+            force_martini_edges(mar_tile)
 
         vertices, triangles = mar_tile.get_mesh(mesh_max_error)
         rescaled = martini_rescale_positions(vertices, tile, bounds=bounds, flip_y=flip_y)
 
+    positions, indices, skirt_ix = rescaled, triangles, None
+    if skirts:
+        if skirt_height is None:
+            skirt_height = 5 * mesh_max_error
+        positions, indices, skirt_ix = add_skirts(
+            rescaled, triangles, float(skirt_height))
+
+    content_type = "application/vnd.quantized-mesh"
+    if extensions:
+        content_type += ";extensions=" + "-".join(sorted(extensions))
+        extensions = mesh_extensions(
+            extensions, rescaled, triangles, tile,
+            sea_level=float(sea_level), skirt_ix=skirt_ix)
+
     with BytesIO() as f:
-        quantized_mesh_encoder.encode(f, rescaled, triangles)
+        encode_mesh(
+            f, positions, indices, n_surface=len(rescaled),
+            extensions=extensions)
+
         f.seek(0)
-        return ("OK", "application/vnd.quantized-mesh", f.read())
+        return ("OK", content_type, f.read())
+
+
+@app.get(
+    "/layer.json", cache_control=os.getenv("CACHE_CONTROL", None), **params)
+def _layer(url: str = None, **kwargs: Any) -> Tuple:
+    """Handle Cesium layer.json requests."""
+    if not url:
+        return ("NOK", "text/plain", "Missing URL parameter")
+
+    kwargs.update(dict(url=url, scheme="tms"))
+    qs = urllib.parse.urlencode(list(kwargs.items()))
+    tile_url = f"{app.host}/mesh/{{z}}/{{x}}/{{y}}.terrain?{qs}"
+
+    bounds, maxzoom, available = tile_availability(url)
+
+    # layer.json ranges use TMS y indices
+    tms_available = [[{
+        "startX": r["startX"],
+        "startY": 2**z - 1 - r["endY"],
+        "endX": r["endX"],
+        "endY": 2**z - 1 - r["startY"]} for r in ranges]
+                     for z, ranges in enumerate(available)]
+
+    response = {
+        "tilejson": "2.1.0",
+        "name": url,
+        "version": "1.0.0",
+        "format": "quantized-mesh-1.0",
+        "scheme": "tms",
+        "projection": "EPSG:3857",
+        "tiles": [tile_url],
+        "bounds": bounds,
+        "minzoom": 0,
+        "maxzoom": maxzoom,
+        "extensions": ["octvertexnormals", "watermask"],
+        "available": tms_available, }
+    return (
+        "OK", "application/json", json.dumps(response, separators=(",", ":")))
 
 
 @app.get("/point", **params)
@@ -320,7 +756,19 @@ def _point(lng: float = None, lat: float = None,
     lng = float(lng)
     lat = float(lat)
 
-    with MosaicBackend(url) as mosaic:
+    if url in ["terrarium", "geotiff"]:
+        zoom = TERRARIUM_MAXZOOM if url == "terrarium" else GEOTIFF_MAXZOOM
+        tile = mercantile.tile(lng, lat, zoom)
+        value = sample_points(url, [lng], [lat])
+        meta = {
+            "coordinates": [lng, lat],
+            "values": [{
+                "asset": tile_pyramid_asset(url, tile.x, tile.y),
+                "values": _values(value)}], }
+        return (
+            "OK", "application/json", json.dumps(meta, separators=(",", ":")))
+
+    with open_mosaic(url) as mosaic:
         assets = mosaic.point(lng, lat)
         if not assets:
             return (
@@ -340,6 +788,110 @@ def _point(lng: float = None, lat: float = None,
             "OK", "application/json", json.dumps(meta, separators=(",", ":")))
 
 
+def _coordinates(body: str, geometry_type: str) -> List[List[float]]:
+    """Coordinates of a GeoJSON geometry or feature, or of a bare list
+
+    Raises ValueError on invalid input.
+    """
+    data = json.loads(body)
+    if isinstance(data, dict) and data.get("type") == "Feature":
+        data = data["geometry"]
+
+    if isinstance(data, dict):
+        if data.get("type") not in (geometry_type, None):
+            raise ValueError(f"Expected a {geometry_type}")
+        data = data["coordinates"]
+
+    if not isinstance(data, list) or not all(len(c) >= 2 for c in data):
+        raise ValueError("Expected a list of [lng, lat] coordinates")
+
+    return data
+
+
+def _values(arr) -> List[float]:
+    """JSON-serializable list, with null for NaN"""
+    return [None if value != value else value for value in arr.tolist()]
+
+
+@app.post("/points", **params)
+def _points(body: str, url: str = None) -> Tuple[str, str, str]:
+    """Handle batch point requests.
+
+    The body is a GeoJSON MultiPoint, or a list of [lng, lat] coordinates.
+    """
+    if not url:
+        return ("NOK", "text/plain", "Missing URL parameter")
+
+    try:
+        coordinates = _coordinates(body, "MultiPoint")
+    except (ValueError, KeyError, TypeError):
+        return ("NOK", "text/plain", "Invalid coordinates")
+
+    if not 0 < len(coordinates) <= MAX_POINTS:
+        return (
+            "NOK", "text/plain", f"Between 1 and {MAX_POINTS} points required")
+
+    lng, lat = np.array([c[:2] for c in coordinates], dtype=np.float64).T
+    values = sample_points(url, lng, lat)
+
+    return (
+        "OK", "application/json",
+        json.dumps({"elevation": _values(values)}, separators=(",", ":")))
+
+
+@app.post("/profile", **params)
+def _profile(body: str, url: str = None,
+             interval: float = 30) -> Tuple[str, str, str]:
+    """Handle elevation profile requests.
+
+    The body is a GeoJSON LineString, sampled every `interval` meters.
+    """
+    if not url:
+        return ("NOK", "text/plain", "Missing URL parameter")
+
+    try:
+        coordinates = _coordinates(body, "LineString")
+        coordinates = np.array([c[:2] for c in coordinates], dtype=np.float64)
+    except (ValueError, KeyError, TypeError):
+        return ("NOK", "text/plain", "Invalid LineString")
+
+    if coordinates.ndim != 2 or len(coordinates) < 2:
+        return ("NOK", "text/plain", "A LineString of 2 or more points is required")
+
+    if not np.isfinite(coordinates).all():
+        return ("NOK", "text/plain", "Coordinates must be finite numbers")
+
+    try:
+        interval = float(interval)
+    except ValueError:
+        interval = 0
+
+    if not 0 < interval < float("inf"):
+        return ("NOK", "text/plain", "interval must be a positive number")
+
+    try:
+        lng, lat, distance = interpolate_line(
+            coordinates, interval, max_points=MAX_POINTS)
+    except TooManyPointsError:
+        return ("NOK", "text/plain", f"At most {MAX_POINTS} points allowed")
+
+    profile = {
+        "lng": lng.tolist(),
+        "lat": lat.tolist(),
+        "distance": distance.tolist(),
+        "elevation": _values(sample_points(url, lng, lat))}
+    return (
+        "OK", "application/json", json.dumps(profile, separators=(",", ":")))
+
+
+@app.get("/cache", tag=["other"])
+def _cache() -> Tuple[str, str, str]:
+    """Handle /cache requests."""
+    return (
+        "OK", "application/json",
+        json.dumps(cache_stats(), separators=(",", ":")))
+
+
 @app.get("/favicon.ico", tag=["other"])
 def favicon() -> Tuple[str, str, str]:
     """Favicon."""
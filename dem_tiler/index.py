@@ -0,0 +1,462 @@
+"""dem_tiler.index: compact quadkey index of MosaicJSON assets."""
+
+import mmap
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+MAGIC = b"DEMQKIX1"
+INDEX_SUFFIX = ".qkidx"
+
+# quadkey_zoom, n_keys, n_refs, n_assets, table_nbytes
+HEADER_DTYPE = np.dtype("<u8")
+HEADER_LEN = 5
+
+
+def tile_to_key(x: int, y: int, z: int) -> int:
+    """Integer value of a tile's quadkey, i.e. the quadkey read in base 4"""
+    key = 0
+    for i in range(z - 1, -1, -1):
+        key = (key << 2) | ((x >> i) & 1) | (((y >> i) & 1) << 1)
+
+    return key
+
+
+def key_to_tiles(keys: np.ndarray, z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized inverse of `tile_to_key`
+
+    Returns:
+        int64 arrays of tile x and y
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    x = np.zeros(len(keys), dtype=np.int64)
+    y = np.zeros(len(keys), dtype=np.int64)
+    for i in range(z):
+        digit = (keys >> np.uint64(2 * i)).astype(np.int64)
+        x |= (digit & 1) << i
+        y |= ((digit >> 1) & 1) << i
+
+    return x, y
+
+
+def tile_ranges(x: np.ndarray, y: np.ndarray) -> List[Dict[str, int]]:
+    """Cover a set of tiles with inclusive rectangles
+
+    Runs of consecutive x are found on each row, and identical runs on
+    consecutive rows are merged. Tiles must be unique.
+
+    Returns:
+        List of {"startX", "startY", "endX", "endY"}, as in Cesium's layer.json
+    """
+    if not len(x):
+        return []
+
+    order = np.lexsort((x, y))
+    x, y = x[order], y[order]
+
+    # Start of a horizontal run: new row, or gap in x
+    new_run = np.ones(len(x), dtype=bool)
+    new_run[1:] = (np.diff(y) != 0) | (np.diff(x) != 1)
+    starts = np.flatnonzero(new_run)
+    ends = np.append(starts[1:], len(x)) - 1
+    runs = np.column_stack([x[starts], x[ends], y[starts]])
+
+    # Merge a run into the open rectangle with the same x extent that ended
+    # on the previous row
+    ranges = []
+    open_ranges: Dict[Tuple[int, int], Dict[str, int]] = {}
+    for start_x, end_x, row in runs.tolist():
+        rect = open_ranges.get((start_x, end_x))
+        if rect is not None and rect["endY"] == row - 1:
+            rect["endY"] = row
+            continue
+
+        rect = {"startX": start_x, "startY": row, "endX": end_x, "endY": row}
+        open_ranges[(start_x, end_x)] = rect
+        ranges.append(rect)
+
+    return ranges
+
+
+def merge_quadkeys(keys: np.ndarray,
+                   zooms: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge quadkeys into their parents wherever all four children exist
+
+    Bottom-up quadtree merge: starting from the highest zoom, sibling groups
+    that are complete are replaced by their parent, which can in turn merge
+    with its own siblings at the next level up.
+
+    Args:
+        - keys: quadkey integers
+        - zooms: zoom of each key
+
+    Returns:
+        (keys, zooms) of the merged quadkeys
+    """
+    keys = np.asarray(keys, dtype=np.uint64)
+    zooms = np.asarray(zooms, dtype=np.int64)
+    if not len(keys):
+        return keys, zooms
+
+    # Drop quadkeys already covered by a lower zoom quadkey
+    covered = np.zeros(len(keys), dtype=bool)
+    for z in np.unique(zooms).tolist():
+        ancestors = keys[zooms == z]
+        for child_z in np.unique(zooms[zooms > z]).tolist():
+            mask = zooms == child_z
+            shift = np.uint64(2 * (child_z - z))
+            covered[mask] |= np.isin(keys[mask] >> shift, ancestors)
+
+    keys, zooms = keys[~covered], zooms[~covered]
+
+    out_keys = []
+    out_zooms = []
+    level = np.empty(0, dtype=np.uint64)
+    for z in range(int(zooms.max()), 0, -1):
+        level = np.unique(np.concatenate([level, keys[zooms == z]]))
+        parents = level >> np.uint64(2)
+        unique, counts = np.unique(parents, return_counts=True)
+        full = unique[counts == 4]
+
+        remaining = level[~np.isin(parents, full)]
+        out_keys.append(remaining)
+        out_zooms.append(np.full(len(remaining), z))
+        level = full
+
+    level = np.unique(np.concatenate([level, keys[zooms == 0]]))
+    out_keys.append(level)
+    out_zooms.append(np.zeros(len(level), dtype=np.int64))
+    return np.concatenate(out_keys), np.concatenate(out_zooms)
+
+
+def tile_bounds(x: np.ndarray, y: np.ndarray,
+                z: np.ndarray) -> Tuple[np.ndarray, ...]:
+    """Vectorized `mercantile.bounds`
+
+    Returns:
+        (west, south, east, north) arrays in degrees
+    """
+    n = 2.0**np.asarray(z)
+
+    def lat(row):
+        return np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * row / n))))
+
+    west = x / n * 360 - 180
+    east = (x + 1) / n * 360 - 180
+    return west, lat(y + 1), east, lat(y)
+
+
+def _pad8(n: int) -> int:
+    return (n + 7) & ~7
+
+
+class QuadkeyIndex:
+    """Sorted-array index from quadkeys to MosaicJSON assets
+
+    Quadkeys are stored as a sorted array of base-4 integers. The assets of the
+    i-th quadkey are `asset_ids[offsets[i]:offsets[i + 1]]`, which point into a
+    table of unique (interned) asset strings. Since all descendants of a tile
+    form a contiguous range of quadkey integers, any tile lookup is two binary
+    searches.
+
+    The index can be serialized to a flat binary sidecar file, which is read
+    with `mmap` without parsing the MosaicJSON.
+
+    Optional per-asset bounds are used to drop assets that don't intersect a
+    tile, and to order the others by how much of the tile they cover.
+
+    Args:
+        - quadkey_zoom: zoom level of the mosaic's quadkeys
+        - keys: sorted uint64 array of quadkey integers
+        - offsets: uint32 array of length len(keys) + 1 into asset_ids
+        - asset_ids: uint32 array of indices into the asset table
+        - table: utf-8 encoded asset strings, concatenated
+        - table_offsets: uint64 array of length n_assets + 1 into table
+        - bounds: optional float64 array of shape (n_assets, 4), with the
+          (west, south, east, north) bounds of each asset, NaN if unknown
+    """
+
+    def __init__(
+            self, quadkey_zoom, keys, offsets, asset_ids, table,
+            table_offsets, bounds=None):
+        self.quadkey_zoom = quadkey_zoom
+        self.keys = keys
+        self.offsets = offsets
+        self.asset_ids = asset_ids
+        self.table = table
+        self.table_offsets = table_offsets
+        self.bounds = bounds
+        self._available: Dict[int, List[Dict[str, int]]] = {}
+        self._coverage = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.keys.nbytes + self.offsets.nbytes + self.asset_ids.nbytes +
+            len(self.table) + self.table_offsets.nbytes +
+            (self.bounds.nbytes if self.bounds is not None else 0))
+
+    @classmethod
+    def from_mosaic_def(
+            cls, mosaic_def,
+            asset_bounds: Dict[str, Tuple[float, float, float, float]] = None):
+        """Build index from a MosaicJSON definition
+
+        Args:
+            - mosaic_def: MosaicJSON definition
+            - asset_bounds: optional (west, south, east, north) bounds of each
+              asset, e.g. from `dem_tiler.reader.read_asset_bounds`
+
+        Raises ValueError if the quadkeys are not all at the same zoom level.
+        """
+        quadkey_zoom = mosaic_def.quadkey_zoom or mosaic_def.minzoom
+        tiles = mosaic_def.tiles
+
+        interned = {}
+        keys = np.empty(len(tiles), dtype=np.uint64)
+        lengths = np.empty(len(tiles), dtype=np.uint32)
+        refs = []
+        for i, (quadkey, assets) in enumerate(tiles.items()):
+            if len(quadkey) != quadkey_zoom:
+                raise ValueError(
+                    f'quadkey {quadkey} is not at zoom {quadkey_zoom}')
+
+            keys[i] = int(quadkey, 4) if quadkey else 0
+            lengths[i] = len(assets)
+            refs.append([interned.setdefault(a, len(interned)) for a in assets])
+
+        order = np.argsort(keys, kind='stable')
+        offsets = np.zeros(len(tiles) + 1, dtype=np.uint32)
+        np.cumsum(lengths[order], out=offsets[1:])
+
+        asset_ids = np.fromiter(
+            (ix for i in order for ix in refs[i]),
+            dtype=np.uint32,
+            count=int(offsets[-1]))
+
+        encoded = [asset.encode('utf-8') for asset in interned]
+        table_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+        np.cumsum([len(b) for b in encoded], out=table_offsets[1:])
+
+        bounds = None
+        if asset_bounds is not None:
+            bounds = np.array([
+                asset_bounds.get(asset, (np.nan, ) * 4)
+                for asset in interned], dtype=np.float64).reshape(-1, 4)
+
+        return cls(
+            quadkey_zoom, keys[order], offsets, asset_ids, b''.join(encoded),
+            table_offsets, bounds)
+
+    def _asset(self, ix: int) -> str:
+        start, end = self.table_offsets[ix:ix + 2]
+        return bytes(self.table[start:end]).decode('utf-8')
+
+    def search(self, x, y, z) -> Tuple[np.ndarray, np.ndarray]:
+        """Positions of the quadkeys within or containing tiles
+
+        Vectorized over x and y. For tiles below the quadkey zoom, that's the
+        parent quadkey; for tiles above it, all descendant quadkeys.
+
+        Returns:
+            (lo, hi) arrays, such that keys[lo:hi] are the matching quadkeys
+        """
+        qz = self.quadkey_zoom
+        if z >= qz:
+            x, y, z = np.right_shift(x, z - qz), np.right_shift(y, z - qz), qz
+
+        if np.ndim(x) == 0:
+            keys = np.uint64(tile_to_key(int(x), int(y), z))
+        else:
+            # Interleave bits of x and y into base-4 quadkey integers
+            x = np.asarray(x, dtype=np.int64)
+            y = np.asarray(y, dtype=np.int64)
+            keys = np.zeros(x.shape, dtype=np.uint64)
+            for i in range(z - 1, -1, -1):
+                digit = ((x >> i) & 1) | (((y >> i) & 1) << 1)
+                keys = (keys << np.uint64(2)) | digit.astype(np.uint64)
+
+        shift = np.uint64(2 * (qz - z))
+        lo = np.searchsorted(self.keys, keys << shift)
+        hi = np.searchsorted(self.keys, (keys + np.uint64(1)) << shift)
+        return lo, hi
+
+    def tile(self, x: int, y: int, z: int) -> List[str]:
+        """Find assets for a mercator tile
+
+        For tiles at or past the quadkey zoom, these are the assets of the
+        quadkey containing them, in mosaic order, like `MosaicBackend.tile`. For tiles
+        of lower zooms, the assets of all descendant quadkeys are concatenated
+        in sorted quadkey order, not in the order of the mosaic's `tiles`,
+        and deduplicated keeping the first occurrence.
+
+        With asset bounds, assets that don't intersect the tile are dropped,
+        keeping the order of the others, since it decides which asset
+        wins with `first`. Assets of unknown bounds are kept.
+        """
+        lo, hi = self.search(x, y, z)
+        ids = self.asset_ids[self.offsets[lo]:self.offsets[hi]]
+
+        # Deduplicate while preserving order
+        ids = list(dict.fromkeys(ids.tolist()))
+        if self.bounds is not None and ids:
+            ids = self._intersecting(ids, x, y, z)
+
+        return [self._asset(ix) for ix in ids]
+
+    def _intersecting(self, ids: List[int], x: int, y: int,
+                      z: int) -> List[int]:
+        """Assets whose bounds intersect a tile, or are unknown"""
+        west, south, east, north = tile_bounds(x, y, z)
+        bounds = self.bounds[ids]
+
+        # NaN bounds compare False, and are kept
+        disjoint = (
+            (bounds[:, 0] >= east) | (bounds[:, 2] <= west) |
+            (bounds[:, 1] >= north) | (bounds[:, 3] <= south))
+        return [ix for ix, skip in zip(ids, disjoint.tolist()) if not skip]
+
+    def items(self, positions: Iterable[int] = None
+              ) -> Iterator[Tuple[str, List[str]]]:
+        """Iterate over (quadkey, assets) pairs
+
+        Args:
+            - positions: positions in `keys` to iterate over, by default all of
+              them, in quadkey order
+        """
+        if positions is None:
+            positions = range(len(self.keys))
+
+        qz = self.quadkey_zoom
+        for i in positions:
+            key = int(self.keys[i])
+            quadkey = np.base_repr(key, 4).zfill(qz) if qz else ''
+            ids = self.asset_ids[self.offsets[i]:self.offsets[i + 1]]
+            yield quadkey, [self._asset(ix) for ix in ids.tolist()]
+
+    def available(self, z: int) -> List[Dict[str, int]]:
+        """Ranges of tiles at zoom z that have assets
+
+        Tiles below the quadkey zoom are available when any descendant quadkey
+        is; tiles above it when their parent quadkey is. Ranges are computed
+        once per zoom level and kept on the index.
+
+        Returns:
+            List of inclusive {"startX", "startY", "endX", "endY"} XYZ ranges
+        """
+        if z in self._available:
+            return self._available[z]
+
+        qz = self.quadkey_zoom
+        if z > qz:
+            # Every quadkey range is scaled to its descendants
+            factor = 2**(z - qz)
+            ranges = [{
+                "startX": r["startX"] * factor,
+                "startY": r["startY"] * factor,
+                "endX": (r["endX"] + 1) * factor - 1,
+                "endY": (r["endY"] + 1) * factor - 1}
+                      for r in self.available(qz)]
+        else:
+            keys = np.unique(np.asarray(self.keys) >> np.uint64(2 * (qz - z)))
+            ranges = tile_ranges(*key_to_tiles(keys, z))
+
+        self._available[z] = ranges
+        return ranges
+
+    def coverage(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Quadkeys merged to their parents wherever fully covered
+
+        Computed once and kept on the index.
+
+        Returns:
+            (keys, zooms) as returned by `merge_quadkeys`
+        """
+        if self._coverage is None:
+            self._coverage = merge_quadkeys(
+                self.keys, np.full(len(self.keys), self.quadkey_zoom))
+
+        return self._coverage
+
+    def to_bytes(self) -> bytes:
+        """Serialize index to the binary sidecar format"""
+        header = np.array([
+            self.quadkey_zoom,
+            len(self.keys),
+            len(self.asset_ids),
+            len(self.table_offsets) - 1,
+            len(self.table)], dtype=HEADER_DTYPE)
+
+        parts = [
+            MAGIC,
+            header.tobytes(),
+            self.keys.astype('<u8').tobytes(),
+            self.table_offsets.astype('<u8').tobytes(),
+            self.offsets.astype('<u4').tobytes(),
+            self.asset_ids.astype('<u4').tobytes()]
+
+        buf = b''.join(parts)
+        buf += b'\0' * (_pad8(len(buf)) - len(buf))
+        buf += bytes(self.table)
+
+        # Asset bounds are an optional trailing section
+        if self.bounds is not None:
+            buf += b'\0' * (_pad8(len(buf)) - len(buf))
+            buf += self.bounds.astype('<f8').tobytes()
+
+        return buf
+
+    @classmethod
+    def from_buffer(cls, buf):
+        """Load index from a buffer in the binary sidecar format
+
+        Arrays are views into `buf`, so passing an `mmap` avoids reading the
+        whole file up front.
+        """
+        if bytes(buf[:len(MAGIC)]) != MAGIC:
+            raise ValueError('Not a quadkey index')
+
+        pos = len(MAGIC)
+        header = np.frombuffer(buf, HEADER_DTYPE, HEADER_LEN, pos)
+        quadkey_zoom, n_keys, n_refs, n_assets, table_nbytes = map(
+            int, header)
+        pos += header.nbytes
+
+        def _take(dtype, count):
+            nonlocal pos
+            arr = np.frombuffer(buf, dtype, count, pos)
+            pos += arr.nbytes
+            return arr
+
+        keys = _take('<u8', n_keys)
+        table_offsets = _take('<u8', n_assets + 1)
+        offsets = _take('<u4', n_keys + 1)
+        asset_ids = _take('<u4', n_refs)
+
+        pos = _pad8(pos)
+        table = memoryview(buf)[pos:pos + table_nbytes]
+
+        pos = _pad8(pos + table_nbytes)
+        bounds = None
+        if len(buf) >= pos + n_assets * 32:
+            bounds = _take('<f8', n_assets * 4).reshape(-1, 4)
+
+        return cls(
+            quadkey_zoom, keys, offsets, asset_ids, table, table_offsets,
+            bounds)
+
+    def write(self, path: str):
+        """Write binary sidecar file"""
+        with open(path, 'wb') as f:
+            f.write(self.to_bytes())
+
+    @classmethod
+    def open(cls, path: str):
+        """Memory-map binary sidecar file"""
+        with open(path, 'rb') as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        return cls.from_buffer(buf)
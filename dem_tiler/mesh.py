@@ -0,0 +1,506 @@
+"""dem_tiler.mesh: terrain mesh generation helpers."""
+
+import struct
+from functools import lru_cache
+from typing import BinaryIO, Dict, Iterable, List, Sequence, Set, Tuple, Union
+
+import attr
+import mercantile
+import numpy as np
+from pymartini import Martini
+from quantized_mesh_encoder.constants import EXTENSION_HEADER
+from quantized_mesh_encoder.encode import (
+    compute_header,
+    encode_header,
+    find_edge_indices,
+    interp_positions,
+    write_indices,
+    write_vertices,
+)
+from quantized_mesh_encoder.extensions import (
+    ExtensionBase,
+    ExtensionId,
+    WaterMaskExtension,
+)
+
+# WGS84 ellipsoid
+WGS84_A = 6378137.0
+WGS84_E2 = 0.00669437999014133
+
+# Quantized mesh extension ids
+# Ref: https://github.com/CesiumGS/quantized-mesh#extensions
+EXTENSIONS = {
+    "octvertexnormals": ExtensionId.VERTEX_NORMALS,
+    "watermask": ExtensionId.WATER_MASK}
+
+# Side length of a full water mask grid
+WATER_MASK_SIZE = 256
+
+# Max error of `mesh_max_error=auto`, in ground pixels. One pixel keeps the
+# screen-space error constant across zoom levels.
+AUTO_MESH_ERROR_PIXELS = 1
+
+
+@lru_cache(maxsize=None)
+def get_martini(grid_size: int) -> Martini:
+    """Martini instance for a grid size, built once per process
+
+    Building a Martini instance precomputes the triangle index hierarchy of the
+    grid, which only depends on its size (257 or 513 for 256 and 512px tiles),
+    so instances are shared by all requests.
+    """
+    return Martini(grid_size)
+
+
+def ground_pixel_size(x: int, y: int, z: int, tile_size: int) -> float:
+    """Ground size of a tile's pixels in meters, at the tile's center latitude"""
+    west, _, east, _ = mercantile.xy_bounds(x, y, z)
+    bounds = mercantile.bounds(x, y, z)
+    lat = np.radians((bounds.north + bounds.south) / 2)
+    return float((east - west) / tile_size * np.cos(lat))
+
+
+def parse_max_error(value) -> Union[str, float, Dict[int, float]]:
+    """Parse the mesh_max_error parameter
+
+    Accepts a number of meters, `auto`, or a table of zoom levels to meters,
+    e.g. `0:2000,8:50,12:5`.
+
+    Raises ValueError on invalid input.
+    """
+    value = str(value).strip()
+    if value == "auto":
+        return value
+
+    if ":" not in value:
+        return float(value)
+
+    table = {}
+    for item in value.split(","):
+        zoom, _, error = item.partition(":")
+        table[int(zoom)] = float(error)
+
+    return table
+
+
+def resolve_max_error(
+        value: Union[str, float, Dict[int, float]], x: int, y: int, z: int,
+        tile_size: int) -> float:
+    """Mesh max error in meters for a tile
+
+    Args:
+        - value: as returned by `parse_max_error`. With `auto`, the error is
+          `AUTO_MESH_ERROR_PIXELS` ground pixels. With a table, the entry of
+          the highest zoom not above z is used, or the lowest zoom entry.
+        - x, y, z: mercator tile
+        - tile_size: tile size in pixels
+    """
+    if value == "auto":
+        return AUTO_MESH_ERROR_PIXELS * ground_pixel_size(x, y, z, tile_size)
+
+    if isinstance(value, dict):
+        zooms = sorted(value)
+        below = [zoom for zoom in zooms if zoom <= z]
+        return value[below[-1] if below else zooms[0]]
+
+    return float(value)
+
+
+def force_martini_edges(tile):
+    """Force every border pixel of a Martini tile into its meshes
+
+    Border errors are set to infinity, and `update` propagates them to the
+    parent triangles, so that any mesh is refined down to each border pixel.
+    Neighboring tiles then share exactly the same edge vertices.
+
+    Args:
+        - tile: Martini tile, as returned by `Martini.create_tile`
+    """
+    size = tile.grid_size
+    errors = np.asarray(tile.errors_view).reshape(size, size)
+    errors[[0, -1], :] = np.inf
+    errors[:, [0, -1]] = np.inf
+    tile.update()
+
+
+def _border_edges(vertices: np.ndarray, triangles: np.ndarray, size: int):
+    """Find triangle edges lying on the border that skip border pixels
+
+    Returns:
+        (triangle, edge) index arrays, where edge i goes from the i-th to the
+        (i + 1) % 3-th vertex of the triangle
+    """
+    start = vertices[triangles, :2]
+    end = vertices[np.roll(triangles, -1, axis=1), :2]
+
+    on_border = np.zeros(triangles.shape, dtype=bool)
+    for axis in range(2):
+        for value in [0, size]:
+            on_border |= (start[..., axis] == value) & (end[..., axis] == value)
+
+    length = np.abs(end - start).sum(axis=-1)
+    return np.nonzero(on_border & (length > 1))
+
+
+def insert_delatin_edges(
+        vertices: np.ndarray, triangles: np.ndarray,
+        terrain: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Add every border pixel of a Delatin mesh as a vertex
+
+    Delatin has no way to force vertices, so each triangle edge on the border
+    is split at every pixel, and its triangle replaced by a fan from the
+    opposite vertex. Corner triangles, with two border edges, are split over
+    two passes.
+
+    Args:
+        - vertices: Delatin vertices, of shape (N, 3) of pixel x, y and height.
+          Delatin's y axis points up, i.e. a vertex's height is
+          terrain[size - y, x].
+        - triangles: array of shape (M, 3)
+        - terrain: array of shape (size + 1, size + 1) passed to Delatin
+
+    Returns:
+        New (vertices, triangles)
+    """
+    size = terrain.shape[0] - 1
+    triangles = triangles.reshape(-1, 3)
+
+    while True:
+        tri_ix, edge_ix = _border_edges(vertices, triangles, size)
+        # Split at most one edge of each triangle per pass
+        tri_ix, first = np.unique(tri_ix, return_index=True)
+        edge_ix = edge_ix[first]
+        if not len(tri_ix):
+            return vertices, triangles
+
+        new_vertices = []
+        new_triangles = []
+        n_vertices = len(vertices)
+        for t, e in zip(tri_ix.tolist(), edge_ix.tolist()):
+            a, b, c = np.roll(triangles[t], -e)
+            (ax, ay), (bx, by) = vertices[[a, b], :2].astype(int)
+            n = abs(bx - ax) + abs(by - ay)
+
+            # Border pixels strictly between a and b
+            steps = np.arange(1, n)
+            xs = ax + np.sign(bx - ax) * steps
+            ys = ay + np.sign(by - ay) * steps
+            new_vertices.append(
+                np.column_stack([xs, ys, terrain[size - ys, xs]]))
+
+            ids = np.concatenate([[a], n_vertices + np.arange(n - 1), [b]])
+            n_vertices += n - 1
+            new_triangles.append(
+                np.column_stack([ids[:-1], ids[1:], np.full(n, c)]))
+
+        keep = np.ones(len(triangles), dtype=bool)
+        keep[tri_ix] = False
+        vertices = np.concatenate(
+            [vertices] + new_vertices).astype(vertices.dtype)
+        triangles = np.concatenate(
+            [triangles[keep]] + new_triangles).astype(triangles.dtype)
+
+
+def add_skirts(
+        positions: np.ndarray, triangles: np.ndarray,
+        height: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Add skirts hanging below the edges of a mesh
+
+    Every edge vertex is duplicated `height` meters lower, and consecutive edge
+    vertices are joined to their duplicates by two triangles, wound so that
+    they face away from the tile. Skirts hide any remaining crack between
+    tiles of different zoom levels for clients that don't generate their own.
+    Encode with `encode_mesh`, which keeps skirts out of the edge indices.
+
+    Args:
+        - positions: array of shape (N, 3) of (lng, lat, height)
+        - triangles: vertex indices
+        - height: skirt height in meters
+
+    Returns:
+        New (positions, triangles, skirt_ix). Skirt vertices are appended after
+        the original vertices, and skirt_ix is the index of the edge vertex
+        each of them duplicates.
+    """
+    triangles = triangles.reshape(-1, 3)
+    west, south = positions[:, :2].min(axis=0)
+    east, north = positions[:, :2].max(axis=0)
+
+    # (top, bottom, next top) triangles along increasing lng or lat face east
+    # and south, and are flipped on the west and north edges
+    edges = []
+    for axis, value, flip in [(0, west, True), (0, east, False),
+                              (1, south, False), (1, north, True)]:
+        ix = np.flatnonzero(positions[:, axis] == value)
+        # Sort along the edge
+        edges.append((ix[np.argsort(positions[ix, 1 - axis])], flip))
+
+    skirt_ix = np.concatenate([edge for edge, _ in edges])
+    skirt = positions[skirt_ix].copy()
+    skirt[:, 2] -= height
+    lower = len(positions) + np.arange(len(skirt_ix))
+
+    new_triangles = []
+    pos = 0
+    for top, flip in edges:
+        bottom = lower[pos:pos + len(top)]
+        pos += len(top)
+        skirt_triangles = np.concatenate([
+            np.column_stack([top[:-1], bottom[:-1], top[1:]]),
+            np.column_stack([top[1:], bottom[:-1], bottom[1:]])])
+        if flip:
+            skirt_triangles = skirt_triangles[:, [0, 2, 1]]
+        new_triangles.append(skirt_triangles)
+
+    positions = np.concatenate([positions, skirt]).astype(positions.dtype)
+    triangles = np.concatenate([triangles] +
+                               new_triangles).astype(triangles.dtype)
+    return positions, triangles, skirt_ix
+
+
+def encode_mesh(
+        f: BinaryIO,
+        positions: np.ndarray,
+        indices: np.ndarray,
+        n_surface: int = None,
+        extensions: Sequence[ExtensionBase] = ()) -> None:
+    """Encode a quantized mesh, like `quantized_mesh_encoder.encode`
+
+    The encoder lists every vertex on the tile's bounds in the edge indices,
+    which would include skirts from `add_skirts`. Clients build their own
+    skirts and upsample child tiles from those lists, so only the first
+    `n_surface` vertices are listed here.
+
+    Args:
+        - f: writable binary file
+        - positions: array of shape (N, 3) of (lng, lat, height)
+        - indices: triangle vertex indices
+        - n_surface: number of surface vertices, at the start of positions.
+          Defaults to all of them.
+        - extensions: instances of the encoder's `ExtensionBase`
+    """
+    positions = positions.reshape(-1, 3).astype(np.float32)
+    indices = indices.reshape(-1, 3).astype(np.uint32)
+    n_vertices = len(positions)
+
+    encode_header(f, compute_header(positions, None))
+    quantized = interp_positions(positions)
+    write_vertices(f, quantized, n_vertices)
+    write_indices(f, indices, n_vertices)
+
+    # West, south, east and north, as in `find_edge_indices`
+    dtype = np.uint32 if n_vertices > 65536 else np.uint16
+    for edge in find_edge_indices(quantized[:n_surface]):
+        f.write(struct.pack('<I', len(edge)))
+        f.write(edge.astype(dtype).tobytes())
+
+    for extension in extensions:
+        f.write(extension.encode())
+
+
+def parse_extensions(value: str) -> Set[str]:
+    """Parse requested quantized mesh extensions
+
+    Accepts either an `extensions` query parameter, e.g.
+    `octvertexnormals,watermask`, or an `Accept` header as sent by Cesium, e.g.
+    `application/vnd.quantized-mesh;extensions=octvertexnormals-watermask,*/*`.
+    Unknown extensions, such as `metadata`, are ignored.
+    """
+    if not value:
+        return set()
+
+    names: Set[str] = set()
+    if "extensions=" not in value:
+        names.update(value.replace("-", ",").split(","))
+    else:
+        for media_range in value.split(","):
+            for param in media_range.split(";")[1:]:
+                key, _, val = param.strip().partition("=")
+                if key == "extensions":
+                    names.update(val.strip('"').split("-"))
+
+    return {name.strip().lower() for name in names} & set(EXTENSIONS)
+
+
+def to_ecef(positions: np.ndarray) -> np.ndarray:
+    """Convert (lng, lat, height) positions to WGS84 earth-centered coordinates
+
+    Args:
+        - positions: array of shape (N, 3) with degrees and meters
+
+    Returns:
+        float64 array of shape (N, 3)
+    """
+    lng = np.radians(positions[:, 0], dtype=np.float64)
+    lat = np.radians(positions[:, 1], dtype=np.float64)
+    height = positions[:, 2].astype(np.float64)
+
+    sin_lat = np.sin(lat)
+    cos_lat = np.cos(lat)
+    radius = WGS84_A / np.sqrt(1 - WGS84_E2 * sin_lat**2)
+
+    ecef = np.empty((len(positions), 3), dtype=np.float64)
+    ecef[:, 0] = (radius + height) * cos_lat * np.cos(lng)
+    ecef[:, 1] = (radius + height) * cos_lat * np.sin(lng)
+    ecef[:, 2] = (radius * (1 - WGS84_E2) + height) * sin_lat
+    return ecef
+
+
+def compute_vertex_normals(
+        positions: np.ndarray, triangles: np.ndarray) -> np.ndarray:
+    """Compute unit vertex normals of a mesh in earth-centered coordinates
+
+    Face normals are computed for all triangles at once, then accumulated onto
+    their three vertices with `np.bincount`. Cross products are left unnormalized,
+    so each face is weighted by its area. Faces are oriented upwards regardless
+    of their winding order.
+
+    Args:
+        - positions: array of shape (N, 3) of (lng, lat, height)
+        - triangles: vertex indices, of shape (M, 3) or flat
+
+    Returns:
+        float64 array of shape (N, 3). Vertices not part of any triangle get the
+        ellipsoid surface normal.
+    """
+    ecef = to_ecef(positions)
+    triangles = triangles.reshape(-1, 3)
+
+    a = ecef[triangles[:, 0]]
+    face_normals = np.cross(ecef[triangles[:, 1]] - a, ecef[triangles[:, 2]] - a)
+
+    # Winding order depends on the mesh algorithm and on flip_y. A heightmap
+    # has no overhangs, so orient every face away from the earth center.
+    inward = np.einsum('ij,ij->i', face_normals, a) < 0
+    face_normals[inward] *= -1
+
+    # Scatter-add each face normal onto its three vertices
+    vertex_ix = triangles.ravel()
+    face_ix = np.repeat(np.arange(len(triangles)), 3)
+    normals = np.column_stack([
+        np.bincount(
+            vertex_ix, weights=face_normals[face_ix, i], minlength=len(ecef))
+        for i in range(3)])
+
+    length = np.linalg.norm(normals, axis=1)
+    missing = length == 0
+    if missing.any():
+        lng = np.radians(positions[missing, 0], dtype=np.float64)
+        lat = np.radians(positions[missing, 1], dtype=np.float64)
+        normals[missing] = np.column_stack([
+            np.cos(lat) * np.cos(lng),
+            np.cos(lat) * np.sin(lng),
+            np.sin(lat)])
+        length[missing] = 1
+
+    normals /= length[:, np.newaxis]
+    return normals
+
+
+def oct_encode(normals: np.ndarray) -> np.ndarray:
+    """Oct-encode unit vectors to two bytes each
+
+    Ref: https://github.com/CesiumGS/cesium/blob/master/Source/Core/AttributeCompression.js
+
+    Args:
+        - normals: array of shape (N, 3) of unit vectors
+
+    Returns:
+        uint8 array of shape (N, 2)
+    """
+    xy = normals[:, :2] / np.abs(normals).sum(axis=1)[:, np.newaxis]
+
+    # Fold the lower hemisphere over the diagonals
+    lower = normals[:, 2] < 0
+    sign = np.where(xy[lower] < 0, -1.0, 1.0)
+    xy[lower] = (1 - np.abs(xy[lower][:, ::-1])) * sign
+
+    return np.rint((np.clip(xy, -1, 1) * 0.5 + 0.5) * 255).astype(np.uint8)
+
+
+def water_mask(tile: np.ndarray, sea_level: float = 0) -> np.ndarray:
+    """Compute a quantized mesh water mask from an elevation tile
+
+    Pixels without data or at or below `sea_level` are water.
+
+    Args:
+        - tile: elevation array of shape (H, W), north up, with H and W
+          multiples of 256. Any extra backfilled row and column is ignored.
+        - sea_level: elevation in meters
+
+    Returns:
+        uint8 array of 0 (land) or 255 (water), either of shape (256, 256), or
+        of shape () if the whole tile is land or water.
+    """
+    size = WATER_MASK_SIZE
+    height = tile.shape[0] // size * size
+    width = tile.shape[1] // size * size
+    tile = tile[:height, :width]
+
+    with np.errstate(invalid='ignore'):
+        water = np.isnan(tile) | (tile <= sea_level)
+
+    # Majority vote within each block of a larger tile
+    water = water.reshape(size, height // size, size, width // size)
+    mask = np.where(water.mean(axis=(1, 3)) >= 0.5, 255, 0).astype(np.uint8)
+
+    if (mask == mask.flat[0]).all():
+        return np.array(mask.flat[0], dtype=np.uint8)
+
+    return mask
+
+
+@attr.s(kw_only=True)
+class OctVertexNormalsExtension(ExtensionBase):
+    """Vertex normals extension of precomputed unit normals
+
+    The encoder's `VertexNormalsExtension` computes normals from the encoded
+    mesh, so skirts would tilt the normals of edge vertices and flip_y's
+    winding would point them into the earth. See `compute_vertex_normals`.
+    """
+
+    id: ExtensionId = attr.ib(ExtensionId.VERTEX_NORMALS)
+    normals: np.ndarray = attr.ib()
+
+    def encode(self) -> bytes:
+        data = oct_encode(self.normals).tobytes('C')
+        return (
+            struct.pack(EXTENSION_HEADER['extensionId'], self.id.value) +
+            struct.pack(EXTENSION_HEADER['extensionLength'], len(data)) +
+            data)
+
+
+def mesh_extensions(
+        extensions: Iterable[str],
+        positions: np.ndarray,
+        triangles: np.ndarray,
+        tile: np.ndarray,
+        sea_level: float = 0,
+        skirt_ix: np.ndarray = None) -> List[ExtensionBase]:
+    """Requested quantized mesh extensions, for `quantized_mesh_encoder.encode`
+
+    Args:
+        - extensions: extension names, from `parse_extensions`
+        - positions: array of shape (N, 3) of (lng, lat, height), in the order
+          passed to the quantized mesh encoder, without skirts
+        - triangles: vertex indices, without skirts
+        - tile: elevation array of shape (H, W), north up
+        - sea_level: water mask elevation threshold in meters
+        - skirt_ix: skirt vertices from `add_skirts`, which get the normal of
+          the edge vertex they duplicate
+
+    Returns:
+        Extensions, ordered by extension id
+    """
+    result = []
+    for name in sorted(extensions, key=EXTENSIONS.get):
+        if name == "octvertexnormals":
+            normals = compute_vertex_normals(positions, triangles)
+            if skirt_ix is not None:
+                normals = np.concatenate([normals, normals[skirt_ix]])
+            result.append(OctVertexNormalsExtension(normals=normals))
+        else:
+            result.append(
+                WaterMaskExtension(data=water_mask(tile, sea_level)))
+
+    return result
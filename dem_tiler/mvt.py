@@ -0,0 +1,245 @@
+"""dem_tiler.mvt: in-process Mapbox Vector Tile encoding of line features.
+
+Ref: https://github.com/mapbox/vector-tile-spec/tree/master/2.1
+"""
+
+import struct
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+EXTENT = 4096
+# Same default buffer as tippecanoe: 5/256 of the tile
+BUFFER = 80
+
+# Geometry types
+LINESTRING = 2
+
+# Geometry commands
+MOVE_TO = 1
+LINE_TO = 2
+
+# Protobuf wire types
+VARINT = 0
+FIXED64 = 1
+LENGTH_DELIMITED = 2
+
+
+def encode_varints(values) -> bytes:
+    """Encode non-negative integers as concatenated protobuf varints"""
+    values = np.asarray(values, dtype=np.uint64)
+    if not len(values):
+        return b''
+
+    nbytes = np.ones(len(values), dtype=np.int64)
+    for shift in range(7, 64, 7):
+        nbytes += values >= np.uint64(1 << shift)
+
+    out = np.empty(nbytes.sum(), dtype=np.uint8)
+    starts = np.cumsum(nbytes) - nbytes
+    remaining = values.copy()
+    for i in range(int(nbytes.max())):
+        mask = nbytes > i
+        byte = (remaining[mask] & np.uint64(0x7f)).astype(np.uint8)
+        byte[nbytes[mask] > i + 1] |= 0x80
+        out[starts[mask] + i] = byte
+        remaining >>= np.uint64(7)
+
+    return out.tobytes()
+
+
+def zigzag(values):
+    """ZigZag-encode signed integers"""
+    values = np.asarray(values, dtype=np.int64)
+    return ((values << 1) ^ (values >> 63)).astype(np.uint64)
+
+
+def _key(field: int, wire_type: int) -> bytes:
+    return encode_varints([(field << 3) | wire_type])
+
+
+def _message(field: int, payload: bytes) -> bytes:
+    return _key(field, LENGTH_DELIMITED) + encode_varints([len(payload)
+                                                          ]) + payload
+
+
+def _encode_value(value) -> bytes:
+    """Encode a property value as a vector tile Value message"""
+    if isinstance(value, str):
+        return _message(1, value.encode('utf-8'))
+
+    if isinstance(value, (bool, np.bool_)):
+        return _key(7, VARINT) + encode_varints([int(value)])
+
+    if isinstance(value, (float, np.floating)) and not float(value).is_integer():
+        return _key(3, FIXED64) + struct.pack('<d', value)
+
+    value = int(value)
+    if value < 0:
+        return _key(6, VARINT) + encode_varints(zigzag([value]))
+
+    return _key(5, VARINT) + encode_varints([value])
+
+
+def clip_linestring(coords, bounds) -> List[np.ndarray]:
+    """Clip a linestring to a rectangle
+
+    Each segment is clipped with the Liang-Barsky algorithm, vectorized over
+    all segments. Consecutive visible segments are joined back into parts.
+
+    Args:
+        - coords: array of shape (N, 2)
+        - bounds: (minx, miny, maxx, maxy)
+
+    Returns:
+        List of arrays of shape (M, 2), one for each part inside bounds
+    """
+    minx, miny, maxx, maxy = bounds
+    if len(coords) < 2:
+        return []
+
+    start = coords[:-1]
+    delta = coords[1:] - start
+
+    t0 = np.zeros(len(start))
+    t1 = np.ones(len(start))
+    visible = np.ones(len(start), dtype=bool)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        for p, q in [(-delta[:, 0], start[:, 0] - minx),
+                     (delta[:, 0], maxx - start[:, 0]),
+                     (-delta[:, 1], start[:, 1] - miny),
+                     (delta[:, 1], maxy - start[:, 1])]:
+            # Parallel to this edge and outside of it
+            visible &= (p != 0) | (q >= 0)
+
+            ratio = q / p
+            t0 = np.where(p < 0, np.maximum(t0, ratio), t0)
+            t1 = np.where(p > 0, np.minimum(t1, ratio), t1)
+
+    visible &= t0 <= t1
+    idx = np.flatnonzero(visible)
+    if not len(idx):
+        return []
+
+    clipped_start = start + t0[:, np.newaxis] * delta
+    clipped_end = start + t1[:, np.newaxis] * delta
+
+    # A new part starts wherever the line enters bounds, or after a gap
+    new_part = np.ones(len(idx), dtype=bool)
+    new_part[1:] = (np.diff(idx) != 1) | (t1[idx[:-1]] < 1) | (t0[idx[1:]] > 0)
+    part_starts = np.flatnonzero(new_part)
+
+    parts = []
+    for segments in np.split(idx, part_starts[1:]):
+        parts.append(
+            np.concatenate(
+                [clipped_start[segments[:1]], clipped_end[segments]]))
+
+    return parts
+
+
+def quantize_linestring(
+        coords, scale: float, extent: int = EXTENT,
+        buffer: int = BUFFER) -> List[np.ndarray]:
+    """Transform, clip and quantize a linestring to integer tile coordinates
+
+    Args:
+        - coords: array of shape (N, 2), in pixels from the tile's top left
+        - scale: number of tile units per pixel, i.e. extent / tile_size
+        - extent: tile extent
+        - buffer: number of tile units kept outside of the tile on each side
+
+    Returns:
+        List of int64 arrays of shape (M, 2), dropping parts of less than 2
+        distinct points.
+    """
+    bounds = (-buffer, -buffer, extent + buffer, extent + buffer)
+
+    parts = []
+    for part in clip_linestring(coords * scale, bounds):
+        part = np.rint(part).astype(np.int64)
+
+        # Drop repeated points
+        keep = np.ones(len(part), dtype=bool)
+        keep[1:] = (np.diff(part, axis=0) != 0).any(axis=1)
+        part = part[keep]
+
+        if len(part) >= 2:
+            parts.append(part)
+
+    return parts
+
+
+def encode_linestring_geometry(parts: Sequence[np.ndarray]) -> np.ndarray:
+    """Encode linestring parts as vector tile geometry commands
+
+    Returns:
+        uint64 array of command integers and zigzag-encoded parameters
+    """
+    coords = np.concatenate(parts)
+    deltas = zigzag(np.diff(coords, axis=0, prepend=[[0, 0]]))
+
+    commands = []
+    pos = 0
+    for part in parts:
+        n = len(part)
+        commands.append([(1 << 3) | MOVE_TO])
+        commands.append(deltas[pos])
+        commands.append([((n - 1) << 3) | LINE_TO])
+        commands.append(deltas[pos + 1:pos + n].ravel())
+        pos += n
+
+    return np.concatenate(commands).astype(np.uint64)
+
+
+def encode_layer(
+        name: str,
+        features: Iterable[Tuple[int, Sequence[np.ndarray], Dict]],
+        extent: int = EXTENT) -> bytes:
+    """Encode a vector tile layer of linestring features
+
+    Args:
+        - name: layer name
+        - features: iterable of (id, parts, properties), with parts as returned
+          by `quantize_linestring`. Features without parts are skipped.
+        - extent: tile extent
+
+    Returns:
+        Encoded Layer message, without the enclosing Tile field
+    """
+    keys: Dict[str, int] = {}
+    values: Dict[Tuple[type, object], int] = {}
+    encoded_features = []
+
+    for feature_id, parts, properties in features:
+        if not parts:
+            continue
+
+        tags = []
+        for key, value in properties.items():
+            tags.append(keys.setdefault(key, len(keys)))
+            tags.append(values.setdefault((type(value), value), len(values)))
+
+        feature = b''
+        if feature_id is not None:
+            feature += _key(1, VARINT) + encode_varints([feature_id])
+
+        feature += _message(2, encode_varints(tags))
+        feature += _key(3, VARINT) + encode_varints([LINESTRING])
+        feature += _message(4, encode_varints(encode_linestring_geometry(parts)))
+        encoded_features.append(_message(2, feature))
+
+    layer = [
+        _key(15, VARINT) + encode_varints([2]),
+        _message(1, name.encode('utf-8'))]
+    layer.extend(encoded_features)
+    layer.extend(_message(3, key.encode('utf-8')) for key in keys)
+    layer.extend(_message(4, _encode_value(value)) for _, value in values)
+    layer.append(_key(5, VARINT) + encode_varints([extent]))
+    return b''.join(layer)
+
+
+def encode_tile(layers: Iterable[bytes]) -> bytes:
+    """Wrap encoded layers into a Tile message"""
+    return b''.join(_message(3, layer) for layer in layers)
@@ -0,0 +1,307 @@
+"""dem_tiler.points: vectorized elevation sampling at many points."""
+
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+import rasterio
+from rasterio.errors import RasterioIOError
+from rasterio.warp import transform as transform_coords
+from rasterio.windows import Window
+
+from dem_tiler.reader import (
+    _find_mosaic_assets,
+    aws_session,
+    executor,
+    get_mosaic_index,
+    open_mosaic,
+    read_elevation,
+)
+from dem_tiler.utils import (
+    GEOTIFF_MAXZOOM,
+    TERRARIUM_MAXZOOM,
+    _find_geotiff_assets,
+    _find_terrarium_assets,
+)
+
+# Largest window read at once from an asset. Points spread over a larger
+# window are sampled one pixel at a time instead.
+MAX_WINDOW_PIXELS = 4096 * 4096
+
+# Mean earth radius in meters
+EARTH_RADIUS = 6371008.8
+
+MAX_LAT = 85.0511287798066
+
+
+def _mercator(lng: np.ndarray,
+              lat: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Web mercator position as a fraction of the world, from the top left"""
+    lat = np.radians(np.clip(lat, -MAX_LAT, MAX_LAT))
+    x = (np.asarray(lng) + 180) / 360
+    y = (1 - np.log(np.tan(lat) + 1 / np.cos(lat)) / np.pi) / 2
+    return x, y
+
+
+def lnglat_to_tile(lng: np.ndarray, lat: np.ndarray,
+                   z: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorized `mercantile.tile`, returning int64 arrays of tile x and y"""
+    n = 2**z
+    x, y = _mercator(lng, lat)
+    return (
+        np.clip(np.floor(x * n), 0, n - 1).astype(np.int64),
+        np.clip(np.floor(y * n), 0, n - 1).astype(np.int64))
+
+
+def sample_asset(asset: str, lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Sample the first band of an asset at points
+
+    All points are read from a single window covering them, unless that window
+    is larger than `MAX_WINDOW_PIXELS`.
+
+    Returns:
+        float64 array, NaN for points outside of the asset or without data
+    """
+    values = np.full(len(lng), np.nan)
+
+    try:
+        with rasterio.open(asset) as src:
+            if src.crs and src.crs.to_epsg() != 4326:
+                xs, ys = transform_coords('EPSG:4326', src.crs, lng, lat)
+            else:
+                xs, ys = lng, lat
+
+            xs, ys = np.asarray(xs), np.asarray(ys)
+            inv = ~src.transform
+            cols = np.floor(inv.a * xs + inv.b * ys + inv.c).astype(np.int64)
+            rows = np.floor(inv.d * xs + inv.e * ys + inv.f).astype(np.int64)
+
+            inside = ((rows >= 0) & (rows < src.height) & (cols >= 0) &
+                      (cols < src.width))
+            if not inside.any():
+                return values
+
+            rows, cols = rows[inside], cols[inside]
+            row_off, col_off = rows.min(), cols.min()
+            height = rows.max() - row_off + 1
+            width = cols.max() - col_off + 1
+
+            if height * width <= MAX_WINDOW_PIXELS:
+                data = src.read(
+                    1,
+                    window=Window(col_off, row_off, width, height),
+                    masked=True)
+                sampled = np.ma.filled(
+                    data[rows - row_off, cols - col_off].astype(np.float64),
+                    np.nan)
+            else:
+                xy = list(zip(xs[inside].tolist(), ys[inside].tolist()))
+                sampled = np.array(
+                    [v[0] for v in src.sample(xy, indexes=1)],
+                    dtype=np.float64)
+                if src.nodata is not None:
+                    sampled[sampled == src.nodata] = np.nan
+
+            values[inside] = sampled
+
+    except RasterioIOError:
+        pass
+
+    return values
+
+
+def sample_mosaic(mosaic_url: str, lng: Sequence[float],
+                  lat: Sequence[float]) -> np.ndarray:
+    """Sample elevation of a MosaicJSON at points
+
+    Points are grouped by the mosaic quadkey containing them, and then by
+    asset, so that each asset is opened once and read once for all of its
+    points. Assets are read concurrently. Each point takes the value of the
+    first asset of its quadkey that has data, like the `first` pixel
+    selection method.
+
+    Returns:
+        float64 array, NaN where no asset has data
+    """
+    lng = np.asarray(lng, dtype=np.float64)
+    lat = np.asarray(lat, dtype=np.float64)
+
+    index = get_mosaic_index(mosaic_url)
+    if index is not None:
+        quadkey_zoom = index.quadkey_zoom
+    else:
+        with open_mosaic(mosaic_url) as mosaic:
+            quadkey_zoom = (
+                mosaic.mosaic_def.quadkey_zoom or mosaic.mosaic_def.minzoom)
+
+    x, y = lnglat_to_tile(lng, lat, quadkey_zoom)
+    tiles, inverse = np.unique(
+        np.stack([x, y], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+
+    # Assets of each quadkey, and points of each asset
+    tile_assets: List[List[str]] = []
+    asset_points: Dict[str, List[np.ndarray]] = {}
+    for i, (tile_x, tile_y) in enumerate(tiles.tolist()):
+        assets = _find_mosaic_assets(tile_x, tile_y, quadkey_zoom, mosaic_url)
+        tile_assets.append(assets)
+
+        points = np.flatnonzero(inverse == i)
+        for asset in assets:
+            asset_points.setdefault(asset, []).append(points)
+
+    asset_ix = {
+        asset: np.sort(np.concatenate(points))
+        for asset, points in asset_points.items()}
+
+    # GDAL config is thread local, so each worker enters its own Env
+    def _sample(asset):
+        with rasterio.Env(aws_session):
+            return sample_asset(
+                asset, lng[asset_ix[asset]], lat[asset_ix[asset]])
+
+    sampled = dict(zip(asset_ix, executor.map(_sample, asset_ix)))
+
+    values = np.full(len(lng), np.nan)
+    for i, assets in enumerate(tile_assets):
+        points = np.flatnonzero(inverse == i)
+        for asset in assets:
+            missing = points[np.isnan(values[points])]
+            if not len(missing):
+                break
+
+            pos = np.searchsorted(asset_ix[asset], missing)
+            values[missing] = sampled[asset][pos]
+
+    return values
+
+
+def tile_pyramid_asset(input_format: str, x: int, y: int) -> str:
+    """Asset of the highest zoom tile of AWS Terrain Tiles"""
+    if input_format == 'terrarium':
+        return _find_terrarium_assets(x, y, TERRARIUM_MAXZOOM, 256)[0]
+
+    return _find_geotiff_assets(x, y, GEOTIFF_MAXZOOM, 512)[0]
+
+
+def sample_tile_pyramid(input_format: str, lng: Sequence[float],
+                        lat: Sequence[float]) -> np.ndarray:
+    """Sample elevation of AWS Terrain Tiles at points
+
+    Points are sampled from the highest zoom tiles, z15 for terrarium and z14
+    for geotiff, with bilinear interpolation between the four pixel centers
+    around each point. The tiles containing those pixels, usually one per
+    point, plus a neighbor for points near a tile edge, are fetched and
+    decoded once each through the tile cache.
+
+    Args:
+        - input_format: "terrarium" or "geotiff"
+
+    Returns:
+        float64 array, NaN where tiles are missing
+    """
+    if input_format == 'terrarium':
+        z, tile_size = TERRARIUM_MAXZOOM, 256
+    else:
+        z, tile_size = GEOTIFF_MAXZOOM, 512
+
+    # Position in the global pixel grid of the zoom, relative to pixel centers
+    world_size = 2**z * tile_size
+    x, y = _mercator(
+        np.asarray(lng, dtype=np.float64), np.asarray(lat, dtype=np.float64))
+    px = x * world_size - 0.5
+    py = y * world_size - 0.5
+
+    x0 = np.floor(px)
+    y0 = np.floor(py)
+    fx = px - x0
+    fy = py - y0
+
+    # Four surrounding pixels, clamped to the world's edges
+    cols = np.clip(
+        np.stack([x0, x0 + 1, x0, x0 + 1]), 0, world_size - 1).astype(np.int64)
+    rows = np.clip(
+        np.stack([y0, y0, y0 + 1, y0 + 1]), 0, world_size - 1).astype(np.int64)
+    weights = np.stack([(1 - fx) * (1 - fy), fx * (1 - fy), (1 - fx) * fy,
+                        fx * fy])
+
+    tiles, inverse = np.unique(
+        np.stack([cols // tile_size, rows // tile_size], axis=-1).reshape(
+            -1, 2),
+        axis=0,
+        return_inverse=True)
+    inverse = inverse.reshape(cols.shape)
+
+    assets = [
+        tile_pyramid_asset(input_format, tx, ty) for tx, ty in tiles.tolist()]
+    arrays = read_elevation(assets, input_format)
+
+    corners = np.full(cols.shape, np.nan)
+    for i, arr in enumerate(arrays):
+        if arr is None:
+            continue
+
+        mask = inverse == i
+        corners[mask] = arr[0, rows[mask] % tile_size, cols[mask] % tile_size]
+
+    return (corners * weights).sum(axis=0)
+
+
+def sample_points(url: str, lng: Sequence[float],
+                  lat: Sequence[float]) -> np.ndarray:
+    """Sample elevation at points
+
+    Args:
+        - url: either url to MosaicJSON file, or the strings "terrarium" or "geotiff"
+
+    Returns:
+        float64 array, NaN where there's no data
+    """
+    if url in ('terrarium', 'geotiff'):
+        return sample_tile_pyramid(url, lng, lat)
+
+    return sample_mosaic(url, lng, lat)
+
+
+def haversine(lng: np.ndarray, lat: np.ndarray) -> np.ndarray:
+    """Great circle distances in meters between consecutive points"""
+    lng, lat = np.radians(lng), np.radians(lat)
+    a = (
+        np.sin(np.diff(lat) / 2)**2 +
+        np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lng) / 2)**2)
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+class TooManyPointsError(ValueError):
+    """Raised when a line would be sampled at more than max_points"""
+
+
+def interpolate_line(coordinates: Sequence[Sequence[float]],
+                     interval: float,
+                     max_points: int = None) -> Tuple[np.ndarray, ...]:
+    """Points spaced every `interval` meters along a linestring
+
+    The first and last vertices are always included. Positions are linearly
+    interpolated in longitude and latitude within each segment.
+
+    Args:
+        - coordinates: linestring coordinates, as (lng, lat) pairs
+        - interval: distance between points in meters
+        - max_points: raise TooManyPointsError, before allocating them, if
+          there would be more points than this
+
+    Returns:
+        (lng, lat, distance) float64 arrays, distance being along the line
+    """
+    coords = np.asarray(coordinates, dtype=np.float64)[:, :2]
+    cumulative = np.concatenate([[0], np.cumsum(haversine(*coords.T))])
+
+    total = cumulative[-1]
+    if max_points and interval > 0 and np.ceil(total / interval) + 1 > max_points:
+        raise TooManyPointsError(f"More than {max_points} points")
+
+    distance = np.arange(0, total, interval) if interval > 0 else np.array([0.])
+    distance = np.append(distance, total) if total > 0 else distance
+
+    lng = np.interp(distance, cumulative, coords[:, 0])
+    lat = np.interp(distance, cumulative, coords[:, 1])
+    return lng, lat, distance
@@ -1,20 +1,64 @@
+import json
+import os
+import threading
+from collections import deque
+from concurrent import futures
+from functools import partial
+from itertools import islice
+from urllib.parse import urlparse
+from urllib.request import urlopen
+
+import mercantile
 import numpy as np
 import rasterio
 from boto3.session import Session as boto3_session
-from pymartini import decode_ele
+from botocore.exceptions import BotoCoreError, ClientError
+from rasterio.errors import RasterioIOError
+from rasterio.io import MemoryFile
 from rasterio.session import AWSSession
+from rasterio.warp import transform_bounds
+from rio_tiler import constants
 from rio_tiler.io.cogeo import tile as cogeoTiler
+from rio_tiler.reader import part as cogeoPart
 from rio_tiler.utils import mapzen_elevation_rgb
 from rio_tiler_mosaic.methods import defaults
-from rio_tiler_mosaic.mosaic import mosaic_tiler
 
 from cogeo_mosaic.backends import MosaicBackend
-from dem_tiler.utils import _find_geotiff_assets, _find_terrarium_assets
+from dem_tiler.cache import get_mosaic_def, get_mosaic_index, tile_cache
+from dem_tiler.encoding import decode_terrarium, encode_mapbox
+from dem_tiler.utils import (
+    GEOTIFF_MAXZOOM,
+    TERRARIUM_MAXZOOM,
+    _find_geotiff_assets,
+    _find_terrarium_assets,
+)
 
 session = boto3_session()
 s3_client = session.client("s3")
 aws_session = AWSSession(session=session)
 
+# Shared across requests so that warm invocations don't pay for thread startup
+MAX_THREADS = int(os.environ.get("MAX_THREADS", 10))
+executor = futures.ThreadPoolExecutor(max_workers=MAX_THREADS)
+
+# Seconds to wait on HTTP(S) assets before giving up on them
+HTTP_TIMEOUT = float(os.environ.get("HTTP_TIMEOUT", 10))
+
+# Per thread RGB buffer that terrarium PNGs are decoded into before being
+# converted to elevation, so that it isn't reallocated for every tile
+_png_buffer = threading.local()
+
+# Coarser sources for the low zoom tiles of mosaics, as a JSON object of
+# mosaic url to {"url": source, "maxzoom": zoom}, with "*" applying to every
+# mosaic. The source is "terrarium", "geotiff", or the url of a single COG,
+# e.g. a pre-aggregated low resolution DEM.
+OVERVIEW_SOURCES = json.loads(os.environ.get("OVERVIEW_SOURCES") or "{}")
+
+# Tile sizes that AWS Terrain Tiles can be read at, see `find_assets`
+TERRAIN_TILE_SIZES = {
+    "terrarium": (256, 258, 512, 514),
+    "geotiff": (512,)}
+
 PIXSEL_METHODS = {
     "first": defaults.FirstMethod,
     "highest": defaults.HighestMethod,
@@ -23,8 +67,55 @@ PIXSEL_METHODS = {
     "median": defaults.MedianMethod,
     "stdev": defaults.StdevMethod}
 
+# Terrain RGB output encodings, from a 2D elevation array to (3, H, W) uint8
+ENCODERS = {
+    "mapbox": encode_mapbox,
+    "terrarium": mapzen_elevation_rgb}
+
+
+def open_mosaic(mosaic_url):
+    """Open MosaicBackend, reusing the cached mosaic definition when possible
+
+    Args:
+        - mosaic_url: url to MosaicJSON file
+    """
+    return MosaicBackend(mosaic_url, mosaic_def=get_mosaic_def(mosaic_url))
+
+
+def overview_source(mosaic_url, z, tile_size):
+    """Coarser source to read a mosaic's tiles at zoom z from, if any
+
+    Terrain Tiles sources are skipped for tile sizes they can't be read at,
+    e.g. geotiff at 256px, so that those tiles fall back to the mosaic.
+
+    Returns:
+        "terrarium", "geotiff", the url of a single COG, or None to read the
+        mosaic's own assets
+    """
+    if mosaic_url in TERRAIN_TILE_SIZES:
+        return None
+
+    tier = OVERVIEW_SOURCES.get(mosaic_url, OVERVIEW_SOURCES.get("*"))
+    if not tier or z > tier["maxzoom"]:
+        return None
+
+    url = tier["url"]
+    if url in TERRAIN_TILE_SIZES and tile_size not in TERRAIN_TILE_SIZES[url]:
+        return None
+
+    return url
+
+
+def _find_mosaic_assets(x, y, z, mosaic_url):
+    index = get_mosaic_index(mosaic_url)
+    if index is not None:
+        return index.tile(x, y, z)
+
+    with open_mosaic(mosaic_url) as mosaic:
+        return mosaic.tile(x, y, z)
+
 
-def find_assets(x, y, z, mosaic_url, tile_size):
+def find_assets(x, y, z, mosaic_url, tile_size, buffer=0):
     """Find assets for input
 
     Args:
@@ -33,15 +124,110 @@ def find_assets(x, y, z, mosaic_url, tile_size):
         - z: OSM tile index
         - mosaic_url: either url to MosaicJSON file, or the strings "terrarium" or "geotiff" to load terrarium or geotiff tiles from AWS Terrain Tiles
         - tile_size, one of 256, 258, 512, 514
+        - buffer: number of pixels around the tile that will be read. For AWS
+          Terrain Tiles, neighboring tiles are included; for MosaicJSON, the
+          assets of the neighboring quadkeys are added after the tile's own.
+
+    Terrain Tiles assets are a grid of tiles as expected by `backfill_arrays`:
+    the tile, or for 512px terrarium tiles the four 256px tiles of the next
+    zoom, plus the ring of their neighbors when buffered.
+
+    Tiles of mosaics with an overview source (see `OVERVIEW_SOURCES`) at or
+    below its maxzoom are read from that source instead: a single read rather
+    than the overviews of every asset.
     """
+    overview = overview_source(mosaic_url, z, tile_size)
+    if overview in ('terrarium', 'geotiff'):
+        mosaic_url = overview
+    elif overview:
+        return [overview]
+
     if mosaic_url == 'terrarium':
-        return _find_terrarium_assets(x, y, z, tile_size)
+        return _find_terrarium_assets(x, y, z, tile_size, buffer)
 
     if mosaic_url == 'geotiff':
-        return _find_geotiff_assets(x, y, z, tile_size)
+        return _find_geotiff_assets(x, y, z, tile_size, buffer)
 
-    with MosaicBackend(mosaic_url) as mosaic:
-        return mosaic.tile(x, y, z)
+    assets = _find_mosaic_assets(x, y, z, mosaic_url)
+    if not buffer:
+        return assets
+
+    for dx, dy in [(-1, 0), (0, 1), (1, 0), (0, -1), (-1, -1), (1, -1),
+                   (-1, 1), (1, 1)]:
+        if 0 <= x + dx < 2**z and 0 <= y + dy < 2**z:
+            assets.extend(_find_mosaic_assets(x + dx, y + dy, z, mosaic_url))
+
+    return list(dict.fromkeys(assets))
+
+
+def read_asset_bounds(assets):
+    """Read the (west, south, east, north) bounds of COG assets
+
+    Only the COG headers are read, concurrently. Meant to be run once, when
+    building a `QuadkeyIndex`, so that tiles don't read assets that don't
+    intersect them.
+
+    Returns:
+        dict of asset to bounds, without the assets that failed to open
+    """
+
+    def _bounds(asset):
+        try:
+            with rasterio.Env(aws_session):
+                with rasterio.open(asset) as src:
+                    return transform_bounds(src.crs, 'EPSG:4326', *src.bounds)
+        except RasterioIOError:
+            return None
+
+    assets = list(dict.fromkeys(assets))
+    return {
+        asset: bounds
+        for asset, bounds in zip(assets, executor.map(_bounds, assets))
+        if bounds is not None}
+
+
+def tile_availability(mosaic_url):
+    """Tile availability of an input, as used by Cesium's layer.json
+
+    Args:
+        - mosaic_url: either url to MosaicJSON file, or the strings "terrarium" or "geotiff"
+
+    Returns:
+        (bounds, maxzoom, available), where available[z] is a list of
+        inclusive {"startX", "startY", "endX", "endY"} XYZ tile ranges with
+        assets at zoom z, for every zoom from 0 to maxzoom.
+    """
+    if mosaic_url in ('terrarium', 'geotiff'):
+        maxzoom = (
+            TERRARIUM_MAXZOOM if mosaic_url == 'terrarium' else GEOTIFF_MAXZOOM)
+        available = [[{
+            "startX": 0,
+            "startY": 0,
+            "endX": 2**z - 1,
+            "endY": 2**z - 1}] for z in range(maxzoom + 1)]
+        return [-180, -85.0511, 180, 85.0511], maxzoom, available
+
+    with open_mosaic(mosaic_url) as mosaic:
+        meta = mosaic.metadata
+
+    bounds, maxzoom = meta["bounds"], meta["maxzoom"]
+    index = get_mosaic_index(mosaic_url)
+    if index is not None:
+        return bounds, maxzoom, [index.available(z) for z in range(maxzoom + 1)]
+
+    # Without quadkeys, e.g. for DynamoDB mosaics, cover the mosaic bounds
+    available = []
+    for z in range(maxzoom + 1):
+        west, south, east, north = bounds
+        top_left = mercantile.tile(west, north, z)
+        bottom_right = mercantile.tile(east, south, z)
+        available.append([{
+            "startX": max(top_left.x, 0),
+            "startY": max(top_left.y, 0),
+            "endX": min(bottom_right.x, 2**z - 1),
+            "endY": min(bottom_right.y, 2**z - 1)}])
+
+    return bounds, maxzoom, available
 
 
 # tile_size = 258
@@ -59,35 +245,283 @@ def find_assets(x, y, z, mosaic_url, tile_size):
 # center, left, bottom, right, top = arrays
 
 
-def backfill_arrays(center, left=None, bottom=None, right=None, top=None):
-    if left is None or bottom is None or right is None or top is None:
-        return center
+def _read_asset(asset):
+    """Read all bands of an asset, returning None if it doesn't exist"""
+    try:
+        with rasterio.open(asset) as src:
+            return src.read()
+    except RasterioIOError:
+        return None
+
+
+def fetch_bytes(url):
+    """Fetch raw bytes of an S3, HTTP or local file, returning None if missing"""
+    parsed = urlparse(url)
+
+    try:
+        if parsed.scheme == "s3":
+            resp = s3_client.get_object(
+                Bucket=parsed.netloc, Key=parsed.path.strip("/"))
+            return resp["Body"].read()
+
+        if parsed.scheme in ["http", "https"]:
+            with urlopen(url, timeout=HTTP_TIMEOUT) as resp:
+                return resp.read()
+
+        with open(parsed.path if parsed.scheme == "file" else url, 'rb') as f:
+            return f.read()
+
+    except (BotoCoreError, ClientError, OSError):
+        return None
+
+
+def read_png(asset, out=None):
+    """Fetch and decode a PNG from its bytes
+
+    Compared to `rasterio.open(asset)`, this skips the GDAL driver probe and
+    VSI network setup: the bytes are fetched with the shared boto3 client and
+    decoded in memory by the PNG driver.
+
+    Args:
+        - asset: url of the PNG
+        - out: optional uint8 array to decode into, used if it has the shape
+          of the PNG, (bands, H, W)
+
+    Returns a uint8 array of shape (bands, H, W), or None if the asset doesn't
+    exist
+    """
+    buf = fetch_bytes(asset)
+    if buf is None:
+        return None
+
+    with MemoryFile(buf) as memfile:
+        with memfile.open(driver='PNG') as src:
+            shape = (src.count, src.height, src.width)
+            if out is None or out.shape != shape or out.dtype != np.uint8:
+                return src.read()
+
+            return src.read(out=out)
+
+
+def read_assets(assets, reader=_read_asset):
+    """Read assets concurrently
 
-    new_shape = center.shape[0], center.shape[1] + 2, center.shape[2] + 2
-    new_arr = np.zeros(new_shape, center.dtype)
+    Args:
+        - assets: list of asset urls
+        - reader: callable reading a single asset to an array of shape
+          (bands, H, W), returning None if the asset failed to load.
+
+    Returns a list of arrays in the same order as `assets`, with None for any
+    asset that failed to load.
+    """
+    return list(executor.map(reader, assets))
+
+
+def backfill_arrays(arrays, buffer=1):
+    """Stitch a square grid of tiles, with a border of `buffer` pixels
+
+    Args:
+        - arrays: tiles of shape (bands, H, W), row by row from the top left,
+          with None for any tile that failed to load. A single tile, or 2x2
+          tiles, optionally surrounded by a ring of their 8 or 12 neighbors,
+          i.e. a grid of 1, 2, 3 or 4 tiles per side.
+        - buffer: width of the border read from the ring of neighbors, up to
+          the tile size
+
+    Tiles are copied by slices into a single preallocated array. Missing
+    neighbors, including corners, repeat the nearest edge pixels of the inner
+    tiles instead. A single tile is returned as-is.
+
+    Returns an array of shape (bands, n * H + 2 * buffer, n * W + 2 * buffer),
+    n being the number of inner tiles per side, or None if an inner tile is
+    missing.
+    """
+    grid = int(round(len(arrays)**0.5))
+    tiles = 2 - grid % 2
+    ring = (grid - tiles) // 2
+
+    inner = [
+        arrays[row * grid + col]
+        for row in range(ring, ring + tiles) for col in range(ring, ring + tiles)]
+    if any(arr is None for arr in inner):
+        return None
+
+    if len(arrays) == 1:
+        return inner[0]
+
+    bands, size, _ = inner[0].shape
+    b = buffer if ring else 0
+    out_size = tiles * size + 2 * b
+    out = np.empty((bands, out_size, out_size), inner[0].dtype)
+
+    # Pixel offset of the output within the grid
+    origin = ring * size - b
+    missing = []
+    for i, arr in enumerate(arrays):
+        row, col = divmod(i, grid)
+        top, left = row * size - origin, col * size - origin
+        r0, r1 = max(top, 0), min(top + size, out_size)
+        c0, c1 = max(left, 0), min(left + size, out_size)
+        if r0 >= r1 or c0 >= c1:
+            continue
+
+        if arr is None:
+            missing.append((r0, r1, c0, c1))
+            continue
+
+        out[:, r0:r1, c0:c1] = arr[:, r0 - top:r1 - top, c0 - left:c1 - left]
+
+    for r0, r1, c0, c1 in missing:
+        rows = np.clip(np.arange(r0, r1), b, out_size - b - 1)
+        cols = np.clip(np.arange(c0, c1), b, out_size - b - 1)
+        out[:, r0:r1, c0:c1] = out[:, rows[:, None], cols]
+
+    return out
+
+
+def _load_elevation(asset, input_format):
+    """Load elevation of a single AWS Terrain Tiles asset through the tile cache"""
+    key = (asset, )
+    data = tile_cache.get(key)
+    if data is not None:
+        return data
+
+    if input_format == 'terrarium':
+        rgb = read_png(asset, out=getattr(_png_buffer, 'rgb', None))
+        if rgb is None:
+            return None
+
+        _png_buffer.rgb = rgb
+        data = decode_terrarium(rgb)
+    else:
+        data = _read_asset(asset)
+        if data is None:
+            return None
+
+        data = data.astype(np.float32)
+
+    return tile_cache.set(key, data)
+
+
+def read_elevation(assets, input_format):
+    """Load elevation of AWS Terrain Tiles assets concurrently
+
+    Decoded float32 arrays of shape (1, H, W) are cached per asset, so that
+    neighboring buffered tiles and different endpoints share source tiles.
+    Returns a list in the same order as `assets`, with None for any asset that
+    failed to load.
+    """
+    return list(
+        executor.map(
+            lambda asset: _load_elevation(asset, input_format), assets))
+
+
+def buffered_tiler(
+        address, tile_x, tile_y, tile_z, tilesize=256, buffer=0, **kwargs):
+    """Read a mercator tile with a border of `buffer` pixels from a COG
 
-    # Copy center into center of new array
-    np.copyto(new_arr[:, 1:-1, 1:-1], center)
+    Same as `rio_tiler.io.cogeo.tile`, except that the tile bounds are
+    expanded by `buffer` pixels on each side, and the output has shape
+    (bands, tilesize + 2 * buffer, tilesize + 2 * buffer).
+    """
+    left, bottom, right, top = mercantile.xy_bounds(tile_x, tile_y, tile_z)
+    pad = buffer * (right - left) / tilesize
+    bounds = (left - pad, bottom - pad, right + pad, top + pad)
+    size = tilesize + 2 * buffer
+
+    with rasterio.open(address) as src_dst:
+        return cogeoPart(
+            src_dst,
+            bounds,
+            size,
+            size,
+            dst_crs=constants.WEB_MERCATOR_CRS,
+            **kwargs)
+
+
+def mosaic_reader(assets, x, y, z, tiler, pixel_selection, **kwargs):
+    """Read a tile from mosaic assets concurrently, with the shared executor
+
+    Same as `rio_tiler_mosaic.mosaic.mosaic_tiler`, without starting a new
+    thread pool for each chunk of assets. Tiles are fed to `pixel_selection`
+    in asset order. For methods that exit once the tile is filled, like
+    `first`, at most `MAX_THREADS` reads are in flight, and reads that haven't
+    started yet are cancelled once the tile is filled. Other methods submit
+    all reads at once.
+
+    Returns:
+        (tile, mask) from `pixel_selection.data`
+    """
+
+    def _read(asset):
+        with rasterio.Env(aws_session):
+            return tiler(asset, x, y, z, **kwargs)
+
+    window = MAX_THREADS if pixel_selection.exit_when_filled else len(assets)
+    remaining = iter(assets)
+    pending = deque(executor.submit(_read, asset)
+                    for asset in islice(remaining, window))
+
+    try:
+        while pending:
+            future = pending.popleft()
+            for asset in islice(remaining, 1):
+                pending.append(executor.submit(_read, asset))
+
+            # Like mosaic_tiler, assets that fail to read are skipped
+            try:
+                tile, mask = future.result()
+            except Exception:
+                continue
 
-    # fill left
-    new_arr[:, 1:-1, :1] = left[:, :, -1:]
+            tile = np.ma.array(tile)
+            tile.mask = mask == 0
+            pixel_selection.feed(tile)
+            if pixel_selection.is_done:
+                break
 
-    # fill right
-    new_arr[:, 1:-1, -1:] = right[:, :, :1]
+    finally:
+        for future in pending:
+            future.cancel()
+
+    return pixel_selection.data
+
+
+def _mosaic_elevation(
+        x,
+        y,
+        z,
+        assets,
+        tile_size,
+        pixel_selection,
+        resampling_method,
+        buffer=0):
+    """Load elevation from COG assets through the tile cache"""
+    key = (
+        tuple(assets), x, y, z, tile_size, pixel_selection, resampling_method,
+        buffer)
+    data = tile_cache.get(key)
+    if data is not None:
+        return data
 
-    # fill bottom
-    new_arr[:, -1:, 1:-1] = bottom[:, :1, :]
+    tiler = partial(buffered_tiler, buffer=buffer) if buffer else cogeoTiler
 
-    # fill top
-    new_arr[:, :1, 1:-1] = top[:, -1:, :]
+    pixsel_method = PIXSEL_METHODS[pixel_selection]
+    data, _ = mosaic_reader(
+        assets,
+        x,
+        y,
+        z,
+        tiler,
+        pixsel_method(),
+        tilesize=tile_size,
+        resampling_method=resampling_method,
+    )
 
-    # fill corners. For now just backfill diagonally
-    new_arr[:, 0, 0] = new_arr[:, 1, 1]
-    new_arr[:, -1, 0] = new_arr[:, -2, 1]
-    new_arr[:, 0, -1] = new_arr[:, 1, -2]
-    new_arr[:, -1, -1] = new_arr[:, -2, -2]
+    if data is None:
+        return None
 
-    return new_arr
+    return tile_cache.set(key, data[:1].astype(np.float32))
 
 
 def load_assets(
@@ -100,36 +534,53 @@ def load_assets(
         output_format: str = None,
         backfill: bool = False,
         pixel_selection: str = 'first',
-        resampling_method: str = "nearest"):
+        resampling_method: str = "nearest",
+        buffer: int = 0):
+    """Load elevation for a tile
 
-    if input_format == 'terrarium':
-        arrays = [rasterio.open(asset).read() for asset in assets]
-        backfilled = backfill_arrays(*arrays)
-
-        if output_format == 'terrarium':
-            return backfilled
+    Returns a (3, H, W) uint8 array when `output_format` is one of `ENCODERS`.
+    Otherwise returns a 2D float32 elevation array, transposed to (x, y) order
+    like `pymartini.decode_ele`. If `backfill` is True, the bottom and right
+    edges are repeated, as needed by Martini for a grid of size 2^n + 1.
+    If `buffer` is set, the tile includes a border of `buffer` pixels read
+    from the neighbors found by `find_assets(..., buffer=buffer)`.
+    Returns None if the tile has no data.
+    """
+    # Same routing as find_assets
+    overview = overview_source(input_format, z, tile_size)
+    if overview in ('terrarium', 'geotiff'):
+        input_format = overview
 
-        data = decode_ele(backfilled, 'terrarium', backfill=backfill)
+    if input_format == 'terrarium' and output_format == 'terrarium':
+        # Passthrough without decoding
+        return backfill_arrays(
+            read_assets(assets, read_png), buffer=max(buffer, 1))
 
-    elif input_format == 'geotiff':
-        arrays = [rasterio.open(asset).read() for asset in assets]
-        data = backfill_arrays(*arrays)
+    if input_format in ['terrarium', 'geotiff']:
+        data = backfill_arrays(
+            read_elevation(assets, input_format), buffer=max(buffer, 1))
+        if data is None:
+            return None
 
     else:
-        with rasterio.Env(aws_session):
-            pixsel_method = PIXSEL_METHODS[pixel_selection]
-            data, _ = mosaic_tiler(
-                assets,
-                x,
-                y,
-                z,
-                cogeoTiler,
-                tilesize=tile_size,
-                pixel_selection=pixsel_method(),
-                resampling_method=resampling_method,
-            )
-
-    if output_format == 'terrarium':
-        return mapzen_elevation_rgb(data)
-
-    return data
+        data = _mosaic_elevation(
+            x,
+            y,
+            z,
+            assets,
+            tile_size,
+            pixel_selection,
+            resampling_method,
+            buffer=buffer)
+        if data is None:
+            return None
+
+    data = data[0]
+
+    if output_format in ENCODERS:
+        return ENCODERS[output_format](data)
+
+    if backfill:
+        data = np.pad(data, ((0, 1), (0, 1)), mode='edge')
+
+    return data.T
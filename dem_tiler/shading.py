@@ -0,0 +1,103 @@
+"""dem_tiler.shading: slope and hillshade of elevation tiles."""
+
+from typing import Tuple
+
+import mercantile
+import numpy as np
+
+# Radius of the web mercator sphere
+MERCATOR_RADIUS = 6378137.0
+
+# Light azimuths of multidirectional hillshade, in degrees clockwise from north
+MULTIDIRECTIONAL_AZIMUTHS = (225, 270, 315, 360)
+
+
+def ground_resolution(x: int, y: int, z: int, tile_size: int) -> np.ndarray:
+    """Ground size of a tile's pixels in meters, at the latitude of each row
+
+    Returns:
+        float64 array of shape (tile_size, 1), from the north row to the south
+    """
+    west, south, east, north = mercantile.xy_bounds(x, y, z)
+    pixel_size = (east - west) / tile_size
+    rows = north - (np.arange(tile_size) + 0.5) * pixel_size
+
+    # Mercator scale factor: cos(lat) == 1 / cosh(y / R)
+    return (pixel_size / np.cosh(rows / MERCATOR_RADIUS))[:, None]
+
+
+def horn_gradient(elevation: np.ndarray,
+                  resolution: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """Horn's method gradients of an elevation raster
+
+    Args:
+        - elevation: 2D array, with row 0 to the north, and a 1 pixel border
+          around the output area
+        - resolution: ground pixel size in meters, scalar or broadcastable to
+          the output
+
+    Returns:
+        (dz/dx, dz/dy) of shape elevation.shape - 2, with x to the east and y
+        to the north
+    """
+    e = elevation.astype(np.float64, copy=False)
+    nw, n, ne = e[:-2, :-2], e[:-2, 1:-1], e[:-2, 2:]
+    w, east = e[1:-1, :-2], e[1:-1, 2:]
+    sw, s, se = e[2:, :-2], e[2:, 1:-1], e[2:, 2:]
+
+    dx = ((ne + 2 * east + se) - (nw + 2 * w + sw)) / (8 * resolution)
+    dy = ((nw + 2 * n + ne) - (sw + 2 * s + se)) / (8 * resolution)
+    return dx, dy
+
+
+def slope(elevation: np.ndarray, resolution: np.ndarray,
+          z_factor: float = 1) -> np.ndarray:
+    """Slope in degrees of a buffered elevation raster, see `horn_gradient`"""
+    dx, dy = horn_gradient(elevation, resolution)
+    return np.degrees(np.arctan(z_factor * np.hypot(dx, dy))).astype(
+        np.float32)
+
+
+def _illumination(dx, dy, azimuth, altitude):
+    az, alt = np.radians(azimuth), np.radians(altitude)
+    return (
+        np.sin(alt) - dx * np.sin(az) * np.cos(alt) -
+        dy * np.cos(az) * np.cos(alt)) / np.sqrt(1 + dx**2 + dy**2)
+
+
+def hillshade(
+        elevation: np.ndarray,
+        resolution: np.ndarray,
+        azimuth: float = 315,
+        altitude: float = 45,
+        z_factor: float = 1,
+        multidirectional: bool = False) -> np.ndarray:
+    """Hillshade of a buffered elevation raster, see `horn_gradient`
+
+    Multidirectional shading combines lights from `MULTIDIRECTIONAL_AZIMUTHS`,
+    each weighted by how oblique it is to the aspect of the slope (Mark,
+    1992), which keeps detail on slopes facing away from any single light.
+
+    Returns:
+        uint8 array, 0 for unlit and 255 for fully lit
+    """
+    dx, dy = horn_gradient(elevation, resolution)
+    dx, dy = dx * z_factor, dy * z_factor
+
+    if not multidirectional:
+        shade = _illumination(dx, dy, azimuth, altitude)
+
+    else:
+        # Aspect: downslope direction, clockwise from north
+        aspect = np.arctan2(-dx, -dy)
+        shade = np.zeros(dx.shape)
+        total = 0
+        for light in MULTIDIRECTIONAL_AZIMUTHS:
+            weight = np.sin(aspect - np.radians(light))**2
+            shade += weight * np.clip(
+                _illumination(dx, dy, light, altitude), 0, None)
+            total += weight
+
+        shade /= total
+
+    return np.round(255 * np.clip(shade, 0, 1)).astype(np.uint8)
@@ -5,38 +5,67 @@ from urllib.parse import urlparse
 from boto3.session import Session as boto3_session
 from botocore.exceptions import ClientError
 
+# Max zoom levels of AWS Terrain Tiles
+TERRARIUM_MAXZOOM = 15
+GEOTIFF_MAXZOOM = 14
 
-def _find_terrarium_assets(x, y, z, tile_size):
+
+def _neighbor_assets(base_url, x, y, z, ext):
+    # The tile and its 8 neighbors, row by row from the top left. Columns
+    # wrap around the antimeridian.
+    return [
+        f'{base_url}/{z}/{(x + dx) % 2**z}/{y + dy}.{ext}'
+        for dy in (-1, 0, 1) for dx in (-1, 0, 1)]
+
+
+def _child_assets(base_url, x, y, z, ext, buffer=0):
+    # The four children at z + 1, row by row from the top left. With a
+    # buffer, the ring of their neighbors is included too, as a 4x4 grid.
+    ring = 1 if buffer else 0
+    return [
+        f'{base_url}/{z + 1}/{(2 * x + dx) % 2**(z + 1)}/{2 * y + dy}.{ext}'
+        for dy in range(-ring, 2 + ring) for dx in range(-ring, 2 + ring)]
+
+
+def _find_terrarium_assets(x, y, z, tile_size, buffer=0):
     # Terrarium has a max zoom level of 15, each tile is 256px
-    if z >= 16:
+    if z > TERRARIUM_MAXZOOM:
         return None
 
     base_url = 's3://elevation-tiles-prod/terrarium'
 
+    # A 258px or 514px tile is a 256px or 512px tile with a 1px buffer
+    if tile_size in (258, 514):
+        tile_size, buffer = tile_size - 2, max(buffer, 1)
+
     if tile_size == 256:
+        if buffer:
+            return _neighbor_assets(base_url, x, y, z, 'png')
+
         return [f'{base_url}/{z}/{x}/{y}.png']
 
-    if tile_size == 258:
-        # center, left, bottom, right, top
-        return [
-            f'{base_url}/{z}/{x}/{y}.png',
-            f'{base_url}/{z}/{x - 1}/{y}.png',
-            f'{base_url}/{z}/{x}/{y + 1}.png',
-            f'{base_url}/{z}/{x + 1}/{y}.png',
-            f'{base_url}/{z}/{x}/{y - 1}.png']
+    # A 512px tile is stitched from the 256px tiles of the next zoom
+    if tile_size == 512:
+        if z + 1 > TERRARIUM_MAXZOOM:
+            return None
+
+        return _child_assets(base_url, x, y, z, 'png', buffer)
 
     raise NotImplementedError(f'tile_size {tile_size} not implemented')
 
 
-def _find_geotiff_assets(x, y, z, tile_size):
+def _find_geotiff_assets(x, y, z, tile_size, buffer=0):
     # AWS GeoTIFF tiles have a max zoom level of 14, each tile is 512px
-    if z >= 15:
+    if z > GEOTIFF_MAXZOOM:
         return None
 
     base_url = 's3://elevation-tiles-prod/geotiff'
 
     if tile_size == 512:
-        return [f'{base_url}/{z}/{x}/{y}.png']
+        if buffer:
+            return _neighbor_assets(base_url, x, y, z, 'tif')
+
+        return [f'{base_url}/{z}/{x}/{y}.tif']
 
     raise NotImplementedError(f'tile_size {tile_size} not implemented')
 
@@ -6,6 +6,7 @@ from setuptools import find_packages, setup
 # NOTE: there were breaking changes in cogeo-mosaic and rio-tiler between these
 # alpha releases and 3.0 and 2.0
 inst_reqs = [
+    "attrs",
     "cogeo-mosaic==3.0a1",
     # the GDAL C library is installed separately;
     # This is specifically for the Python GDAL bindings, used to create contours
@@ -13,7 +14,7 @@ inst_reqs = [
     "lambda-proxy~=5.2",
     "pymartini>=0.3.0",
     "pydelatin>=0.2.0",
-    "quantized-mesh-encoder>=0.1.2",
+    "quantized-mesh-encoder>=0.3.0",
     "rio-color",
     "rio-tiler==2.0a9",
 ]
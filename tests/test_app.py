@@ -8,6 +8,7 @@ import urllib
 from typing import Any
 from unittest.mock import patch
 
+import numpy as np
 import pytest
 
 from cogeo_mosaic.backends.file import FileBackend
@@ -370,6 +371,92 @@ def test_geojson_MissingUrl(backend, app, event):
     backend.assert_not_called()
 
 
+@patch("dem_tiler.handlers.app.mosaic_quadkeys")
+def test_geojson(mosaic_quadkeys, app, event):
+    """Test /geojson route."""
+    mosaic_quadkeys.side_effect = lambda url, bbox=None, zoom=None: iter(
+        [("0302", ["a.tif"]), ("0303", ["a.tif", "b.tif"])]
+    )
+
+    event["path"] = "/geojson"
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", bbox="-106,39,-105,40", zoom="2"
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "application/json"
+    body = json.loads(res["body"])
+    assert body["type"] == "FeatureCollection"
+    assert len(body["features"]) == 2
+    mosaic_quadkeys.assert_called_with(
+        "s3://my-bucket/mymosaic.json", bbox=[-106, 39, -105, 40], zoom=2
+    )
+
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", output_format="ndjson"
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "application/x-ndjson"
+    features = [json.loads(line) for line in res["body"].splitlines()]
+    assert [f["properties"]["files"] for f in features] == [
+        ["a.tif"],
+        ["a.tif", "b.tif"],
+    ]
+
+    mosaic_quadkeys.reset_mock()
+    for bbox in ["-106,39,-105", "a,b,c,d"]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", bbox=bbox
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "bbox must be west,south,east,north"
+
+    for zoom in ["-1", "1.5", "a"]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", zoom=zoom
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "zoom must be a non-negative integer"
+
+    for params in [
+        dict(zoom="2"),
+        dict(zoom="2", bbox="-106,39,-105,40", simplify="true"),
+    ]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", **params
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "zoom requires bbox, and doesn't apply with simplify"
+
+    for params in [
+        dict(offset="-1"),
+        dict(limit="0"),
+        dict(limit="10001"),
+        dict(limit="a"),
+    ]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", **params
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "offset must be >= 0 and limit between 1 and 10000"
+    mosaic_quadkeys.assert_not_called()
+
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", offset="1", limit="1"
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    body = json.loads(res["body"])
+    assert [f["properties"]["files"] for f in body["features"]] == [
+        ["a.tif", "b.tif"]
+    ]
+
+
 @patch("dem_tiler.handlers.app.MosaicBackend")
 def test_tilejson(backend, app, event):
     """Test /tilejson.json route."""
@@ -439,6 +526,35 @@ def test_tilejson(backend, app, event):
     assert qs["url"][0] == "s3://my-bucket/mymosaic.json"
 
 
+@patch("dem_tiler.handlers.app.open_mosaic")
+@patch("dem_tiler.handlers.app.coverage_bounds")
+@patch("dem_tiler.handlers.app.get_mosaic_metadata")
+def test_tilejson_bounds(get_mosaic_metadata, coverage_bounds, open_mosaic, app, event):
+    """Test /tilejson.json bounds, from cached metadata."""
+    get_mosaic_metadata.return_value = dict(
+        bounds=[-105.5, 39.2, -104.1, 40.7],
+        center=[-104.8, 39.95, 7],
+        minzoom=7,
+        maxzoom=12,
+    )
+    coverage_bounds.return_value = [-106.875, 39.0, -104.0625, 40.5]
+
+    event["path"] = "/tilejson.json"
+    event["queryStringParameters"] = dict(url="s3://my-bucket/mymosaic.json")
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    body = json.loads(res["body"])
+    assert body["bounds"] == [-105.5, 39.2, -104.1, 40.5]
+    assert body["center"] == [-104.8, 39.95, 7]
+    assert (body["minzoom"], body["maxzoom"]) == (7, 12)
+    open_mosaic.assert_not_called()
+
+    # Mosaics without coverage keep their own bounds
+    coverage_bounds.return_value = None
+    res = app(event, {})
+    assert json.loads(res["body"])["bounds"] == [-105.5, 39.2, -104.1, 40.7]
+
+
 @patch("dem_tiler.handlers.app.MosaicBackend")
 def test_tilejson_mosaicid(backend, app, event):
     """Test /tilejson.json route."""
@@ -716,6 +832,102 @@ def test_API_MVTtiles(backend, app, event):
     assert res["body"]
 
 
+@patch("dem_tiler.handlers.app.encode_layer")
+@patch("dem_tiler.handlers.app.create_contour")
+@patch("dem_tiler.handlers.app.load_assets")
+@patch("dem_tiler.handlers.app.find_assets")
+def test_API_contour(find_assets, load_assets, create_contour, encode_layer, app, event):
+    """Test /contour routes."""
+    find_assets.return_value = ["s3://my-bucket/dem.tif"]
+    load_assets.return_value = np.zeros((256, 256), dtype=np.float32)
+    line = np.array([[0.0, 0.0], [128.0, 128.0]])
+    create_contour.return_value = [
+        (i, ele, line) for i, ele in enumerate([10.0, 50.0, 100.0, 150.0])
+    ]
+    layers = []
+    encode_layer.side_effect = lambda name, features: layers.append(
+        [properties for _, _, properties in features]
+    ) or b""
+
+    event["path"] = "/contour/9/150/182"
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", intervals="10,100", major_every="5"
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    assert res["headers"]["Content-Type"] == "application/x-protobuf"
+    # Levels are 10, 50 and 100, from one pass at the finest interval
+    assert create_contour.call_args[0][1] == 10
+    assert layers == [
+        [
+            {"ele": 10.0, "level": 0},
+            {"ele": 50.0, "level": 1},
+            {"ele": 100.0, "level": 2},
+            {"ele": 150.0, "level": 1},
+        ]
+    ]
+
+    create_contour.reset_mock()
+    for params in [dict(interval="0"), dict(intervals="0,10"), dict(intervals="-5,10")]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", **params
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "intervals must be positive"
+
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", intervals="10,25"
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 400
+    assert res["body"] == "intervals must be multiples of the smallest interval"
+
+    for params in [dict(interval="a"), dict(intervals="10,a"), dict(intervals="nan")]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", **params
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "intervals must be numbers"
+
+    for major_every in ["0", "-2", "1.5", "a"]:
+        event["queryStringParameters"] = dict(
+            url="s3://my-bucket/mymosaic.json", major_every=major_every
+        )
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "major_every must be a positive integer"
+    create_contour.assert_not_called()
+
+
+@patch("dem_tiler.handlers.app.load_assets")
+@patch("dem_tiler.handlers.app.find_assets")
+def test_API_terrain_tile_size(find_assets, load_assets, app, event):
+    """Test tile sizes that AWS Terrain Tiles can't be read at."""
+    find_assets.return_value = ["s3://elevation-tiles-prod/geotiff/9/150/182.tif"]
+    load_assets.return_value = None
+
+    event["queryStringParameters"] = dict(url="geotiff")
+    for path in ["/hillshade/9/150/182.png", "/slope/9/150/182.png", "/contour/9/150/182"]:
+        event["path"] = path
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "geotiff tiles can't be 256px"
+    find_assets.assert_not_called()
+
+    event["path"] = "/hillshade/9/150/182@2x.png"
+    res = app(event, {})
+    assert res["statusCode"] == 204
+    find_assets.assert_called_once_with(150, 182, 9, "geotiff", 512, buffer=1)
+
+    event["path"] = "/rgb/9/150/182.png"
+    event["queryStringParameters"] = dict(url="terrarium", tile_size="64")
+    res = app(event, {})
+    assert res["statusCode"] == 400
+    assert res["body"] == "terrarium tiles can't be 64px"
+
+
 @patch("dem_tiler.handlers.app.MosaicBackend")
 def test_API_points(backend, app, event):
     """Test /point routes."""
@@ -734,6 +946,50 @@ def test_API_points(backend, app, event):
     assert len(body["values"]) == 2
 
 
+@patch("dem_tiler.handlers.app.sample_points")
+def test_API_profile(sample_points, app, event):
+    """Test /profile route."""
+    sample_points.side_effect = lambda url, lng, lat: np.zeros(len(lng))
+
+    event["path"] = "/profile"
+    event["httpMethod"] = "POST"
+    event["queryStringParameters"] = dict(
+        url="s3://my-bucket/mymosaic.json", interval="100"
+    )
+    event["body"] = json.dumps(
+        {"type": "LineString", "coordinates": [[0, 0], [0, 0.01, 5]]}
+    )
+    res = app(event, {})
+    assert res["statusCode"] == 200
+    body = json.loads(res["body"])
+    assert len(body["distance"]) == 13
+    assert body["elevation"] == [0] * 13
+
+    for coordinates, message in [
+        ([[0, 0], ["a", 0]], "Invalid LineString"),
+        ([[0, 0], [[0, 1], [1, 0]]], "Invalid LineString"),
+        ([[0, 0]], "A LineString of 2 or more points is required"),
+        ([[0, 0], [0, "nan"]], "Coordinates must be finite numbers"),
+    ]:
+        event["body"] = json.dumps(coordinates)
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == message
+
+    event["body"] = json.dumps([[0, 0], [0, 1]])
+    for interval in ["0", "-1", "a"]:
+        event["queryStringParameters"]["interval"] = interval
+        res = app(event, {})
+        assert res["statusCode"] == 400
+        assert res["body"] == "interval must be a positive number"
+
+    event["queryStringParameters"]["interval"] = "1"
+    res = app(event, {})
+    assert res["statusCode"] == 400
+    assert res["body"] == "At most 10000 points allowed"
+    sample_points.assert_called_once()
+
+
 @patch("dem_tiler.handlers.app.MosaicBackend")
 def test_API_tilesCustomCmap(backend, app, event):
     """Test /tiles routes."""
@@ -0,0 +1,140 @@
+"""tests dem_tiler.cache."""
+
+import os
+from unittest.mock import patch
+
+import numpy as np
+
+from cogeo_mosaic.mosaic import MosaicJSON
+from dem_tiler import cache
+from dem_tiler.cache import (
+    ArrayCache,
+    LRUCache,
+    get_mosaic_def,
+    get_mosaic_metadata,
+)
+
+asset1 = os.path.join(os.path.dirname(__file__), "fixtures", "cog1.tif")
+asset2 = os.path.join(os.path.dirname(__file__), "fixtures", "cog2.tif")
+mosaic_content = MosaicJSON.from_urls([asset1, asset2])
+
+
+class MosaicMock:
+    """Mock."""
+
+    calls = 0
+
+    def __init__(self, *args, **kwargs):
+        """Count reads."""
+        MosaicMock.calls += 1
+        self.mosaic_def = mosaic_content
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+def test_lru_eviction():
+    """Least recently used entries are evicted first."""
+    lru = LRUCache(3)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.set("c", 3)
+    assert lru.get("a") == 1
+    lru.set("d", 4)
+    assert "b" not in lru
+    assert "a" in lru
+    assert len(lru) == 3
+    assert lru.get("b") is None
+    assert lru.stats()["hits"] == 1
+    assert lru.stats()["misses"] == 1
+
+
+def test_lru_size_bound():
+    """Cache is bounded by the total size of its values."""
+    lru = LRUCache(10, getsizeof=len)
+    lru.set("a", "aaaa")
+    lru.set("b", "bbbb")
+    lru.set("c", "cccc")
+    assert "a" not in lru
+    assert lru.currsize == 8
+
+    # Values larger than the cache are not stored
+    lru.set("d", "d" * 11)
+    assert "d" not in lru
+    assert lru.currsize == 8
+
+
+@patch("dem_tiler.cache._get_validator")
+@patch("dem_tiler.cache.MosaicBackend")
+def test_get_mosaic_def(backend, validator):
+    """Mosaic definitions are cached and revalidated after the ttl."""
+    backend.side_effect = MosaicMock
+    validator.return_value = '"etag1"'
+    cache._mosaic_cache.clear()
+    MosaicMock.calls = 0
+
+    url = "s3://my-bucket/mymosaic.json"
+    assert get_mosaic_def(url) is mosaic_content
+    assert get_mosaic_def(url) is mosaic_content
+    assert MosaicMock.calls == 1
+
+    # Expired but unchanged: revalidated without re-reading
+    assert get_mosaic_def(url, ttl=0) is mosaic_content
+    assert MosaicMock.calls == 1
+
+    # Expired and changed: re-read
+    validator.return_value = '"etag2"'
+    assert get_mosaic_def(url, ttl=0) is mosaic_content
+    assert MosaicMock.calls == 2
+
+    # DynamoDB mosaics are never cached
+    assert get_mosaic_def("dynamodb:///mymosaic") is None
+
+
+@patch("dem_tiler.cache._get_validator")
+@patch("dem_tiler.cache.MosaicBackend")
+def test_get_mosaic_metadata(backend, validator):
+    """Metadata outlives the cached definition."""
+    backend.side_effect = MosaicMock
+    validator.return_value = '"etag1"'
+    cache._mosaic_cache.clear()
+    cache._metadata_cache.clear()
+    MosaicMock.calls = 0
+
+    url = "s3://my-bucket/mymosaic.json"
+    meta = get_mosaic_metadata(url)
+    assert "tiles" not in meta
+    assert meta["bounds"] == list(mosaic_content.bounds)
+
+    cache._mosaic_cache.clear()
+    assert get_mosaic_metadata(url) is meta
+    assert MosaicMock.calls == 1
+
+    # DynamoDB metadata is read from the backend
+    assert get_mosaic_metadata("dynamodb:///mymosaic")["minzoom"] == (
+        mosaic_content.minzoom)
+    assert MosaicMock.calls == 2
+
+
+def test_array_cache(tmpdir):
+    """Arrays are cached in memory and on disk."""
+    arr_cache = ArrayCache(1000, cache_dir=str(tmpdir), max_disk_size=2000)
+    arr = arr_cache.set("a", np.zeros(100, dtype=np.float32))
+    assert not arr.flags.writeable
+    assert arr_cache.get("a") is arr
+
+    # Evicted from memory, but still on disk
+    arr_cache.set("b", np.ones(200, dtype=np.float32))
+    assert "a" not in arr_cache.memory
+    np.testing.assert_array_equal(arr_cache.get("a"), np.zeros(100))
+    assert arr_cache.stats()["disk_hits"] == 1
+
+    # Disk tier is pruned to its max size
+    for i in range(5):
+        arr_cache.set(i, np.ones(100, dtype=np.float32))
+    assert arr_cache.stats()["disk_size"] <= 2000
+    assert arr_cache.get("missing") is None
+    assert arr_cache.stats()["disk_misses"] == 1
@@ -0,0 +1,51 @@
+"""tests dem_tiler.colormap."""
+
+import numpy as np
+import pytest
+
+from dem_tiler.colormap import (
+    COLORMAPS,
+    LUT_SIZE,
+    apply_colormap,
+    get_lut,
+    parse_color,
+    parse_colormap,
+)
+
+
+def test_parse_colormap():
+    """Named ramps and user stops."""
+    assert parse_color("#ff8000") == (255, 128, 0, 255)
+    assert parse_color("ff800080") == (255, 128, 0, 128)
+
+    stops = parse_colormap("1000:ffffff,0:000000")
+    assert stops == ((0, (0, 0, 0, 255)), (1000, (255, 255, 255, 255)))
+
+    stops = parse_colormap("grayscale", "100,300")
+    assert [elevation for elevation, _ in stops] == [100, 300]
+
+    assert len(parse_colormap("earth")) == len(COLORMAPS["earth"])
+
+    for value in ["viridis", "0:000000", "0:000000,10:fff", "0-000000,1-ffffff"]:
+        with pytest.raises(ValueError):
+            parse_colormap(value)
+
+
+def test_apply_colormap():
+    """Colors are interpolated between stops, and clamped outside."""
+    stops = parse_colormap("0:000000,100:ff000000,200:ffffff")
+    lut = get_lut(stops)
+    assert lut.shape == (4, LUT_SIZE)
+    assert get_lut(stops) is lut
+
+    elevation = np.array([[-50, 0, 50], [100, 150, 1000]], dtype=np.float32)
+    rgba = apply_colormap(elevation, stops)
+    assert rgba.shape == (4, 2, 3)
+    assert rgba.dtype == np.uint8
+
+    np.testing.assert_array_equal(rgba[:, 0, 0], [0, 0, 0, 255])
+    np.testing.assert_array_equal(rgba[:, 0, 1], [0, 0, 0, 255])
+    np.testing.assert_array_equal(rgba[:, 1, 0], [255, 0, 0, 0])
+    np.testing.assert_array_equal(rgba[:, 1, 2], [255, 255, 255, 255])
+    np.testing.assert_allclose(rgba[:, 0, 2], [128, 0, 0, 255 - 128], atol=1)
+    np.testing.assert_allclose(rgba[:, 1, 1], [255, 128, 128, 128], atol=1)
@@ -0,0 +1,40 @@
+"""tests dem_tiler.encoding."""
+
+import numpy as np
+from pymartini import decode_ele
+
+from dem_tiler.encoding import decode_terrarium, encode_mapbox
+
+
+def test_decode_terrarium():
+    """Decoding matches pymartini in float32."""
+    rng = np.random.default_rng(0)
+    rgb = rng.integers(0, 256, size=(3, 32, 32), dtype=np.uint8)
+
+    elevation = decode_terrarium(rgb)
+    assert elevation.shape == (1, 32, 32)
+    assert elevation.dtype == np.float32
+    np.testing.assert_array_equal(
+        elevation[0], decode_ele(rgb, "terrarium", backfill=False).T)
+
+    out = np.empty((1, 32, 32), dtype=np.float32)
+    assert decode_terrarium(rgb.transpose(1, 2, 0), out=out, channels_last=True) is out
+    np.testing.assert_array_equal(out, elevation)
+
+
+def test_encode_mapbox():
+    """Encoding round-trips through pymartini's mapbox decoder."""
+    elevation = np.array([[-10000, 0], [8848.04, -432.1]], dtype=np.float32)
+
+    rgb = encode_mapbox(elevation)
+    assert rgb.shape == (3, 2, 2)
+    assert rgb.dtype == np.uint8
+    np.testing.assert_array_equal(rgb[:, 0, 0], [0, 0, 0])
+    np.testing.assert_array_equal(rgb[:, 0, 1], [1, 134, 160])
+    np.testing.assert_allclose(
+        decode_ele(rgb, "mapbox", backfill=False).T, elevation, atol=0.05)
+
+    # Out of range values are clipped
+    rgb = encode_mapbox(np.array([[-20000, 1e7]]))
+    np.testing.assert_array_equal(rgb[:, 0, 0], [0, 0, 0])
+    np.testing.assert_array_equal(rgb[:, 0, 1], [255, 255, 255])
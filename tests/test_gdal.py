@@ -0,0 +1,16 @@
+"""tests dem_tiler.gdal."""
+
+from dem_tiler.gdal import contour_level, is_multiple
+
+
+def test_contour_level():
+    """Contours are tagged with the coarsest interval they fall on."""
+    intervals = [10, 50, 100]
+    assert contour_level(120, intervals) == 0
+    assert contour_level(150, intervals) == 1
+    assert contour_level(200, intervals) == 2
+    assert contour_level(-50, intervals) == 1
+    assert contour_level(55, intervals, offset=5) == 1
+
+    assert is_multiple(0.3, 0.1)
+    assert not is_multiple(25, 10)
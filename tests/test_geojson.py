@@ -0,0 +1,126 @@
+"""tests dem_tiler.geojson."""
+
+import json
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import mercantile
+import pytest
+
+from dem_tiler import geojson
+from dem_tiler.geojson import (
+    coverage_bounds,
+    coverage_features,
+    feature_collection,
+    feature_sequence,
+    mosaic_quadkeys,
+    quadkey_features,
+)
+from dem_tiler.index import QuadkeyIndex
+
+mosaic_def = SimpleNamespace(
+    quadkey_zoom=8,
+    minzoom=7,
+    tiles={
+        "03023033": ["a.tif", "b.tif"],
+        "03023032": ["b.tif"],
+        "03023030": ["c.tif", "a.tif"],
+        "03023122": ["d.tif"]})
+
+
+@pytest.fixture(params=["index", "mosaic_def"])
+def mosaic(request, monkeypatch):
+    """Mosaic read either through the quadkey index or the MosaicJSON"""
+    index = None
+    if request.param == "index":
+        index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+
+    @contextmanager
+    def open_mosaic(url):
+        yield SimpleNamespace(mosaic_def=mosaic_def)
+
+    monkeypatch.setattr(geojson, "get_mosaic_index", lambda url: index)
+    monkeypatch.setattr(geojson, "open_mosaic", open_mosaic)
+    return "mosaic.json"
+
+
+def test_mosaic_quadkeys(mosaic):
+    """Quadkeys are filtered by bbox."""
+    quadkeys = dict(mosaic_quadkeys(mosaic))
+    assert quadkeys == mosaic_def.tiles
+
+    # bbox within quadkey 03023033
+    west, south, east, north = mercantile.bounds(
+        mercantile.quadkey_to_tile("03023033"))
+    bbox = [west + 0.01, south + 0.01, east - 0.01, north - 0.01]
+    assert dict(mosaic_quadkeys(mosaic, bbox=bbox)) == {
+        "03023033": ["a.tif", "b.tif"]}
+
+    # Lower zoom selects the whole parent tile
+    assert set(dict(mosaic_quadkeys(mosaic, bbox=bbox, zoom=7))) == {
+        "03023033", "03023032", "03023030"}
+
+    # Zoom is capped at the quadkey zoom
+    assert dict(mosaic_quadkeys(mosaic, bbox=bbox, zoom=12)) == {
+        "03023033": ["a.tif", "b.tif"]}
+
+    assert list(mosaic_quadkeys(mosaic, bbox=[10, 10, 11, 11])) == []
+
+
+def test_feature_encoding(mosaic):
+    """Chunks join into valid GeoJSON."""
+    features = quadkey_features(mosaic_quadkeys(mosaic))
+    collection = json.loads("".join(feature_collection(features)))
+    assert collection["type"] == "FeatureCollection"
+    assert len(collection["features"]) == 4
+    assert collection["features"][0]["properties"]["files"]
+
+    features = quadkey_features(mosaic_quadkeys(mosaic))
+    lines = "".join(feature_sequence(features)).splitlines()
+    assert [json.loads(line) for line in lines] == collection["features"]
+
+    assert json.loads("".join(feature_collection([]))) == {
+        "type": "FeatureCollection", "features": []}
+
+
+def test_coverage(mosaic):
+    """Coverage tiles and bounds of the mosaic."""
+    # Only 3 of the 4 children of 0302303 are in the mosaic: nothing merges
+    features = list(coverage_features(mosaic))
+    assert {feature["id"] for feature in features} == {
+        str(mercantile.quadkey_to_tile(quadkey))
+        for quadkey in mosaic_def.tiles}
+    assert "files" not in features[0]["properties"]
+
+    bounds = [mercantile.bounds(mercantile.quadkey_to_tile(quadkey))
+              for quadkey in mosaic_def.tiles]
+    assert coverage_bounds(mosaic) == pytest.approx([
+        min(b.west for b in bounds),
+        min(b.south for b in bounds),
+        max(b.east for b in bounds),
+        max(b.north for b in bounds)])
+
+    west, south, east, north = mercantile.bounds(
+        mercantile.quadkey_to_tile("03023122"))
+    bbox = [west + 0.01, south + 0.01, east - 0.01, north - 0.01]
+    features = list(coverage_features(mosaic, bbox=bbox))
+    assert [feature["id"] for feature in features] == [
+        str(mercantile.quadkey_to_tile("03023122"))]
+
+
+
+def test_coverage_mixed_zoom(monkeypatch):
+    """Quadkeys at mixed zooms merge without an index."""
+    tiles = dict(mosaic_def.tiles, **{"03023031": ["e.tif"], "0302312": []})
+
+    @contextmanager
+    def open_mosaic(url):
+        yield SimpleNamespace(mosaic_def=SimpleNamespace(tiles=tiles))
+
+    monkeypatch.setattr(geojson, "get_mosaic_index", lambda url: None)
+    monkeypatch.setattr(geojson, "open_mosaic", open_mosaic)
+
+    features = list(coverage_features("mosaic.json"))
+    assert {feature["id"] for feature in features} == {
+        str(mercantile.quadkey_to_tile("0302303")),
+        str(mercantile.quadkey_to_tile("0302312"))}
@@ -0,0 +1,221 @@
+"""tests dem_tiler.index."""
+
+from types import SimpleNamespace
+
+import mercantile
+import numpy as np
+import pytest
+
+from dem_tiler.index import (
+    QuadkeyIndex,
+    key_to_tiles,
+    merge_quadkeys,
+    tile_bounds,
+    tile_ranges,
+    tile_to_key,
+)
+
+mosaic_def = SimpleNamespace(
+    quadkey_zoom=8,
+    minzoom=7,
+    tiles={
+        "03023033": ["a.tif", "b.tif"],
+        "03023032": ["b.tif"],
+        "03023030": ["c.tif", "a.tif"],
+        "03023122": ["d.tif"]})
+
+
+def test_tile_to_key():
+    """Integer keys match mercantile quadkeys."""
+    for tile in [mercantile.Tile(0, 0, 0), mercantile.Tile(150, 182, 9)]:
+        qk = mercantile.quadkey(tile)
+        assert tile_to_key(*tile) == (int(qk, 4) if qk else 0)
+
+
+def test_index_tile():
+    """Lookup matches the mosaic's quadkeys."""
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+    assert len(index) == 4
+
+    # Tile at the quadkey zoom
+    assert index.tile(*mercantile.quadkey_to_tile("03023033")) == [
+        "a.tif", "b.tif"]
+
+    # Tile below the quadkey zoom uses its parent
+    child = mercantile.children(mercantile.quadkey_to_tile("03023030"))[0]
+    assert index.tile(*child) == ["c.tif", "a.tif"]
+
+    # Tile above the quadkey zoom gathers all children, without duplicates,
+    # in quadkey order rather than mosaic order
+    parent = mercantile.quadkey_to_tile("0302303")
+    assert index.tile(*parent) == ["c.tif", "a.tif", "b.tif"]
+
+    # Missing tile
+    assert index.tile(*mercantile.quadkey_to_tile("03023031")) == []
+
+
+def test_index_sidecar(tmpdir):
+    """Index round-trips through the binary sidecar."""
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+    path = str(tmpdir.join("mosaic.json.qkidx"))
+    index.write(path)
+
+    loaded = QuadkeyIndex.open(path)
+    assert loaded.quadkey_zoom == 8
+    parent = mercantile.quadkey_to_tile("0302")
+    assert loaded.tile(*parent) == index.tile(*parent)
+    assert len(loaded.tile(*parent)) == 4
+
+    with pytest.raises(ValueError):
+        QuadkeyIndex.from_buffer(b"not an index" * 4)
+
+
+def test_index_mixed_zoom():
+    """Quadkeys must all be at the quadkey zoom."""
+    bad = SimpleNamespace(
+        quadkey_zoom=2, minzoom=2, tiles={"01": ["a"], "012": ["b"]})
+    with pytest.raises(ValueError):
+        QuadkeyIndex.from_mosaic_def(bad)
+
+
+def test_key_to_tiles():
+    """Keys decode back to tiles."""
+    tiles = [mercantile.Tile(150, 182, 9), mercantile.Tile(0, 511, 9)]
+    x, y = key_to_tiles([tile_to_key(*tile) for tile in tiles], 9)
+    assert x.tolist() == [150, 0]
+    assert y.tolist() == [182, 511]
+
+
+def test_tile_ranges():
+    """Tiles are covered exactly by merged rectangles."""
+    # 2x2 block, plus a separate tile
+    x = np.array([5, 3, 4, 3, 4])
+    y = np.array([1, 1, 1, 2, 2])
+    ranges = tile_ranges(x, y)
+    assert ranges == [
+        {"startX": 3, "startY": 1, "endX": 5, "endY": 1},
+        {"startX": 3, "startY": 2, "endX": 4, "endY": 2}]
+
+    x = np.array([3, 4, 3, 4, 7])
+    y = np.array([1, 1, 2, 2, 2])
+    assert tile_ranges(x, y) == [
+        {"startX": 3, "startY": 1, "endX": 4, "endY": 2},
+        {"startX": 7, "startY": 2, "endX": 7, "endY": 2}]
+
+    assert tile_ranges(np.array([]), np.array([])) == []
+
+
+def test_index_available():
+    """Availability matches the mosaic's quadkeys at every zoom."""
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+
+    def covered(ranges):
+        return {(x, y)
+                for r in ranges
+                for x in range(r["startX"], r["endX"] + 1)
+                for y in range(r["startY"], r["endY"] + 1)}
+
+    for z in range(0, 11):
+        expected = set()
+        for quadkey in mosaic_def.tiles:
+            tile = mercantile.quadkey_to_tile(quadkey)
+            if z <= 8:
+                parent = mercantile.parent(tile, zoom=z) if z < 8 else tile
+                expected.add((parent.x, parent.y))
+            else:
+                expected.update(
+                    (t.x, t.y) for t in mercantile.children(tile, zoom=z))
+
+        assert covered(index.available(z)) == expected
+
+    assert index.available(8) is index.available(8)
+
+
+def test_merge_quadkeys():
+    """Complete sibling groups are merged, recursively."""
+    parent = mercantile.Tile(10, 20, 6)
+    children = [
+        tile for child in mercantile.children(parent)
+        for tile in mercantile.children(child)]
+    # Drop one grandchild: only 3 of the 4 children can be merged
+    partial = mercantile.children(mercantile.Tile(0, 0, 6))
+    tiles = children[1:] + partial[:3]
+
+    keys = [tile_to_key(t.x, t.y, t.z) for t in tiles]
+    merged, zooms = merge_quadkeys(keys, [t.z for t in tiles])
+    result = set()
+    for key, z in zip(merged.tolist(), zooms.tolist()):
+        x, y = key_to_tiles([key], z)
+        result.add(mercantile.Tile(int(x[0]), int(y[0]), z))
+
+    assert result == (
+        set(mercantile.children(parent)[1:]) | set(
+            mercantile.children(mercantile.children(parent)[0])[1:])
+        | set(partial[:3]))
+
+    # Complete world
+    keys, zooms = merge_quadkeys(range(4), [1] * 4)
+    assert keys.tolist() == [0] and zooms.tolist() == [0]
+
+    keys, zooms = merge_quadkeys([], [])
+    assert len(keys) == len(zooms) == 0
+
+
+def test_tile_bounds():
+    """Bounds match mercantile."""
+    x, y, z = np.array([0, 5, 37]), np.array([0, 9, 100]), np.array([0, 4, 8])
+    bounds = np.stack(tile_bounds(x, y, z), axis=1)
+    for i in range(3):
+        np.testing.assert_allclose(
+            bounds[i], mercantile.bounds(x[i], y[i], z[i]), atol=1e-9)
+
+
+def test_index_coverage():
+    """Coverage is computed once."""
+    tiles = mercantile.children(mercantile.Tile(3, 5, 4))
+    mosaic_def = SimpleNamespace(
+        quadkey_zoom=5,
+        minzoom=5,
+        tiles={mercantile.quadkey(t): ["a.tif"] for t in tiles})
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+    keys, zooms = index.coverage()
+    assert keys.tolist() == [tile_to_key(3, 5, 4)]
+    assert zooms.tolist() == [4]
+    assert index.coverage() is index.coverage()
+
+
+def test_index_asset_bounds(tmpdir):
+    """Assets that don't intersect the tile are pruned."""
+    quadkey = "03023033"
+    west, south, east, north = mercantile.bounds(
+        mercantile.quadkey_to_tile(quadkey))
+    mid_x, mid_y = (west + east) / 2, (south + north) / 2
+    asset_bounds = {
+        # Top left quarter of the quadkey
+        "a.tif": (west, mid_y, mid_x, north),
+        # Whole quadkey
+        "b.tif": (west - 1, south - 1, east + 1, north + 1)}
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def, asset_bounds=asset_bounds)
+    assert index.bounds.shape == (4, 4)
+
+    # Mosaic order is kept
+    assert index.tile(*mercantile.quadkey_to_tile(quadkey)) == [
+        "a.tif", "b.tif"]
+
+    # a.tif doesn't intersect the bottom right child
+    children = mercantile.children(mercantile.quadkey_to_tile(quadkey))
+    assert index.tile(*children[2]) == ["b.tif"]
+    assert index.tile(*children[0]) == ["a.tif", "b.tif"]
+
+    # Assets of unknown bounds are kept
+    assert index.tile(*mercantile.quadkey_to_tile("03023030")) == ["c.tif"]
+
+    # Bounds round-trip through the sidecar
+    path = str(tmpdir.join("mosaic.json.qkidx"))
+    index.write(path)
+    loaded = QuadkeyIndex.open(path)
+    np.testing.assert_array_equal(loaded.bounds, index.bounds)
+    assert loaded.tile(*children[2]) == ["b.tif"]
+
+    index = QuadkeyIndex.from_mosaic_def(mosaic_def)
+    assert QuadkeyIndex.from_buffer(index.to_bytes()).bounds is None
@@ -0,0 +1,280 @@
+"""tests dem_tiler.mesh."""
+
+import io
+import struct
+
+import numpy as np
+import pytest
+import quantized_mesh_encoder
+
+from pydelatin import Delatin
+
+from dem_tiler.mesh import (
+    add_skirts,
+    compute_vertex_normals,
+    encode_mesh,
+    force_martini_edges,
+    get_martini,
+    ground_pixel_size,
+    insert_delatin_edges,
+    mesh_extensions,
+    oct_encode,
+    parse_extensions,
+    parse_max_error,
+    resolve_max_error,
+    to_ecef,
+    water_mask,
+)
+
+
+def oct_decode(encoded):
+    """Reference oct decoding, as done by Cesium"""
+    xy = encoded.astype(np.float64) / 255 * 2 - 1
+    z = 1 - np.abs(xy).sum(axis=1)
+    lower = z < 0
+    sign = np.where(xy[lower] < 0, -1.0, 1.0)
+    xy[lower] = (1 - np.abs(xy[lower][:, ::-1])) * sign
+    vec = np.column_stack([xy, z])
+    return vec / np.linalg.norm(vec, axis=1)[:, np.newaxis]
+
+
+def make_terrain(size=257):
+    rng = np.random.default_rng(0)
+    return np.cumsum(rng.normal(size=(size, size)), axis=0).astype(np.float32)
+
+
+def border_pixels(vertices, size):
+    xy = {tuple(v) for v in vertices[:, :2].astype(int).tolist()}
+    return {p for p in xy if 0 in p or size in p}
+
+
+def test_get_martini():
+    """Martini instances are reused."""
+    assert get_martini(257) is get_martini(257)
+    assert get_martini(257) is not get_martini(513)
+
+
+def test_ground_pixel_size():
+    """Pixel size halves with each zoom, and shrinks with latitude."""
+    equator = ground_pixel_size(2**9, 2**9 - 1, 10, 256)
+    assert equator == pytest.approx(152.87, rel=1e-3)
+    assert ground_pixel_size(2**10, 2**10 - 1, 11, 256) == pytest.approx(
+        equator / 2, rel=1e-3)
+    assert ground_pixel_size(2**9, 2**9 - 1, 10, 512) == pytest.approx(
+        equator / 2)
+    assert ground_pixel_size(2**9, 100, 10, 256) < equator / 2
+
+
+def test_max_error():
+    """Max error is fixed, adaptive, or looked up by zoom."""
+    assert resolve_max_error(parse_max_error("10"), 0, 0, 5, 256) == 10
+    assert resolve_max_error(parse_max_error(2.5), 0, 0, 5, 256) == 2.5
+
+    auto = parse_max_error("auto")
+    assert resolve_max_error(auto, 300, 400, 10, 256) == ground_pixel_size(
+        300, 400, 10, 256)
+
+    table = parse_max_error("12:5,0:2000,8:50")
+    assert table == {0: 2000, 8: 50, 12: 5}
+    assert resolve_max_error(table, 0, 0, 3, 256) == 2000
+    assert resolve_max_error(table, 0, 0, 8, 256) == 50
+    assert resolve_max_error(table, 0, 0, 15, 256) == 5
+    assert resolve_max_error({5: 20}, 0, 0, 3, 256) == 20
+
+    for value in ["high", "5:", "a:5"]:
+        with pytest.raises(ValueError):
+            parse_max_error(value)
+
+
+def test_force_martini_edges():
+    """All border pixels are mesh vertices."""
+    terrain = make_terrain()
+    tile = get_martini(257).create_tile(terrain)
+    vertices, _ = tile.get_mesh(100)
+    assert len(border_pixels(vertices, 256)) < 4 * 256
+
+    force_martini_edges(tile)
+    vertices, triangles = tile.get_mesh(100)
+    assert len(border_pixels(vertices, 256)) == 4 * 256
+    # Interior stays coarse
+    assert len(vertices) < 257 * 257 / 10
+
+
+def test_insert_delatin_edges():
+    """All border pixels are mesh vertices, and the mesh area is unchanged."""
+    terrain = make_terrain()
+    tin = Delatin(terrain, max_error=20)
+    vertices, triangles = insert_delatin_edges(
+        tin.vertices, tin.triangles, terrain)
+
+    assert len(border_pixels(vertices, 256)) == 4 * 256
+    assert (vertices[:len(tin.vertices)] == tin.vertices).all()
+
+    # Heights of new vertices match Delatin's convention
+    x, y = vertices[:, :2].astype(int).T
+    np.testing.assert_array_equal(vertices[:, 2], terrain[256 - y, x])
+
+    def area(v, t):
+        a, b, c = v[t[:, 0], :2], v[t[:, 1], :2], v[t[:, 2], :2]
+        ab, ac = b - a, c - a
+        return np.abs(ab[:, 0] * ac[:, 1] - ab[:, 1] * ac[:, 0]).sum() / 2
+
+    assert area(vertices, triangles) == area(tin.vertices, tin.triangles)
+    assert area(vertices, triangles) == 256 * 256
+
+
+def test_add_skirts():
+    """Skirt vertices duplicate edge vertices, lower."""
+    lng, lat = np.meshgrid([0, 0.5, 1], [0, 0.5, 1])
+    positions = np.column_stack([lng.ravel(), lat.ravel(), np.full(9, 100.)])
+    triangles = np.array([[0, 1, 3], [1, 4, 3], [1, 2, 4], [2, 5, 4],
+                          [3, 4, 6], [4, 7, 6], [4, 5, 7], [5, 8, 7]])
+
+    new_positions, new_triangles, skirt_ix = add_skirts(
+        positions, triangles, 50)
+    # 4 edges of 3 vertices
+    assert len(skirt_ix) == 12
+    assert 4 not in skirt_ix
+    np.testing.assert_array_equal(new_positions[9:, :2], positions[skirt_ix, :2])
+    assert (new_positions[9:, 2] == 50).all()
+    # 2 triangles per edge segment
+    assert len(new_triangles) == len(triangles) + 4 * 2 * 2
+
+    # Skirts face away from the tile center
+    skirts = new_positions[new_triangles[len(triangles):]]
+    normals = np.cross(skirts[:, 1] - skirts[:, 0], skirts[:, 2] - skirts[:, 0])
+    outward = skirts.mean(axis=1) - [0.5, 0.5, 0]
+    assert (np.einsum('ij,ij->i', normals[:, :2], outward[:, :2]) > 0).all()
+
+
+def _edge_indices(buf, n_triangles):
+    """West, south, east and north edge indices of a 16 bit quantized mesh"""
+    n_vertices, = struct.unpack_from('<I', buf, 88)
+    offset = 88 + 4 + 6 * n_vertices + 4 + 6 * n_triangles
+    edges = []
+    for _ in range(4):
+        count, = struct.unpack_from('<I', buf, offset)
+        edges.append(np.frombuffer(buf, np.uint16, count, offset + 4))
+        offset += 4 + 2 * count
+    return edges, offset
+
+
+def test_encode_mesh():
+    """Edge indices only list surface vertices."""
+    lng, lat = np.meshgrid([10, 10.005, 10.01], [45, 45.005, 45.01])
+    positions = np.column_stack([lng.ravel(), lat.ravel(), np.full(9, 100.)])
+    triangles = np.array([[0, 1, 3], [1, 4, 3], [1, 2, 4], [2, 5, 4],
+                          [3, 4, 6], [4, 7, 6], [4, 5, 7], [5, 8, 7]])
+
+    with io.BytesIO() as f:
+        quantized_mesh_encoder.encode(f, positions, triangles)
+        expected = f.getvalue()
+    with io.BytesIO() as f:
+        encode_mesh(f, positions, triangles)
+        assert f.getvalue() == expected
+
+    skirted, skirt_triangles, _ = add_skirts(positions, triangles, 50)
+    extensions = mesh_extensions(
+        {"watermask"}, positions, triangles, np.zeros((256, 256)))
+    with io.BytesIO() as f:
+        encode_mesh(
+            f, skirted, skirt_triangles, n_surface=len(positions),
+            extensions=extensions)
+        buf = f.getvalue()
+
+    (west, south, east, north), offset = _edge_indices(
+        buf, len(skirt_triangles))
+    assert west.tolist() == [0, 3, 6]
+    assert south.tolist() == [0, 1, 2]
+    assert east.tolist() == [2, 5, 8]
+    assert north.tolist() == [6, 7, 8]
+    assert buf[offset:] == extensions[0].encode()
+
+
+@pytest.mark.parametrize(
+    "value,expected",
+    [
+        (None, set()),
+        ("octvertexnormals", {"octvertexnormals"}),
+        ("octvertexnormals,watermask", {"octvertexnormals", "watermask"}),
+        (
+            "application/vnd.quantized-mesh;extensions=octvertexnormals-watermask-metadata,application/octet-stream;q=0.9",
+            {"octvertexnormals", "watermask"}),
+        ("application/vnd.quantized-mesh,*/*;q=0.01", set()),
+    ])
+def test_parse_extensions(value, expected):
+    """Extensions are parsed from parameters and Accept headers."""
+    assert parse_extensions(value) == expected
+
+
+def test_oct_encode():
+    """Oct-encoded normals decode back to the original directions."""
+    rng = np.random.default_rng(0)
+    normals = rng.normal(size=(1000, 3))
+    normals /= np.linalg.norm(normals, axis=1)[:, np.newaxis]
+
+    decoded = oct_decode(oct_encode(normals))
+    assert (np.einsum('ij,ij->i', normals, decoded) > 0.999).all()
+
+
+def test_compute_vertex_normals():
+    """Normals of a flat mesh point away from the earth center."""
+    lng, lat = np.meshgrid(np.linspace(10, 10.01, 3), np.linspace(45, 45.01, 3))
+    positions = np.column_stack([lng.ravel(), lat.ravel(), np.zeros(9)])
+    triangles = np.array([[0, 1, 3], [1, 4, 3], [1, 2, 4], [2, 5, 4],
+                          [3, 4, 6], [4, 7, 6], [4, 5, 7], [5, 8, 7]])
+
+    normals = compute_vertex_normals(positions, triangles)
+    assert normals.shape == (9, 3)
+    np.testing.assert_allclose(np.linalg.norm(normals, axis=1), 1)
+
+    up = to_ecef(positions)
+    up /= np.linalg.norm(up, axis=1)[:, np.newaxis]
+    assert (np.einsum('ij,ij->i', normals, up) > 0.99).all()
+
+    # Independent of winding order
+    flipped = compute_vertex_normals(positions, triangles[:, ::-1])
+    np.testing.assert_allclose(flipped, normals)
+
+
+def test_water_mask():
+    """Water mask is collapsed to a single byte when uniform."""
+    tile = np.full((257, 257), 100, dtype=np.float32)
+    assert water_mask(tile).shape == ()
+    assert water_mask(tile) == 0
+
+    tile[:128] = -5
+    mask = water_mask(tile)
+    assert mask.shape == (256, 256)
+    assert (mask[:128] == 255).all()
+    assert (mask[128:] == 0).all()
+
+    tile = np.full((512, 512), np.nan, dtype=np.float32)
+    assert water_mask(tile) == 255
+
+
+def test_mesh_extensions():
+    """Extensions are encoded as id, length, data."""
+    positions = np.array([[10, 45, 0], [10.01, 45, 0], [10, 45.01, 0]])
+    triangles = np.array([0, 1, 2], dtype=np.uint32)
+    tile = np.zeros((256, 256), dtype=np.float32)
+
+    extensions = mesh_extensions(
+        {"watermask", "octvertexnormals"}, positions, triangles, tile)
+    buf = b"".join(extension.encode() for extension in extensions)
+    assert struct.unpack('<BI', buf[:5]) == (1, 6)
+    assert struct.unpack('<BI', buf[11:16]) == (2, 1)
+    assert buf[16:] == b'\xff'
+
+    # Skirt vertices get the normal of the edge vertex they duplicate
+    normals, = mesh_extensions(
+        {"octvertexnormals"}, positions, triangles, tile,
+        skirt_ix=np.array([1, 2]))
+    data = normals.encode()
+    assert struct.unpack('<BI', data[:5]) == (1, 10)
+    assert data[11:15] == data[7:11]
+
+    with io.BytesIO() as f:
+        quantized_mesh_encoder.encode(
+            f, positions, triangles, extensions=extensions)
+        assert f.getvalue().endswith(buf)
@@ -0,0 +1,69 @@
+"""tests dem_tiler.mvt."""
+
+import numpy as np
+
+from dem_tiler.mvt import (
+    clip_linestring,
+    encode_layer,
+    encode_linestring_geometry,
+    encode_tile,
+    encode_varints,
+    quantize_linestring,
+    zigzag,
+)
+
+
+def test_encode_varints():
+    """Varints match the protobuf encoding."""
+    assert encode_varints([]) == b""
+    assert encode_varints([0, 1, 127, 128, 300]) == b"\x00\x01\x7f\x80\x01\xac\x02"
+    assert encode_varints([2**32]) == b"\x80\x80\x80\x80\x10"
+    np.testing.assert_array_equal(zigzag([0, -1, 1, -2, 2]), [0, 1, 2, 3, 4])
+
+
+def test_clip_linestring():
+    """Lines are split where they leave the bounds."""
+    coords = np.array([[1, 1], [20, 1], [20, 5], [-5, 5], [5, 8]], dtype=float)
+    parts = clip_linestring(coords, (0, 0, 10, 10))
+    assert len(parts) == 3
+    np.testing.assert_allclose(parts[0], [[1, 1], [10, 1]])
+    np.testing.assert_allclose(parts[1], [[10, 5], [0, 5]])
+    np.testing.assert_allclose(parts[2], [[0, 6.5], [5, 8]])
+
+    # Consecutive visible segments stay in one part
+    parts = clip_linestring(coords[:2] / 4, (0, 0, 10, 10))
+    assert len(parts) == 1
+
+    # Fully outside
+    assert clip_linestring(coords + 100, (0, 0, 10, 10)) == []
+
+
+def test_quantize_linestring():
+    """Coordinates are scaled, rounded and deduplicated."""
+    coords = np.array([[0, 0], [0.01, 0.01], [1, 1], [1000, 1]])
+    parts = quantize_linestring(coords, 16, extent=4096, buffer=80)
+    assert len(parts) == 1
+    np.testing.assert_array_equal(parts[0], [[0, 0], [16, 16], [4176, 16]])
+
+    # Degenerate lines are dropped
+    assert quantize_linestring(np.array([[0, 0], [0.01, 0]]), 16) == []
+
+
+def test_encode_linestring_geometry():
+    """Geometry commands follow the spec example."""
+    # https://github.com/mapbox/vector-tile-spec/tree/master/2.1#4352-example-multi-linestring
+    parts = [np.array([[2, 2], [2, 10], [10, 10]]), np.array([[1, 1], [3, 5]])]
+    np.testing.assert_array_equal(
+        encode_linestring_geometry(parts),
+        [9, 4, 4, 18, 0, 16, 16, 0, 9, 17, 17, 10, 4, 8])
+
+
+def test_encode_layer():
+    """Layers reference shared keys and values."""
+    parts = [np.array([[0, 0], [10, 10]])]
+    layer = encode_layer(
+        "contour", [(1, parts, {"ele": 100}), (2, parts, {"ele": 100}), (3, [], {})])
+    tile = encode_tile([layer])
+    assert tile.startswith(b"\x1a")
+    assert layer.count(b"ele") == 1
+    assert b"contour" in layer
@@ -0,0 +1,146 @@
+"""tests dem_tiler.points."""
+
+import os
+from types import SimpleNamespace
+
+import mercantile
+import numpy as np
+import pytest
+import rasterio
+from rasterio.warp import transform as transform_coords
+
+from dem_tiler import points
+from dem_tiler.points import (
+    TooManyPointsError,
+    haversine,
+    interpolate_line,
+    lnglat_to_tile,
+    sample_asset,
+    sample_mosaic,
+    sample_tile_pyramid,
+    tile_pyramid_asset,
+)
+
+asset1 = os.path.join(os.path.dirname(__file__), "fixtures", "cog1.tif")
+
+
+def test_lnglat_to_tile():
+    """Tiles match mercantile."""
+    lng = np.array([-75.1, 0, 179.99, -180])
+    lat = np.array([45.3, 0, -60.5, 85.1])
+    x, y = lnglat_to_tile(lng, lat, 12)
+    for i in range(len(lng)):
+        tile = mercantile.tile(lng[i], min(lat[i], 85.05), 12)
+        assert (x[i], y[i]) == (tile.x, tile.y)
+
+
+def test_sample_asset():
+    """Points are sampled from a single window read."""
+    with rasterio.open(asset1) as src:
+        rows = np.array([10, 500, 200])
+        cols = np.array([20, 300, 700])
+        xs = src.transform.c + (cols + 0.5) * src.transform.a
+        ys = src.transform.f + (rows + 0.5) * src.transform.e
+        expected = src.read(1, masked=True)[rows, cols].astype(
+            np.float64).filled(np.nan)
+
+    lng, lat = transform_coords(src.crs, "EPSG:4326", xs, ys)
+
+    # Add a point outside of the asset
+    values = sample_asset(asset1, np.append(lng, 0), np.append(lat, 0))
+    np.testing.assert_array_equal(values[:3], expected)
+    assert np.isnan(values[3])
+
+    assert np.isnan(sample_asset("missing.tif", [0], [0])).all()
+
+
+def test_sample_mosaic(monkeypatch):
+    """Each point takes the value of the first asset with data."""
+    with rasterio.open(asset1) as src:
+        xs = src.transform.c + np.array([300.5, 300.5]) * src.transform.a
+        ys = src.transform.f + np.array([400.5, 500.5]) * src.transform.e
+        lng, lat = transform_coords(src.crs, "EPSG:4326", xs, ys)
+
+    calls = []
+
+    def find_assets(x, y, z, url):
+        calls.append((x, y, z))
+        return ["missing.tif", asset1]
+
+    monkeypatch.setattr(
+        points, "get_mosaic_index",
+        lambda url: SimpleNamespace(quadkey_zoom=7))
+    monkeypatch.setattr(points, "_find_mosaic_assets", find_assets)
+
+    values = sample_mosaic("mosaic.json", lng, lat)
+    np.testing.assert_array_equal(values, sample_asset(asset1, lng, lat))
+    assert not np.isnan(values).any()
+    # Assets are looked up once per quadkey
+    assert len(calls) == len(set(calls))
+
+
+def test_sample_tile_pyramid(monkeypatch):
+    """Points are interpolated bilinearly, across tile edges."""
+    requested = []
+
+    def read_elevation(assets, input_format):
+        # Elevation is a plane over the global pixel grid
+        requested.extend(assets)
+        arrays = []
+        for asset in assets:
+            z, x, y = map(int, asset[:-len('.png')].split('/')[-3:])
+            assert z == 15
+            rows, cols = np.mgrid[0:256, 0:256]
+            arrays.append(((x * 256 + cols) + 0.5 * (y * 256 + rows))[None])
+
+        return arrays
+
+    monkeypatch.setattr(points, "read_elevation", read_elevation)
+
+    tile = mercantile.Tile(5241, 12663, 15)
+    west, south, east, north = mercantile.bounds(tile)
+    # Center of the tile, a point on its east edge, and one past it
+    lng = np.array([(west + east) / 2, east, east + (east - west) / 512])
+    lat = np.full(3, (south + north) / 2)
+
+    values = sample_tile_pyramid("terrarium", lng, lat)
+
+    x, y = points._mercator(lng, lat)
+    expected = (x * 2**15 * 256 - 0.5) + 0.5 * (y * 2**15 * 256 - 0.5)
+    np.testing.assert_allclose(values, expected)
+
+    # Each tile is read once
+    assert len(requested) == len(set(requested)) == 2
+
+
+def test_tile_pyramid_asset():
+    """Points are read from the highest zoom tiles."""
+    assert tile_pyramid_asset("terrarium", 1, 2) == (
+        "s3://elevation-tiles-prod/terrarium/15/1/2.png")
+    assert tile_pyramid_asset("geotiff", 1, 2) == (
+        "s3://elevation-tiles-prod/geotiff/14/1/2.tif")
+
+
+def test_interpolate_line():
+    """Points are spaced evenly, including both ends."""
+    coords = [[0, 0], [0, 0.01], [0.01, 0.01]]
+    segment = haversine(np.array([0, 0]), np.array([0, 0.01]))[0]
+    assert segment == pytest.approx(1111.95, rel=1e-4)
+
+    lng, lat, distance = interpolate_line(coords, 100)
+    assert distance[0] == 0
+    assert distance[-1] == pytest.approx(haversine(*np.array(coords).T).sum())
+    np.testing.assert_allclose(np.diff(distance)[:-1], 100)
+    assert (lng[0], lat[0]) == (0, 0)
+    assert (lng[-1], lat[-1]) == (0.01, 0.01)
+
+    # Along the first segment, only latitude changes
+    first = distance < segment
+    assert (lng[first] == 0).all()
+
+    # Too many points are rejected before being allocated
+    assert len(interpolate_line(coords, 100, max_points=24)[2]) == 24
+    with pytest.raises(TooManyPointsError):
+        interpolate_line(coords, 100, max_points=23)
+    with pytest.raises(TooManyPointsError):
+        interpolate_line(coords, 1e-12, max_points=10000)
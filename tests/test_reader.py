@@ -0,0 +1,355 @@
+"""tests dem_tiler.reader."""
+
+import os
+
+import threading
+
+import numpy as np
+import rasterio
+from rio_tiler_mosaic.methods import defaults
+
+from dem_tiler import reader
+from dem_tiler.cache import tile_cache
+from dem_tiler.reader import (
+    backfill_arrays,
+    find_assets,
+    load_assets,
+    mosaic_reader,
+    read_asset_bounds,
+    read_assets,
+    read_png,
+)
+
+asset1 = os.path.join(os.path.dirname(__file__), "fixtures", "cog1.tif")
+asset2 = os.path.join(os.path.dirname(__file__), "fixtures", "cog2.tif")
+
+
+def test_read_assets():
+    """Assets are returned in order, with None for missing assets."""
+    arrays = read_assets([asset1, "does-not-exist.tif", asset2])
+    assert len(arrays) == 3
+    assert arrays[1] is None
+    assert arrays[0].ndim == 3
+    assert not np.array_equal(arrays[0], arrays[2])
+
+
+def test_read_asset_bounds():
+    """Bounds are read in WGS84, skipping missing assets."""
+    bounds = read_asset_bounds([asset1, "does-not-exist.tif", asset1])
+    assert list(bounds) == [asset1]
+    west, south, east, north = bounds[asset1]
+    assert -180 <= west < east <= 180 and -90 <= south < north <= 90
+
+
+def test_backfill_arrays():
+    """Neighbors fill a 1 pixel border, including corners."""
+    tiles = [np.full((1, 4, 4), v) for v in range(9)]
+
+    assert backfill_arrays(tiles[4:5]) is tiles[4]
+
+    arr = backfill_arrays(tiles)
+    assert arr.shape == (1, 6, 6)
+    assert (arr[0, 1:-1, 1:-1] == 4).all()
+    assert (arr[0, 1:-1, 0] == 3).all()
+    assert (arr[0, -1, 1:-1] == 7).all()
+    assert (arr[0, 1:-1, -1] == 5).all()
+    assert (arr[0, 0, 1:-1] == 1).all()
+    np.testing.assert_array_equal(arr[0, [0, 0, -1, -1], [0, -1, 0, -1]],
+                                  [0, 2, 6, 8])
+
+
+def test_backfill_arrays_missing_neighbor():
+    """Missing neighbors repeat the edge of center."""
+    center = np.arange(16).reshape(1, 4, 4)
+    tiles = [None] * 9
+    tiles[4] = center
+    tiles[3] = np.full((1, 4, 4), -1)
+
+    arr = backfill_arrays(tiles)
+    assert arr.shape == (1, 6, 6)
+    assert (arr[0, 1:-1, 0] == -1).all()
+    np.testing.assert_array_equal(arr[0, 1:-1, -1], center[0, :, -1])
+    np.testing.assert_array_equal(arr[0, -1, 1:-1], center[0, -1, :])
+    np.testing.assert_array_equal(arr[0, 0, 1:-1], center[0, 0, :])
+    assert arr[0, 0, 0] == center[0, 0, 0]
+    assert arr[0, -1, -1] == center[0, -1, -1]
+
+    tiles[4] = None
+    assert backfill_arrays(tiles) is None
+
+
+def _write_terrarium(path, elevation):
+    """Write a terrarium-encoded PNG of a constant elevation."""
+    value = elevation + 32768
+    data = np.empty((3, 16, 16), dtype=np.uint8)
+    data[0] = value // 256
+    data[1] = value % 256
+    data[2] = (value * 256) % 256
+    profile = dict(driver="PNG", count=3, width=16, height=16, dtype="uint8")
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data)
+
+
+def test_load_assets_terrarium(tmpdir):
+    """Terrarium tiles are decoded, cached and backfilled."""
+    tile_cache.clear()
+    assets = []
+    for i, elevation in enumerate([0, 1, 2, 3, 100, 5, 6, 7, 8]):
+        path = str(tmpdir.join(f"{i}.png"))
+        _write_terrarium(path, elevation)
+        assets.append(path)
+
+    data = load_assets(0, 0, 0, assets, 18, input_format="terrarium")
+    assert data.shape == (18, 18)
+    assert data.dtype == np.float32
+    # (x, y) order: left border is the first row
+    assert (data[0, 1:-1] == 3).all()
+    assert (data[1:-1, -1] == 7).all()
+    assert (data[1:-1, 1:-1] == 100).all()
+    assert data[-1, 0] == 2
+    assert tile_cache.stats()["entries"] == 9
+
+    # Second request is served from the cache
+    hits = tile_cache.stats()["hits"]
+    data = load_assets(
+        0, 0, 0, assets[4:5], 16, input_format="terrarium", backfill=True)
+    assert data.shape == (17, 17)
+    assert (data == 100).all()
+    assert tile_cache.stats()["hits"] == hits + 1
+
+    # Passthrough returns the raw terrarium RGB
+    rgb = load_assets(
+        0, 0, 0, assets, 18, input_format="terrarium", output_format="terrarium")
+    assert rgb.shape == (3, 18, 18)
+    assert rgb.dtype == np.uint8
+
+    # Missing center tile
+    assert load_assets(
+        0, 0, 0, ["missing.png"], 16, input_format="terrarium") is None
+
+
+def test_read_png(tmpdir):
+    """PNGs are decoded into a buffer of matching shape."""
+    path = str(tmpdir.join("0.png"))
+    _write_terrarium(path, 100)
+
+    rgb = read_png(path)
+    assert rgb.shape == (3, 16, 16)
+    out = np.zeros_like(rgb)
+    assert read_png(path, out=out) is out
+    np.testing.assert_array_equal(out, rgb)
+
+    assert read_png(path, out=np.zeros((3, 8, 8), np.uint8)).shape == rgb.shape
+    assert read_png("missing.png") is None
+
+
+def test_load_assets_mapbox(tmpdir):
+    """Terrarium input can be re-encoded to mapbox Terrain-RGB."""
+    tile_cache.clear()
+    path = str(tmpdir.join("0.png"))
+    _write_terrarium(path, 100)
+
+    rgb = load_assets(
+        0, 0, 0, [path], 16, input_format="terrarium", output_format="mapbox")
+    assert rgb.shape == (3, 16, 16)
+    assert rgb.dtype == np.uint8
+    # (100 + 10000) * 10 = 101000 = 0x018A88
+    np.testing.assert_array_equal(rgb[:, 0, 0], [1, 138, 136])
+
+
+def test_backfill_arrays_buffer():
+    """Neighbors fill a border of arbitrary width."""
+    center = np.full((1, 8, 8), 5)
+    tiles = [np.arange(64).reshape(1, 8, 8) + 100 * v for v in range(9)]
+    tiles[4] = center
+    left, bottom, right, top = tiles[3], tiles[7], tiles[5], tiles[1]
+
+    arr = backfill_arrays(tiles, buffer=3)
+    assert arr.shape == (1, 14, 14)
+    assert (arr[0, 3:-3, 3:-3] == 5).all()
+    np.testing.assert_array_equal(arr[0, 3:-3, :3], left[0, :, -3:])
+    np.testing.assert_array_equal(arr[0, -3:, 3:-3], bottom[0, :3, :])
+    np.testing.assert_array_equal(arr[0, 3:-3, -3:], right[0, :, :3])
+    np.testing.assert_array_equal(arr[0, :3, 3:-3], top[0, -3:, :])
+    np.testing.assert_array_equal(arr[0, :3, :3], tiles[0][0, -3:, -3:])
+    np.testing.assert_array_equal(arr[0, -3:, -3:], tiles[8][0, :3, :3])
+
+    # Buffer as wide as the tiles
+    arr = backfill_arrays(tiles, buffer=8)
+    np.testing.assert_array_equal(arr[0, 8:16, :8], left[0])
+
+
+def test_find_assets_buffer():
+    """Buffered terrarium tiles include their neighbors."""
+    assert len(find_assets(10, 20, 8, "terrarium", 256)) == 1
+    assets = find_assets(10, 20, 8, "terrarium", 256, buffer=16)
+    assert assets == find_assets(10, 20, 8, "terrarium", 258)
+    assert assets[4].endswith("/8/10/20.png")
+    assert assets[3].endswith("/8/9/20.png")
+    assert assets[0].endswith("/8/9/19.png")
+
+    # Columns wrap around the antimeridian
+    assert find_assets(0, 20, 8, "terrarium", 258)[3].endswith("/8/255/20.png")
+
+
+def test_find_assets_geotiff():
+    """Geotiff tiles are GeoTIFFs."""
+    assert find_assets(10, 20, 8, "geotiff", 512) == [
+        "s3://elevation-tiles-prod/geotiff/8/10/20.tif"]
+    assets = find_assets(10, 20, 8, "geotiff", 512, buffer=1)
+    assert len(assets) == 9
+    assert all(asset.endswith(".tif") for asset in assets)
+    assert assets[4] == "s3://elevation-tiles-prod/geotiff/8/10/20.tif"
+
+
+def test_find_assets_children():
+    """512px terrarium tiles are made of the children tiles."""
+    assets = find_assets(10, 20, 8, "terrarium", 512)
+    assert [asset.split("/", 4)[-1] for asset in assets] == [
+        "9/20/40.png", "9/21/40.png", "9/20/41.png", "9/21/41.png"]
+
+    assets = find_assets(10, 20, 8, "terrarium", 514)
+    assert assets == find_assets(10, 20, 8, "terrarium", 512, buffer=1)
+    assert len(assets) == 16
+    assert assets[0].endswith("/9/19/39.png")
+    assert assets[-1].endswith("/9/22/42.png")
+
+    assert find_assets(0, 0, 15, "terrarium", 512) is None
+
+
+def test_backfill_arrays_children():
+    """Children are stitched, with a border from their neighbors."""
+    tiles = [np.full((1, 4, 4), v) for v in range(16)]
+    arr = backfill_arrays([tiles[i] for i in [5, 6, 9, 10]])
+    assert arr.shape == (1, 8, 8)
+    assert (arr[0, :4, :4] == 5).all() and (arr[0, 4:, 4:] == 10).all()
+
+    arr = backfill_arrays(tiles, buffer=2)
+    assert arr.shape == (1, 12, 12)
+    np.testing.assert_array_equal(
+        arr[0, ::4, ::4], [[0, 1, 2], [4, 5, 6], [8, 9, 10]])
+    np.testing.assert_array_equal(arr[0, -1, [0, 2, 6, 10, 11]],
+                                  [12, 13, 14, 15, 15])
+
+    # Missing neighbors repeat the edge, missing children fail
+    tiles[4] = tiles[0] = None
+    arr = backfill_arrays(tiles, buffer=1)
+    np.testing.assert_array_equal(arr[0, 1:5, 0], 5)
+    assert arr[0, 0, 0] == 5
+    tiles[5] = None
+    assert backfill_arrays(tiles, buffer=1) is None
+
+
+def test_load_assets_children(tmpdir):
+    """Children are decoded once and stitched."""
+    tile_cache.clear()
+    assets = []
+    for i in range(16):
+        path = str(tmpdir.join(f"{i}.png"))
+        _write_terrarium(path, i)
+        assets.append(path)
+
+    data = load_assets(
+        0, 0, 0, assets, 34, input_format="terrarium", buffer=1)
+    assert data.shape == (34, 34)
+    # (x, y) order
+    assert data[0, 0] == 0 and data[-1, 0] == 3 and data[0, -1] == 12
+    assert (data[1:17, 1:17] == 5).all()
+    assert (data[17:33, 1:17] == 6).all()
+    assert tile_cache.stats()["entries"] == 16
+
+    children = [assets[i] for i in [5, 6, 9, 10]]
+    rgb = load_assets(
+        0, 0, 0, children, 32, input_format="terrarium",
+        output_format="terrarium")
+    assert rgb.shape == (3, 32, 32)
+
+
+def _fake_tiler(values):
+    """Tiler returning a 4x4 tile of the asset's value, masked where NaN"""
+    calls = []
+    lock = threading.Lock()
+
+    def tiler(asset, x, y, z, tilesize=4):
+        with lock:
+            calls.append(asset)
+
+        value = values[asset]
+        if value is None:
+            raise ValueError("read failed")
+
+        data = np.full((1, tilesize, tilesize), value, dtype=np.float32)
+        mask = np.where(np.isnan(data[0]), 0, 255).astype(np.uint8)
+        return np.nan_to_num(data), mask
+
+    return tiler, calls
+
+
+def test_mosaic_reader():
+    """Tiles are combined in asset order, skipping failed reads."""
+    values = {"a": None, "b": 2, "c": 4}
+    tiler, calls = _fake_tiler(values)
+
+    tile, mask = mosaic_reader(
+        list(values), 0, 0, 0, tiler, defaults.MeanMethod(), tilesize=4)
+    assert (tile == 3).all() and (mask == 255).all()
+    assert sorted(calls) == ["a", "b", "c"]
+
+    tile, _ = mosaic_reader(
+        list(values), 0, 0, 0, tiler, defaults.FirstMethod(), tilesize=4)
+    assert (tile == 2).all()
+
+    tile, mask = mosaic_reader(["a"], 0, 0, 0, tiler, defaults.FirstMethod())
+    assert tile is None and mask is None
+
+
+def test_mosaic_reader_early_exit(monkeypatch):
+    """First stops reading once the tile is filled."""
+    monkeypatch.setattr(reader, "MAX_THREADS", 2)
+    values = {"a": np.nan, "b": 1}
+    values.update({str(i): 5 for i in range(20)})
+    tiler, calls = _fake_tiler(values)
+
+    tile, mask = mosaic_reader(
+        list(values), 0, 0, 0, tiler, defaults.FirstMethod(), tilesize=4)
+    assert (tile == 1).all() and (mask == 255).all()
+    # At most MAX_THREADS reads ahead of the asset that filled the tile
+    assert len(calls) <= 4
+
+
+def test_overview_source(monkeypatch, tmpdir):
+    """Low zoom mosaic tiles are read from the overview source."""
+    monkeypatch.setattr(reader, "OVERVIEW_SOURCES", {
+        "mosaic.json": {"url": "terrarium", "maxzoom": 6},
+        "*": {"url": "s3://bucket/overview.tif", "maxzoom": 4}})
+    monkeypatch.setattr(
+        reader, "_find_mosaic_assets", lambda x, y, z, url: ["a.tif"])
+
+    assert find_assets(10, 20, 6, "mosaic.json", 256) == find_assets(
+        10, 20, 6, "terrarium", 256)
+    assert find_assets(10, 20, 7, "mosaic.json", 256) == ["a.tif"]
+    assert find_assets(1, 2, 4, "other.json", 256, buffer=1) == [
+        "s3://bucket/overview.tif"]
+    assert find_assets(10, 20, 5, "other.json", 256) == ["a.tif"]
+    assert reader.overview_source("terrarium", 3, 256) is None
+
+    # Assets are decoded as terrarium
+    tile_cache.clear()
+    path = str(tmpdir.join("0.png"))
+    _write_terrarium(path, 100)
+    data = load_assets(0, 0, 6, [path], 256, input_format="mosaic.json")
+    assert (data == 100).all()
+
+
+def test_overview_source_geotiff(monkeypatch):
+    """Geotiff tiers only serve 512px tiles, other sizes read the mosaic."""
+    monkeypatch.setattr(reader, "OVERVIEW_SOURCES", {
+        "*": {"url": "geotiff", "maxzoom": 8}})
+    monkeypatch.setattr(
+        reader, "_find_mosaic_assets", lambda x, y, z, url: ["a.tif"])
+
+    assert find_assets(1, 1, 5, "mosaic.json", 512) == [
+        "s3://elevation-tiles-prod/geotiff/5/1/1.tif"]
+    assert find_assets(1, 1, 5, "mosaic.json", 256) == ["a.tif"]
+    assert reader.overview_source("mosaic.json", 5, 512) == "geotiff"
+    assert reader.overview_source("mosaic.json", 5, 256) is None
@@ -0,0 +1,70 @@
+"""tests dem_tiler.shading."""
+
+import mercantile
+import numpy as np
+import pytest
+
+from dem_tiler.mesh import ground_pixel_size
+from dem_tiler.shading import ground_resolution, hillshade, horn_gradient, slope
+
+
+def _plane(dx, dy, size=10, resolution=10):
+    """Buffered elevation of a plane, rising dx east and dy north per meter"""
+    rows, cols = np.mgrid[0:size + 2, 0:size + 2] * resolution
+    return cols * dx - rows * dy
+
+
+def test_ground_resolution():
+    """Resolution shrinks with latitude, one value per row."""
+    res = ground_resolution(10, 20, 6, 256)
+    assert res.shape == (256, 1)
+    # Rows get closer to the equator going south
+    assert (np.diff(res[:, 0]) > 0).all()
+    assert res[127:129].mean() == pytest.approx(
+        ground_pixel_size(10, 20, 6, 256), rel=1e-3)
+
+    # At the equator, cos(lat) ~ 1
+    tile = mercantile.tile(0, 0.001, 10)
+    west, _, east, _ = mercantile.xy_bounds(tile)
+    assert ground_resolution(*tile, 256)[-1, 0] == pytest.approx(
+        (east - west) / 256, rel=1e-6)
+
+
+def test_horn_gradient():
+    """Gradients of a plane."""
+    dx, dy = horn_gradient(_plane(0.5, -0.25), 10)
+    assert dx.shape == dy.shape == (10, 10)
+    np.testing.assert_allclose(dx, 0.5)
+    np.testing.assert_allclose(dy, -0.25)
+
+    # Resolution broadcasts per row
+    dx, _ = horn_gradient(_plane(1, 0), np.full((10, 1), 5.))
+    np.testing.assert_allclose(dx, 2)
+
+
+def test_slope():
+    """Slope in degrees."""
+    np.testing.assert_allclose(slope(_plane(1, 0), 10), 45, rtol=1e-6)
+    np.testing.assert_allclose(slope(_plane(0, 0), 10), 0)
+    np.testing.assert_allclose(
+        slope(_plane(0, 1), 10, z_factor=np.sqrt(3)), 60, rtol=1e-6)
+
+
+def test_hillshade():
+    """Slopes facing the light are brighter."""
+    flat = hillshade(_plane(0, 0), 10)
+    assert flat.dtype == np.uint8
+    assert (flat == round(255 * np.sin(np.radians(45)))).all()
+
+    # Default light from the north west, facing slopes descend to it
+    facing = hillshade(_plane(0.5, -0.5), 10)
+    away = hillshade(_plane(-0.5, 0.5), 10)
+    assert (facing > flat).all() and (away < flat).all()
+    assert (hillshade(_plane(-0.5, 0.5), 10, azimuth=135) == facing).all()
+
+    # Steep slopes facing away are lit by the other lights
+    steep = _plane(-2, 2)
+    assert (hillshade(steep, 10) == 0).all()
+    assert (hillshade(steep, 10, multidirectional=True) > 0).all()
+    assert (
+        hillshade(_plane(0, 0), 10, multidirectional=True) == flat).all()